@@ -0,0 +1,76 @@
+"""
+Throughput of durable audit-log appends and of the verifier.
+
+    python benchmarks/bench_audit_log.py [--decisions 2000] [--threads 1 8 64]
+
+Each thread appends a decision-sized entry and waits until it is fsynced,
+as a session does before showing a recommendation. The commit count shows
+how many decisions shared each fsync.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.patient_data import PatientData, SymptomData
+from utils.audit_log import AuditLog, verify
+
+ENTRY = {
+    'session_id': 'bench',
+    'guideline_version': '2022.12',
+    'inputs': PatientData(symptoms=SymptomData(dysuria=True, onset="1-2 days")).to_dict(),
+    'status': 'eligible',
+    'medication': 'Nitrofurantoin macrocrystals',
+    'referral_reason': None
+}
+
+
+def measure(directory: str, threads: int, decisions: int):
+    base = os.path.join(directory, f'audit-{threads}')
+    log = AuditLog(base)
+    per_thread = decisions // threads
+
+    def decide():
+        for _ in range(per_thread):
+            log.sync(log.append(ENTRY))
+
+    workers = [threading.Thread(target=decide) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    log.close()
+
+    total = per_thread * threads
+    print(f"{threads:>3} threads  {total / elapsed:8.0f} decisions/s   {total / log.commits:6.1f} per fsync")
+    return base
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--decisions', type=int, default=2000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 64])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in args.threads:
+            base = measure(directory, threads, args.decisions)
+
+        # Verification speed over a larger log
+        log = AuditLog(base, fsync=False)
+        for _ in range(100_000):
+            log.append(ENTRY)
+        log.close()
+        started = time.perf_counter()
+        result = verify(base)
+        elapsed = time.perf_counter() - started
+        print(f"verify     {result.entries / elapsed:8.0f} entries/s   ok={result.ok}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Compare the compiled guideline evaluator with the hand-written ClinicalDecisionEngine.
+
+    python benchmarks/bench_guidelines.py [--patients 20000]
+
+Reports per-decision latency and the memory held by each rule representation
+plus the allocations made while deciding.
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.clinical_engine import ClinicalDecisionEngine
+from core.guidelines import GuidelineRegistry
+from utils.synthetic_patients import random_patient
+
+
+def measure(label, build, evaluate, patients, repeat):
+    tracemalloc.start()
+    decider = build()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    for patient in patients[:1000]:
+        evaluate(decider, patient)
+    peak = tracemalloc.get_traced_memory()[1] - retained
+    tracemalloc.stop()
+
+    best = min(timeit.repeat(lambda: [evaluate(decider, p) for p in patients], number=1, repeat=repeat))
+    print(f"{label:<12} {best / len(patients) * 1e6:8.2f} us/decision   "
+          f"{retained / 1024:8.1f} KiB rules   {peak / 1024:8.1f} KiB peak while deciding")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    now = datetime.now()
+    patients = [random_patient(rng, now) for _ in range(args.patients)]
+
+    measure('hand-written', ClinicalDecisionEngine, lambda engine, p: engine.determine_eligibility(p), patients, args.repeat)
+    measure('compiled', lambda: GuidelineRegistry.from_file().current, lambda guideline, p: guideline.evaluate(p), patients, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Compare the single-pass lexicon parsers with the substring keyword parsers they replaced.
+
+    python benchmarks/bench_lexicon.py [--messages 100000] [--from-log BASE] [--repeat 5]
+
+Reports per-field accuracy on a labelled set of patient messages, and
+throughput over a corpus of messages: the labelled set repeated, or the
+patient messages of an evaluation log.
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.input_parser import InputParser
+from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData
+
+# (message, expected values); fields left out are expected false, empty or unset
+LABELLED = [
+    ("I have burning when I pee", {'dysuria': True}),
+    ("no burning, but I need to go very often", {'frequency': True}),
+    ("It doesn't hurt but there is blood in my urine", {'hematuria': True}),
+    ("I don't have any pain or blood", {}),
+    ("It stings and I keep needing to rush to the toilet", {'dysuria': True, 'urgency': True}),
+    ("Pain in my lower belly since yesterday", {'dysuria': True, 'suprapubic_pain': True, 'onset': '1-2 days'}),
+    ("I need to pee a lot, started this morning", {'frequency': True, 'onset': 'hours'}),
+    ("burning for 3 days", {'dysuria': True, 'onset': 'days'}),
+    ("It's been going on for two weeks", {'onset': 'weeks'}),
+    ("Not sure if it burns, maybe a little", {'dysuria': True}),
+    ("I'm 34, female", {'age': 34, 'sex': 'female'}),
+    ("I am a 52 year old woman", {'age': 52, 'sex': 'female'}),
+    ("I'm a 41 year old male", {'age': 41, 'sex': 'male'}),
+    ("22F", {'age': 22, 'sex': 'female'}),
+    ("Female, 67", {'age': 67, 'sex': 'female'}),
+    ("29 female, I'm pregnant", {'age': 29, 'sex': 'female', 'pregnancy_status': True}),
+    ("I'm 30 and I'm not pregnant", {'age': 30, 'pregnancy_status': False}),
+    ("my name is Sam and I'm 45", {'age': 45}),
+    ("I'm a woman, I turned 104 this year", {'age': 104, 'sex': 'female'}),
+    ("I'm a 19 year old man", {'age': 19, 'sex': 'male'}),
+    ("No allergies", {}),
+    ("No allergies and no medications", {}),
+    ("I'm allergic to penicillin", {'allergies': ['penicillin']}),
+    ("Allergic to sulfa drugs", {'allergies': ['sulfonamides']}),
+    ("not allergic to penicillin but allergic to trimethoprim", {'allergies': ['trimethoprim']}),
+    ("I take nitrofurantoin for prevention, and I'm allergic to amoxicillin",
+     {'allergies': ['amoxicillin'], 'current_medications': ['nitrofurantoin']}),
+    ("bactrim gave me a rash", {'allergies': ['tmp/smx']}),
+    ("I'm allergic to penicillin and sulfa", {'allergies': ['penicillin', 'sulfonamides']}),
+    ("No allergies except penicillin", {'allergies': ['penicillin']}),
+    ("no allergies other than sulfa", {'allergies': ['sulfonamides']}),
+    ("Not allergic to anything apart from bactrim", {'allergies': ['tmp/smx']}),
+    ("I take nitrofurantoin and am allergic to sulfa",
+     {'allergies': ['sulfonamides'], 'current_medications': ['nitrofurantoin']}),
+]
+FIELDS = ['dysuria', 'urgency', 'frequency', 'suprapubic_pain', 'hematuria', 'onset', 'age', 'sex',
+          'pregnancy_status', 'allergies', 'current_medications']
+DEFAULTS = {'onset': '', 'age': 0, 'sex': '', 'pregnancy_status': None, 'allergies': [], 'current_medications': []}
+
+
+# The keyword parsers as they were, kept here as the baseline
+def legacy_symptoms(user_text: str) -> SymptomData:
+    symptoms = SymptomData()
+    text_lower = user_text.lower()
+
+    symptoms.dysuria = any(word in text_lower for word in ['burn', 'burning', 'pain', 'hurt', 'sting'])
+    symptoms.urgency = any(word in text_lower for word in ['urgent', 'urgency', 'rush', 'sudden'])
+    symptoms.frequency = any(word in text_lower for word in ['frequent', 'often', 'many times', 'lot'])
+    symptoms.suprapubic_pain = any(word in text_lower for word in ['lower', 'bladder', 'pelvic'])
+    symptoms.hematuria = any(word in text_lower for word in ['blood', 'red', 'pink'])
+
+    if any(word in text_lower for word in ['today', 'this morning', 'hours']):
+        symptoms.onset = "hours"
+    elif any(word in text_lower for word in ['yesterday', 'day', 'days']):
+        symptoms.onset = "1-2 days"
+    elif any(word in text_lower for word in ['week', 'weeks']):
+        symptoms.onset = "weeks"
+    return symptoms
+
+
+def legacy_demographics(user_text: str) -> DemographicData:
+    demographics = DemographicData()
+    age_match = re.search(r'\b(\d{1,2})\b', user_text)
+    if age_match:
+        demographics.age = int(age_match.group(1))
+
+    text_lower = user_text.lower()
+    if any(word in text_lower for word in ['female', 'woman', 'girl', 'f']):
+        demographics.sex = "female"
+    elif any(word in text_lower for word in ['male', 'man', 'boy', 'm']):
+        demographics.sex = "male"
+    return demographics
+
+
+def legacy_history(user_text: str) -> HistoryData:
+    history = HistoryData()
+    text_lower = user_text.lower()
+    if 'no' in text_lower and ('allerg' in text_lower or 'medication' in text_lower):
+        history.allergies = []
+    elif any(word in text_lower for word in ['penicillin', 'sulfa', 'trimethoprim']):
+        if 'penicillin' in text_lower:
+            history.allergies.append('penicillin')
+        if 'sulfa' in text_lower:
+            history.allergies.append('sulfonamides')
+    return history
+
+
+def legacy_patient_data(user_text: str) -> PatientData:
+    return PatientData(symptoms=legacy_symptoms(user_text), demographics=legacy_demographics(user_text),
+                       history=legacy_history(user_text))
+
+
+def values(patient: PatientData) -> dict:
+    records = {'symptoms': patient.symptoms, 'demographics': patient.demographics, 'history': patient.history}
+    found = {}
+    for name in FIELDS:
+        record = next(record for record in records.values() if hasattr(record, name))
+        found[name] = getattr(record, name)
+    return found
+
+
+def accuracy(extract) -> dict:
+    correct = {name: 0 for name in FIELDS}
+    for message, expected in LABELLED:
+        found = values(extract(message))
+        for name in FIELDS:
+            correct[name] += found[name] == expected.get(name, DEFAULTS.get(name, False))
+    return correct
+
+
+def throughput(extract, corpus, repeat: int) -> float:
+    best = min(timeit.repeat(lambda: [extract(message) for message in corpus], number=1, repeat=repeat))
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000, help="Corpus size when repeating the labelled set")
+    parser.add_argument('--from-log', metavar='BASE', help="Time the patient messages of an evaluation log instead")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.from_log:
+        from benchmarks.bench_replay import conversations_from_log
+        corpus = [message for conversation in conversations_from_log(args.from_log) for message in conversation]
+    else:
+        corpus = [LABELLED[i % len(LABELLED)][0] for i in range(args.messages)]
+
+    lexicon = InputParser()._extract_patient_data_basic
+    results = {'substring': legacy_patient_data, 'lexicon': lexicon}
+    scores = {label: accuracy(extract) for label, extract in results.items()}
+    print(f"{len(LABELLED)} labelled messages, fields correct:")
+    print(f"{'field':20s} " + " ".join(f"{label:>10s}" for label in results))
+    for name in FIELDS:
+        print(f"{name:20s} " + " ".join(f"{scores[label][name]:10d}" for label in results))
+    print(f"{'all fields':20s} " + " ".join(
+        f"{sum(scores[label].values()) / (len(FIELDS) * len(LABELLED)):10.1%}" for label in results))
+    exact = {label: sum(values(extract(m)) == {n: e.get(n, DEFAULTS.get(n, False)) for n in FIELDS}
+                        for m, e in LABELLED) for label, extract in results.items()}
+    print(f"{'whole message':20s} " + " ".join(f"{exact[label]:10d}" for label in results))
+
+    # The lexicon pattern is compiled at import, so this is the per-message cost alone
+    print(f"\n{len(corpus)} messages:")
+    for label, extract in results.items():
+        print(f"{label:12s} {throughput(extract, corpus, args.repeat):10,.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
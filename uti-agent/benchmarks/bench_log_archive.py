@@ -0,0 +1,94 @@
+"""
+Size and read speed of columnar log archives against the JSONL segments.
+
+    python benchmarks/bench_log_archive.py [--sessions 100000]
+
+Writes a synthetic evaluation log (four turns and one decision per session),
+compacts it, then times the analytics pass and the batch engine's input
+load over both formats.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.batch_engine import PatientTable
+from models.patient_data import PatientData
+from utils.logger import segment_path
+from utils.log_analytics import LogAnalytics
+from utils.log_archive import archive_path, compact
+
+START = 1_700_000_000.0
+
+
+def write_log(base: str, sessions: int):
+    rng = random.Random(1)
+    with open(segment_path(base, 1), 'w') as f:
+        for i in range(sessions):
+            at = START + i * 5
+            for turn in range(1, 5):
+                f.write(json.dumps({'timestamp': at + turn, 'session_type': 'conversation', 'data': {
+                    'session_id': f"s{i}", 'turn': turn, 'state': 'symptom_collection',
+                    'user_input': "I have burning when I pee and need to go a lot", 'response': 'x' * 200,
+                    'ttft_seconds': rng.random(), 'latency_seconds': rng.random() * 2,
+                    'parser': rng.choice(['llm', 'llm', 'llm_empty', 'basic'])
+                }}) + '\n')
+            f.write(json.dumps({'timestamp': at + 4, 'session_type': 'clinical_decision', 'data': {
+                'session_id': f"s{i}", 'turn': 4, 'guideline_version': '2022.12', 'status': 'eligible',
+                'medication': 'Nitrofurantoin macrocrystals', 'referral_reason': None,
+                'patient_data': {
+                    'symptoms': {'dysuria': True, 'frequency': rng.random() < 0.7},
+                    'demographics': {'age': rng.randint(16, 64), 'sex': 'female', 'pregnancy_status': False},
+                    'history': {'allergies': [], 'previous_utis': []}
+                }
+            }}) + '\n')
+    # A second, open segment so the first one counts as closed
+    open(segment_path(base, 2), 'w').close()
+
+
+def load_from_jsonl(path: str) -> PatientTable:
+    patients, decided_at = [], []
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['session_type'] == 'clinical_decision':
+                patients.append(PatientData.from_dict(record['data']['patient_data']))
+                decided_at.append(datetime.fromtimestamp(record['timestamp']))
+    return PatientTable.from_patients(patients, now=decided_at)
+
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        base = os.path.join(directory, 'sessions')
+        write_log(base, args.sessions)
+        jsonl, archive = segment_path(base, 1), archive_path(base, 1)
+
+        # Before compaction the analytics pass reads the JSONL segment
+        analytics_jsonl = timed(lambda: LogAnalytics(base).process())
+        compaction = timed(lambda: compact(base))
+        analytics_archive = timed(lambda: LogAnalytics(base).process())
+        print(f"compact    {compaction:7.2f} s         {os.path.getsize(jsonl) / 1e6:6.1f} MB -> {os.path.getsize(archive) / 1e6:5.1f} MB")
+        print(f"analytics  {analytics_jsonl:7.2f} s JSONL   {analytics_archive:7.3f} s archive")
+
+        load_jsonl = timed(lambda: load_from_jsonl(jsonl))
+        load_archive = timed(lambda: PatientTable.from_archive([archive]))
+        print(f"batch load {load_jsonl:7.2f} s JSONL   {load_archive:7.3f} s archive")
+
+
+if __name__ == "__main__":
+    main()
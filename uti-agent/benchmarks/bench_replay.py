@@ -0,0 +1,179 @@
+"""
+End-to-end latency of replayed conversations against the offline fake LLM.
+
+    python benchmarks/bench_replay.py [--sessions 200] [--concurrency 50] [--latency 0.4 1.5]
+                                      [--error-rate 0.01] [--conversations FILE | --from-log BASE]
+                                      [--no-extraction-cache] [--no-cascade]
+
+Drives multi-turn conversations through SessionManager, with the audit log,
+evaluation log and session store all enabled, while FakeGenaiClient answers
+every LLM call. It reports p50/p95/p99 per traced stage and per turn, and
+how many messages the deterministic extractor parsed without the LLM.
+The conversations come from a JSONL file of {"turns": [...]} objects, from
+the patient messages in an evaluation log (JSONL or archived segments), or,
+if neither is given, from a small built-in set. Nothing touches the network.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from core.session_manager import SessionManager
+from core.session_store import SQLiteSessionStore
+from utils.audit_log import AuditLog
+from utils.cache import ExtractionCache, LRUCache
+from utils.fake_llm import LatencyModel, fake_gemini_client
+from utils.logger import EvaluationLogger, iter_complete_lines, log_segments
+from utils.log_archive import ArchiveReader, archived_segments
+from utils.tracing import STAGES, Tracer
+
+CONVERSATIONS = [
+    ["I've had burning when I pee and I need to go a lot since yesterday",
+     "I'm 34, female", "No allergies and no medications"],
+    ["It stings when I urinate and I keep needing to rush to the toilet",
+     "It started this morning", "I am a 52 year old woman", "I'm allergic to penicillin"],
+    ["Burning and blood in my urine for 2 days", "I'm a 41 year old male", "No allergies"],
+    ["I need to pee often and it hurts, started yesterday", "29 female, I'm pregnant", "No, no allergies"],
+    ["Pain in my lower belly and burning since yesterday", "Female, 67", "Allergic to sulfa drugs"],
+]
+
+
+def load_conversations(path: str) -> List[List[str]]:
+    with open(path) as f:
+        return [json.loads(line)['turns'] for line in f if line.strip()]
+
+
+def conversations_from_log(base_path: str) -> List[List[str]]:
+    """Each session's patient messages, in turn order, from the evaluation log"""
+    sessions: Dict[str, Dict[int, str]] = defaultdict(dict)
+    archives = archived_segments(base_path)
+    for name, path in archives.items():
+        columns = ArchiveReader(path).read('turns', ['session_id', 'turn', 'user_input'])
+        for session_id, turn, user_input in zip(columns['session_id'], columns['turn'], columns['user_input']):
+            sessions[session_id][int(turn)] = user_input
+    for name, path in log_segments(base_path).items():
+        if name in archives:
+            continue
+        for _, line in iter_complete_lines(path):
+            record = json.loads(line)
+            data = record['data']
+            if record['session_type'] == 'conversation' and data.get('user_input'):
+                sessions[data['session_id']][data['turn']] = data['user_input']
+    return [[turns[turn] for turn in sorted(turns)] for turns in sessions.values() if turns]
+
+
+async def replay(manager: SessionManager, conversation: List[str], samples: Dict[str, List[float]],
+                 by_turn: Dict[int, List[float]], stream: bool):
+    session_id = manager.create_session().session_id
+    for turn, message in enumerate(conversation, 1):
+        started = time.perf_counter()
+        if stream:
+            async for _ in manager.handle_message_stream(session_id, message):
+                pass
+        else:
+            await manager.handle_message(session_id, message)
+        elapsed = time.perf_counter() - started
+        conversation_manager = manager.get_session(session_id)
+        if conversation_manager.last_ttft_seconds is not None:
+            samples['ttft'].append(conversation_manager.last_ttft_seconds)
+        samples['turn'].append(elapsed)
+        by_turn[turn].append(elapsed)
+        if conversation_manager.is_complete():
+            break
+    manager.end_session(session_id)
+
+
+async def run(manager: SessionManager, conversations: List[List[str]], sessions: int, concurrency: int, stream: bool):
+    samples: Dict[str, List[float]] = defaultdict(list)
+    by_turn: Dict[int, List[float]] = defaultdict(list)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with limit:
+            await replay(manager, conversations[i % len(conversations)], samples, by_turn, stream)
+
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    return samples, by_turn
+
+
+def percentiles_ms(values: List[float]) -> str:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+    return f"{len(values):7d} {p50:9.1f} {p95:9.1f} {p99:9.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50, help="Conversations in flight at once")
+    parser.add_argument('--latency', type=float, nargs=2, default=[0.4, 1.5], metavar=('P50', 'P99'),
+                        help="Fake LLM latency, in seconds")
+    parser.add_argument('--chunk-interval', type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument('--error-rate', type=float, default=0.01, help="Share of LLM calls that fail")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stream', action='store_true', help="Use the streaming message API")
+    parser.add_argument('--no-extraction-cache', action='store_true',
+                        help="Send every extraction to the fake LLM, even for repeated messages")
+    parser.add_argument('--no-cascade', action='store_true',
+                        help="Send every message to the LLM instead of trying the deterministic extractor first")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--conversations', metavar='FILE', help='JSONL file of {"turns": [...]} objects')
+    source.add_argument('--from-log', metavar='BASE', help="Replay the patient messages of an evaluation log")
+    args = parser.parse_args()
+
+    if args.conversations:
+        conversations = load_conversations(args.conversations)
+    elif args.from_log:
+        conversations = conversations_from_log(args.from_log)
+    else:
+        conversations = CONVERSATIONS
+
+    cache = ExtractionCache(memory=LRUCache(max_entries=0)) if args.no_extraction_cache else None
+    client = fake_gemini_client(cache=cache, latency=LatencyModel(*args.latency), chunk_interval=args.chunk_interval,
+                                error_rate=args.error_rate, seed=args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        # Every span is kept, so the percentiles below are exact rather than bucket estimates
+        tracer = Tracer(keep_spans=None)
+        manager = SessionManager(
+            max_sessions=args.sessions + 1, max_concurrency=args.concurrency, max_pending=args.concurrency,
+            llm_client=client, store=SQLiteSessionStore(os.path.join(directory, 'sessions.db')),
+            evaluation_logger=EvaluationLogger(os.path.join(directory, 'evaluation')),
+            audit_log=AuditLog(os.path.join(directory, 'audit')),
+            tracer=tracer, cascade=not args.no_cascade
+        )
+        started = time.perf_counter()
+        # Failed fake calls print the client's error message; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            samples, by_turn = asyncio.run(run(manager, conversations, args.sessions, args.concurrency, args.stream))
+        elapsed = time.perf_counter() - started
+        manager.close()
+
+    fake = client.client
+    turns = len(samples['turn'])
+    print(f"{args.sessions} conversations, {turns} turns in {elapsed:.1f}s ({turns / elapsed:.0f} turns/s); "
+          f"{fake.calls} LLM calls, {fake.errors} failed")
+    extraction_calls = sum(usage.calls for (_, purpose, _), usage in client.ledger.by_prompt.items()
+                           if purpose.startswith('extract:'))
+    routes = Counter(span['backend'] for span in tracer.spans if span['stage'] == 'parse')
+    print(f"{extraction_calls} extraction calls; messages parsed by " +
+          ", ".join(f"{backend}: {count}" for backend, count in routes.most_common()))
+    print(f"{'stage':12s} {'count':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for span in tracer.spans:
+        samples[span['stage']].append(span['seconds'])
+    for stage in [*STAGES, 'ttft', 'turn']:
+        if samples.get(stage):
+            print(f"{stage:12s} {percentiles_ms(samples[stage])}")
+    for turn in sorted(by_turn):
+        print(f"{'turn ' + str(turn):12s} {percentiles_ms(by_turn[turn])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Indexing throughput and queue latency of the clinical review index.
+
+    python benchmarks/bench_review_queue.py [--decisions 200000] [--per-day 10000]
+
+Writes a synthetic evaluation log with one decision and one turn record per
+session, indexes it, then builds 5% review queues over trailing windows.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logger import segment_path
+from utils.review_queue import ReviewIndex
+
+REASONS = [
+    None,
+    "Requires clinical evaluation due to: male_patient",
+    "Requires clinical evaluation due to: systemic_symptoms, pregnancy",
+    "Recurrent UTIs (2+ in 6 months) require clinical evaluation",
+    "Symptoms do not meet UTI criteria"
+]
+START = 1_700_000_000.0
+
+
+def write_log(base: str, decisions: int, per_day: int):
+    rng = random.Random(1)
+    spacing = 86400 / per_day
+    with open(segment_path(base, 1), 'w') as f:
+        for i in range(decisions):
+            reason = rng.choice(REASONS)
+            at = START + i * spacing
+            decision = {
+                'session_id': f"s{i}", 'turn': 4, 'guideline_version': '2022.12',
+                'status': 'requires_referral' if reason else 'eligible',
+                'medication': None if reason else rng.choice(['Nitrofurantoin macrocrystals', 'Fosfomycin trometamol']),
+                'referral_reason': reason,
+                'patient_data': {
+                    'symptoms': {'dysuria': True, 'fever': rng.random() < 0.05},
+                    'demographics': {'age': rng.randint(5, 90), 'sex': 'female', 'pregnancy_status': None},
+                    'history': {'allergies': [], 'previous_utis': [], 'immunocompromised': rng.random() < 0.03}
+                }
+            }
+            f.write(json.dumps({'timestamp': at, 'session_type': 'conversation', 'data': {'turn': 1, 'response': 'x' * 300}}) + '\n')
+            f.write(json.dumps({'timestamp': at, 'session_type': 'clinical_decision', 'data': decision}) + '\n')
+    return START + decisions * spacing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--decisions', type=int, default=200_000)
+    parser.add_argument('--per-day', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        base = os.path.join(directory, 'sessions')
+        until = write_log(base, args.decisions, args.per_day)
+        index = ReviewIndex(os.path.join(directory, 'review.db'), base)
+
+        started = time.perf_counter()
+        indexed = index.refresh()
+        elapsed = time.perf_counter() - started
+        print(f"index      {indexed / elapsed:8.0f} decisions/s   ({args.decisions / args.per_day:.0f} days of log)")
+
+        for days in (1, 7, 30):
+            started = time.perf_counter()
+            queue = index.review_queue(0.05, since=until - days * 86400, until=until)
+            elapsed = time.perf_counter() - started
+            print(f"{days:>3} days   {len(queue):8d} cases       {elapsed * 1000:6.1f} ms")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
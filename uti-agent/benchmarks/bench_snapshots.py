@@ -0,0 +1,69 @@
+"""
+Memory and time per turn for keeping patient data in the conversation history.
+
+    python benchmarks/bench_snapshots.py [--turns 12] [--sessions 2000]
+
+Compares deep-copying PatientData on every turn with structurally shared
+PatientSnapshot objects, over a consultation where each turn changes one
+sub-record.
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.patient_data import PatientData, UTIHistory
+
+
+def apply_turn(patient: PatientData, turn: int):
+    # Mostly one sub-record changes per turn, as in a real consultation
+    if turn == 0:
+        patient.symptoms.dysuria = True
+        patient.symptoms.onset = "1-2 days"
+    elif turn == 1:
+        patient.demographics.age, patient.demographics.sex = 29, 'female'
+    elif turn == 2:
+        patient.history.allergies.append('sulfonamides')
+        patient.history.allergies_collected = True
+    elif turn % 3 == 0:
+        patient.history.previous_utis.append(
+            UTIHistory(date=datetime(2024, 1, 1) + timedelta(days=turn), treatment='nitrofurantoin', resolved=True)
+        )
+    # Other turns (clarifications, small talk) change nothing
+
+
+def measure(label, record, turns, sessions):
+    tracemalloc.start()
+    started = time.perf_counter()
+    histories = []
+    for _ in range(sessions):
+        patient, history, previous = PatientData(), [], None
+        for turn in range(turns):
+            apply_turn(patient, turn)
+            previous = record(patient, previous)
+            history.append(previous)
+        histories.append(history)
+    elapsed = time.perf_counter() - started
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    per_turn = sessions * turns
+    print(f"{label:<10} {retained / per_turn:8.0f} B/turn   {elapsed / per_turn * 1e6:6.1f} us/turn")
+    return histories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--turns', type=int, default=12)
+    parser.add_argument('--sessions', type=int, default=2000)
+    args = parser.parse_args()
+
+    measure('deepcopy', lambda patient, previous: copy.deepcopy(patient), args.turns, args.sessions)
+    measure('snapshot', lambda patient, previous: patient.snapshot(previous), args.turns, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
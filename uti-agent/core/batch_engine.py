@@ -0,0 +1,314 @@
+"""
+Vectorized OCP eligibility evaluation over columnar patient tables.
+
+Re-running every historical case after a guideline change means evaluating
+millions of records; determine_eligibility_batch applies the same rules as
+ClinicalDecisionEngine.determine_eligibility as boolean masks over NumPy
+columns and returns integer codes per row, which decode back to the exact
+EligibilityResult the scalar engine produces. Given a CompiledGuideline, the
+symptom, complication and recurrence masks are built from its rules; a
+guideline whose outcomes the codes cannot represent is rejected.
+"""
+from dataclasses import asdict, dataclass, fields, replace
+from datetime import datetime, timedelta
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from models.patient_data import PatientData, SymptomData, HistoryData
+from models.treatment_plan import EligibilityResult, EligibilityStatus, TreatmentPlan, TreatmentType
+from core.clinical_engine import (
+    COMPLICATION_FACTORS, RECURRENCE_REASONS, SYMPTOM_CRITERIA_REASON, complication_reason,
+    NITROFURANTOIN_PLAN, TMP_SMX_PLAN, FOSFOMYCIN_PLAN
+)
+from core.guidelines import CompiledGuideline, GuidelineError, FEATURE_BITS
+
+SEX_OTHER, SEX_FEMALE, SEX_MALE = 0, 1, 2
+
+STATUS_ELIGIBLE, STATUS_REFERRAL, STATUS_INCOMPLETE = 0, 1, 2
+STATUS_CODES = [EligibilityStatus.ELIGIBLE, EligibilityStatus.REQUIRES_REFERRAL, EligibilityStatus.INCOMPLETE_DATA]
+# Code for a logged value that none of the codes describe, e.g. text from a different guideline version
+CODE_UNKNOWN = -1
+
+REFERRAL_NONE = 0
+REFERRAL_SYMPTOMS = 1
+REFERRAL_COMPLICATIONS = 2
+REFERRAL_RELAPSE = 3
+REFERRAL_RECURRENT_6_MONTHS = 4
+REFERRAL_RECURRENT_12_MONTHS = 5
+
+TREATMENT_NONE = 0
+TREATMENT_CODES = {
+    1: (TreatmentType.NITROFURANTOIN, NITROFURANTOIN_PLAN),
+    2: (TreatmentType.TRIMETHOPRIM_SULFAMETHOXAZOLE, TMP_SMX_PLAN),
+    3: (TreatmentType.FOSFOMYCIN_3G, FOSFOMYCIN_PLAN),
+}
+
+SYMPTOM_COLUMNS = ['dysuria', 'urgency', 'frequency', 'suprapubic_pain', 'hematuria',
+                   'fever', 'rigors', 'flank_pain', 'back_pain', 'nausea', 'vomiting']
+HISTORY_COLUMNS = ['immunocompromised', 'abnormal_urinary_function', 'indwelling_catheter',
+                   'neurogenic_bladder', 'renal_stones', 'renal_dysfunction']
+
+TMP_SMX_ALLERGIES = {'sulfonamides', 'trimethoprim', 'sulfamethoxazole', 'tmp/smx'}
+# Allergies contraindicating each treatment code, as the allergy columns record them
+TREATMENT_ALLERGIES = {1: {'nitrofurantoin'}, 2: TMP_SMX_ALLERGIES, 3: {'fosfomycin'}}
+# Recurrence windows the relapse and UTI count columns are evaluated over, in referral order
+RECURRENCE_WINDOWS = [(28, "relapse"), (180, "recurrent_6_months"), (365, "recurrent_12_months")]
+
+
+@dataclass
+class PatientTable:
+    """Column-per-field patient records; every array has one entry per patient"""
+    dysuria: np.ndarray
+    urgency: np.ndarray
+    frequency: np.ndarray
+    suprapubic_pain: np.ndarray
+    hematuria: np.ndarray
+    fever: np.ndarray
+    rigors: np.ndarray
+    flank_pain: np.ndarray
+    back_pain: np.ndarray
+    nausea: np.ndarray
+    vomiting: np.ndarray
+    age: np.ndarray
+    sex: np.ndarray
+    pregnant: np.ndarray
+    immunocompromised: np.ndarray
+    abnormal_urinary_function: np.ndarray
+    indwelling_catheter: np.ndarray
+    neurogenic_bladder: np.ndarray
+    renal_stones: np.ndarray
+    renal_dysfunction: np.ndarray
+    allergy_nitrofurantoin: np.ndarray
+    allergy_tmp_smx: np.ndarray
+    allergy_fosfomycin: np.ndarray
+    # Recurrence inputs are evaluated against a reference time when the table is built
+    relapse: np.ndarray
+    utis_6_months: np.ndarray
+    utis_12_months: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.age)
+
+    @classmethod
+    def column_names(cls) -> List[str]:
+        return [f.name for f in fields(cls)]
+
+    @classmethod
+    def from_patients(cls, patients: Iterable[PatientData],
+                      now: Union[datetime, Sequence[datetime], None] = None) -> 'PatientTable':
+        """Build columns from PatientData; `now` may also give each patient its own reference time"""
+        reference_times = None if now is None or isinstance(now, datetime) else iter(now)
+        now = now if isinstance(now, datetime) else datetime.now()
+        relapse_cutoff = now - timedelta(weeks=4)
+        cutoff_6m = now - timedelta(days=180)
+        cutoff_12m = now - timedelta(days=365)
+        columns = {name: [] for name in cls.column_names() if name not in SYMPTOM_COLUMNS + HISTORY_COLUMNS}
+        symptom_flags, history_flags = [], []
+
+        for patient in patients:
+            symptoms, demographics, history = patient.symptoms, patient.demographics, patient.history
+            # Findings are packed flags; they are unpacked into columns once, below
+            symptom_flags.append(symptoms.flags)
+            history_flags.append(history.flags)
+
+            sex = demographics.sex.lower()
+            columns['sex'].append(SEX_FEMALE if sex == 'female' else SEX_MALE if sex == 'male' else SEX_OTHER)
+            columns['age'].append(demographics.age)
+            columns['pregnant'].append(bool(demographics.pregnancy_status))
+
+            allergies = {allergy.lower() for allergy in history.allergies}
+            columns['allergy_nitrofurantoin'].append('nitrofurantoin' in allergies)
+            columns['allergy_tmp_smx'].append(bool(allergies & TMP_SMX_ALLERGIES))
+            columns['allergy_fosfomycin'].append('fosfomycin' in allergies)
+
+            if reference_times is not None:
+                reference = next(reference_times)
+                relapse_cutoff = reference - timedelta(weeks=4)
+                cutoff_6m = reference - timedelta(days=180)
+                cutoff_12m = reference - timedelta(days=365)
+            latest_completion = history.latest_treatment_completion()
+            columns['relapse'].append(bool(latest_completion and latest_completion >= relapse_cutoff))
+            columns['utis_6_months'].append(history.utis_since(cutoff_6m))
+            columns['utis_12_months'].append(history.utis_since(cutoff_12m))
+
+        dtypes = {'age': np.int16, 'sex': np.int8, 'utis_6_months': np.int16, 'utis_12_months': np.int16}
+        arrays = {name: np.asarray(values, dtype=dtypes.get(name, np.bool_)) for name, values in columns.items()}
+        for record, names, flags in [(SymptomData, SYMPTOM_COLUMNS, symptom_flags), (HistoryData, HISTORY_COLUMNS, history_flags)]:
+            packed = np.asarray(flags, dtype=np.uint32)
+            for name in names:
+                arrays[name] = (packed & record.FLAG_BITS[name]) != 0
+        return cls(**arrays)
+
+    @classmethod
+    def from_archive(cls, paths: Union[str, Iterable[str]], where: Sequence[Tuple[str, str, Any]] = ()) -> 'PatientTable':
+        """Read the decisions archived by utils.log_archive; `where` filters as in ArchiveReader.read"""
+        from utils.log_archive import ArchiveReader
+        names = cls.column_names()
+        parts = [ArchiveReader(path).read('decisions', names, where) for path in ([paths] if isinstance(paths, str) else paths)]
+        return cls(**{name: np.concatenate([part[name] for part in parts]) for name in names})
+
+
+def encode_decision(status: Optional[str], referral_reason: Optional[str], medication: Optional[str]) -> Tuple[int, int, int, int]:
+    """(status, referral, complication mask, treatment) codes for a logged decision; inverse of to_eligibility_result"""
+    status_code = next((code for code, value in enumerate(STATUS_CODES) if value.value == status), CODE_UNKNOWN)
+    complication_mask = 0
+    if referral_reason is None:
+        referral_code = REFERRAL_NONE
+    elif referral_reason == SYMPTOM_CRITERIA_REASON:
+        referral_code = REFERRAL_SYMPTOMS
+    else:
+        factors = referral_reason.partition(': ')[2].split(', ')
+        if all(factor in COMPLICATION_FACTORS for factor in factors) and referral_reason == complication_reason(factors):
+            referral_code = REFERRAL_COMPLICATIONS
+            for factor in factors:
+                complication_mask |= 1 << COMPLICATION_FACTORS.index(factor)
+        else:
+            referral_code = _RECURRENCE_CODES.get(referral_reason, CODE_UNKNOWN)
+    treatment_code = TREATMENT_NONE if medication is None else _TREATMENT_BY_MEDICATION.get(medication, CODE_UNKNOWN)
+    return status_code, referral_code, complication_mask, treatment_code
+
+
+_RECURRENCE_CODES = {
+    RECURRENCE_REASONS["relapse"]: REFERRAL_RELAPSE,
+    RECURRENCE_REASONS["recurrent_6_months"]: REFERRAL_RECURRENT_6_MONTHS,
+    RECURRENCE_REASONS["recurrent_12_months"]: REFERRAL_RECURRENT_12_MONTHS,
+}
+_TREATMENT_BY_MEDICATION = {plan.medication: code for code, (_, plan) in TREATMENT_CODES.items()}
+
+
+@dataclass
+class BatchEligibilityResult:
+    status: np.ndarray
+    referral_code: np.ndarray
+    # Bit i set means COMPLICATION_FACTORS[i] applies; only meaningful for REFERRAL_COMPLICATIONS
+    complication_mask: np.ndarray
+    treatment_code: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.status)
+
+    def referral_reason(self, row: int) -> Optional[str]:
+        code = self.referral_code[row]
+        if code == REFERRAL_SYMPTOMS:
+            return SYMPTOM_CRITERIA_REASON
+        if code == REFERRAL_COMPLICATIONS:
+            mask = int(self.complication_mask[row])
+            return complication_reason([name for i, name in enumerate(COMPLICATION_FACTORS) if mask & (1 << i)])
+        if code == REFERRAL_RELAPSE:
+            return RECURRENCE_REASONS["relapse"]
+        if code == REFERRAL_RECURRENT_6_MONTHS:
+            return RECURRENCE_REASONS["recurrent_6_months"]
+        if code == REFERRAL_RECURRENT_12_MONTHS:
+            return RECURRENCE_REASONS["recurrent_12_months"]
+        return None
+
+    def treatment_plan(self, row: int) -> Optional[TreatmentPlan]:
+        entry = TREATMENT_CODES.get(int(self.treatment_code[row]))
+        return replace(entry[1]) if entry else None
+
+    def to_eligibility_result(self, row: int) -> EligibilityResult:
+        """Decode one row into the EligibilityResult the scalar engine would return"""
+        return EligibilityResult(
+            status=STATUS_CODES[self.status[row]],
+            treatment_plan=self.treatment_plan(row),
+            referral_reason=self.referral_reason(row)
+        )
+
+
+def _check_encodable(guideline: CompiledGuideline):
+    """Raise GuidelineError unless every outcome of `guideline` has a code and the table holds its inputs"""
+    def reject(what: str):
+        raise GuidelineError(f"Guideline {guideline.name} {guideline.version} cannot be evaluated in batch: {what}")
+
+    if guideline._symptom_reason != SYMPTOM_CRITERIA_REASON:
+        reject("symptom referral reason differs")
+    builtin_reasons = tuple(
+        complication_reason([name for bit, name in enumerate(COMPLICATION_FACTORS) if mask & (1 << bit)])
+        for mask in range(1 << len(COMPLICATION_FACTORS))
+    )
+    if guideline._complication_reasons != builtin_reasons:
+        reject("complicating factors differ from COMPLICATION_FACTORS")
+    recurrence = [(days, min_count is None, reason) for days, min_count, reason in guideline._recurrence]
+    if recurrence != [(days, name == "relapse", RECURRENCE_REASONS[name]) for days, name in RECURRENCE_WINDOWS]:
+        reject("recurrence windows or reasons differ")
+    allergens = {bit: allergen for allergen, bit in guideline._allergy_bits.items()}
+    ladder = [({allergen for bit, allergen in allergens.items() if mask & bit}, plan) for mask, plan in guideline._ladder]
+    if ladder != [(TREATMENT_ALLERGIES[code], asdict(plan)) for code, (_, plan) in TREATMENT_CODES.items()]:
+        reject("treatment ladder differs")
+
+
+def _feature_count(features: dict, mask: int, rows: int) -> np.ndarray:
+    """Per row, how many of the features in `mask` are present"""
+    count = np.zeros(rows, dtype=np.int8)
+    for name, bit in FEATURE_BITS.items():
+        if mask & bit:
+            count += features[name]
+    return count
+
+
+def _guideline_masks(table: PatientTable, guideline: CompiledGuideline):
+    """(symptoms met, complication bits, recurrence minimum counts) from the compiled rules"""
+    _check_encodable(guideline)
+    rows = len(table)
+    features = {name: getattr(table, name) for name in SYMPTOM_COLUMNS + HISTORY_COLUMNS}
+    features.update(sex_male=table.sex == SEX_MALE, sex_female=table.sex == SEX_FEMALE, pregnant=table.pregnant)
+
+    symptoms_met = ((_feature_count(features, guideline._sufficient, rows) > 0) |
+                    (_feature_count(features, guideline._qualifying, rows) >= guideline._min_qualifying))
+    complication_bits = []
+    for _, kind, operand in guideline._complication_rules:
+        if kind == 'age_below':
+            complication_bits.append(table.age < operand)
+        else:
+            count = _feature_count(features, operand, rows)
+            complication_bits.append(count > 0 if kind == 'any' else count == operand.bit_count())
+    min_counts = [min_count for _, min_count, _ in guideline._recurrence[1:]]
+    return symptoms_met, complication_bits, min_counts
+
+
+def determine_eligibility_batch(table: PatientTable, guideline: Optional[CompiledGuideline] = None) -> BatchEligibilityResult:
+    """Evaluate the OCP rules for every row at once; mirrors ClinicalDecisionEngine.determine_eligibility.
+
+    Without `guideline` the built-in rules apply, as in an engine without a registry.
+    """
+    if guideline is not None:
+        symptoms_met, complication_bits, (min_6_months, min_12_months) = _guideline_masks(table, guideline)
+    else:
+        # Acute dysuria OR 2 or more of urgency/frequency, suprapubic pain, hematuria
+        qualifying = (table.urgency.astype(np.int8) + table.frequency + table.suprapubic_pain + table.hematuria)
+        symptoms_met = table.dysuria | (qualifying >= 2)
+
+        complication_bits = [
+            table.fever | table.rigors | table.flank_pain | table.back_pain | table.nausea | table.vomiting,
+            table.sex == SEX_MALE,
+            (table.sex == SEX_FEMALE) & table.pregnant,
+            table.age < 12,
+            table.immunocompromised,
+            table.abnormal_urinary_function | table.indwelling_catheter | table.neurogenic_bladder |
+            table.renal_stones | table.renal_dysfunction,
+        ]
+        min_6_months, min_12_months = 2, 3
+    complication_mask = np.zeros(len(table), dtype=np.int8)
+    for bit, present in enumerate(complication_bits):
+        complication_mask |= present.astype(np.int8) << bit
+
+    # np.select picks the first matching condition, matching the scalar early returns
+    referral_code = np.select(
+        [~symptoms_met, complication_mask != 0, table.relapse,
+         table.utis_6_months >= min_6_months, table.utis_12_months >= min_12_months],
+        [REFERRAL_SYMPTOMS, REFERRAL_COMPLICATIONS, REFERRAL_RELAPSE, REFERRAL_RECURRENT_6_MONTHS, REFERRAL_RECURRENT_12_MONTHS],
+        default=REFERRAL_NONE
+    ).astype(np.int8)
+    eligible = referral_code == REFERRAL_NONE
+
+    treatment_code = np.select(
+        [~table.allergy_nitrofurantoin, ~table.allergy_tmp_smx, ~table.allergy_fosfomycin],
+        [1, 2, 3],
+        default=TREATMENT_NONE
+    ).astype(np.int8)
+
+    return BatchEligibilityResult(
+        status=np.where(eligible, STATUS_ELIGIBLE, STATUS_REFERRAL).astype(np.int8),
+        referral_code=referral_code,
+        complication_mask=np.where(referral_code == REFERRAL_COMPLICATIONS, complication_mask, 0).astype(np.int8),
+        treatment_code=np.where(eligible, treatment_code, TREATMENT_NONE).astype(np.int8)
+    )
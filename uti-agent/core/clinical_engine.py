@@ -1,9 +1,74 @@
-from typing import List
+from dataclasses import replace
+from datetime import datetime, timedelta
+from itertools import combinations
+from typing import Callable, List, Optional
 from models.patient_data import PatientData
 from models.treatment_plan import EligibilityResult, EligibilityStatus, TreatmentPlan
 
 
+SYMPTOM_CRITERIA_REASON = "Symptoms do not meet UTI criteria"
+
+# Order in which check_complicating_factors reports complications
+COMPLICATION_FACTORS = [
+    'systemic_symptoms',
+    'male_patient',
+    'pregnancy',
+    'pediatric',
+    'immunocompromised',
+    'abnormal_urinary_tract'
+]
+
+RECURRENCE_REASONS = {
+    "relapse": "Relapse within 4 weeks of treatment requires clinical evaluation",
+    "recurrent_6_months": "Recurrent UTIs (2+ in 6 months) require clinical evaluation", 
+    "recurrent_12_months": "Recurrent UTIs (3+ in 12 months) require clinical evaluation"
+}
+
+NITROFURANTOIN_PLAN = TreatmentPlan(
+    medication="Nitrofurantoin macrocrystals",
+    dosage="100 mg PO BID",
+    duration="5 days",
+    instructions="Take with food to reduce stomach upset",
+    side_effects="Nausea, headache, brown urine (harmless)",
+    follow_up="If symptoms persist after 3 days, contact healthcare provider"
+)
+
+TMP_SMX_PLAN = TreatmentPlan(
+    medication="Trimethoprim/sulfamethoxazole (TMP/SMX)",
+    dosage="160 mg/800 mg PO BID",
+    duration="3 days",
+    instructions="Take with plenty of water",
+    side_effects="Nausea, skin rash, headache",
+    follow_up="If symptoms persist after 3 days, contact healthcare provider"
+)
+
+FOSFOMYCIN_PLAN = TreatmentPlan(
+    medication="Fosfomycin trometamol",
+    dosage="3 g PO",
+    duration="Single dose",
+    instructions="Mix with water and take on empty stomach, preferably at bedtime",
+    side_effects="Nausea, diarrhea, headache",
+    follow_up="If symptoms persist after 3 days, contact healthcare provider"
+)
+
+
+def complication_reason(complications: List[str]) -> str:
+    return f"Requires clinical evaluation due to: {', '.join(complications)}"
+
+
 class ClinicalDecisionEngine:
+    def __init__(self, guidelines=None, clock: Callable[[], datetime] = datetime.now, audit_log=None):
+        # A core.guidelines.GuidelineRegistry; without one the hand-written rules below apply
+        self.guidelines = guidelines
+        # Reference time for recurrence windows; fix it to make batch and replay runs reproducible
+        self.clock = clock
+        # A utils.audit_log.AuditLog that receives every decision with its inputs
+        self.audit_log = audit_log
+    
+    @property
+    def guideline_version(self) -> str:
+        return self.guidelines.version if self.guidelines is not None else "builtin"
+    
     def assess_symptom_criteria(self, symptoms) -> bool:
         # OCP Algorithm: Acute dysuria OR 2 or more of the following:
         # new urinary urgency or frequency, suprapubic pain/discomfort, hematuria
@@ -64,70 +129,76 @@ class ClinicalDecisionEngine:
         
         return complications
     
-    def check_recurrence_relapse(self, history) -> tuple[bool, str]:
+    def check_recurrence_relapse(self, history, now: Optional[datetime] = None) -> tuple[bool, str]:
         """
         OCP Algorithm defines:
         - Relapse: return of symptoms within 4 weeks of completing antibiotic treatment
         - Recurrent: 2 or more UTIs in 6 months OR 3 or more UTIs in 12 months
         """
-        from datetime import datetime, timedelta
-        
-        now = datetime.now()
+        now = now or self.clock()
         
         # Check for relapse (within 4 weeks of treatment completion)
-        for uti in history.previous_utis:
-            if uti.treatment_completion_date:
-                time_since_completion = now - uti.treatment_completion_date
-                if time_since_completion <= timedelta(weeks=4):
-                    return True, "relapse"
-        
-        # Check for recurrence patterns
-        # Count UTIs in last 6 months
-        six_months_ago = now - timedelta(days=180)
-        recent_utis_6m = [uti for uti in history.previous_utis 
-                         if uti.date >= six_months_ago]
-        
-        if len(recent_utis_6m) >= 2:
-            return True, "recurrent_6_months"
+        latest_completion = history.latest_treatment_completion()
+        if latest_completion and now - latest_completion <= timedelta(weeks=4):
+            return True, "relapse"
         
-        # Count UTIs in last 12 months  
-        twelve_months_ago = now - timedelta(days=365)
-        recent_utis_12m = [uti for uti in history.previous_utis 
-                          if uti.date >= twelve_months_ago]
+        # Check for recurrence patterns, counted from the date-sorted history index
+        if history.utis_since(now - timedelta(days=180)) >= 2:
+            return True, "recurrent_6_months"
         
-        if len(recent_utis_12m) >= 3:
+        if history.utis_since(now - timedelta(days=365)) >= 3:
             return True, "recurrent_12_months"
         
         return False, ""
     
-    def determine_eligibility(self, patient_data: PatientData) -> EligibilityResult:
+    def determine_eligibility(self, patient_data: PatientData, now: Optional[datetime] = None,
+                              audit: bool = True) -> EligibilityResult:
+        """Decide eligibility as of `now` (defaults to the engine clock).
+
+        Pass audit=False for provisional decisions that never reach the patient.
+        """
+        now = now or self.clock()
+        if self.guidelines is not None:
+            guideline = self.guidelines.current
+            result, version = guideline.evaluate(patient_data, now), guideline.version
+        else:
+            result, version = self._builtin_eligibility(patient_data, now), "builtin"
+        
+        if audit and self.audit_log is not None:
+            plan = result.treatment_plan
+            self.audit_log.append({
+                'session_id': patient_data.session_id,
+                'decided_at': now.isoformat(),
+                'guideline_version': version,
+                'inputs': patient_data.to_dict(),
+                'status': result.status.value,
+                'medication': plan.medication if plan else None,
+                'referral_reason': result.referral_reason
+            })
+        return result
+    
+    def _builtin_eligibility(self, patient_data: PatientData, now: datetime) -> EligibilityResult:
         # Check basic symptom criteria
         if not self.assess_symptom_criteria(patient_data.symptoms):
             return EligibilityResult(
                 status=EligibilityStatus.REQUIRES_REFERRAL,
-                referral_reason="Symptoms do not meet UTI criteria"
+                referral_reason=SYMPTOM_CRITERIA_REASON
             )
         
         # Check for complications
         complications = self.check_complicating_factors(patient_data)
         if complications:
-            reason = f"Requires clinical evaluation due to: {', '.join(complications)}"
             return EligibilityResult(
                 status=EligibilityStatus.REQUIRES_REFERRAL,
-                referral_reason=reason
+                referral_reason=complication_reason(complications)
             )
         
         # Check for relapse or recurrence
-        has_recurrence, recurrence_type = self.check_recurrence_relapse(patient_data.history)
+        has_recurrence, recurrence_type = self.check_recurrence_relapse(patient_data.history, now)
         if has_recurrence:
-            reason_map = {
-                "relapse": "Relapse within 4 weeks of treatment requires clinical evaluation",
-                "recurrent_6_months": "Recurrent UTIs (2+ in 6 months) require clinical evaluation", 
-                "recurrent_12_months": "Recurrent UTIs (3+ in 12 months) require clinical evaluation"
-            }
             return EligibilityResult(
                 status=EligibilityStatus.REQUIRES_REFERRAL,
-                referral_reason=reason_map.get(recurrence_type, "Recurrent UTIs require clinical evaluation")
+                referral_reason=RECURRENCE_REASONS.get(recurrence_type, "Recurrent UTIs require clinical evaluation")
             )
         
         # If eligible, select treatment
@@ -137,6 +208,11 @@ class ClinicalDecisionEngine:
             treatment_plan=treatment
         )
     
+    def determine_eligibility_batch(self, table):
+        """Vectorized determine_eligibility over a core.batch_engine.PatientTable"""
+        from core.batch_engine import determine_eligibility_batch
+        return determine_eligibility_batch(table, self.guidelines.current if self.guidelines is not None else None)
+    
     def select_treatment(self, patient_data: PatientData) -> TreatmentPlan:
         """
         OCP Algorithm prescribing recommendations:
@@ -149,41 +225,40 @@ class ClinicalDecisionEngine:
         
         # First-line: Nitrofurantoin macrocrystals
         if 'nitrofurantoin' not in allergies:
-            return TreatmentPlan(
-                medication="Nitrofurantoin macrocrystals",
-                dosage="100 mg PO BID",
-                duration="5 days",
-                instructions="Take with food to reduce stomach upset",
-                side_effects="Nausea, headache, brown urine (harmless)",
-                follow_up="If symptoms persist after 3 days, contact healthcare provider"
-            )
+            return replace(NITROFURANTOIN_PLAN)
         
         # Second-line: Trimethoprim/sulfamethoxazole
         elif ('sulfonamides' not in allergies and 'trimethoprim' not in allergies and 
               'sulfamethoxazole' not in allergies and 'tmp/smx' not in allergies):
-            return TreatmentPlan(
-                medication="Trimethoprim/sulfamethoxazole (TMP/SMX)",
-                dosage="160 mg/800 mg PO BID",
-                duration="3 days",
-                instructions="Take with plenty of water",
-                side_effects="Nausea, skin rash, headache",
-                follow_up="If symptoms persist after 3 days, contact healthcare provider"
-            )
+            return replace(TMP_SMX_PLAN)
         
         # Third-line: Fosfomycin 3g single dose
         elif 'fosfomycin' not in allergies:
-            return TreatmentPlan(
-                medication="Fosfomycin trometamol",
-                dosage="3 g PO",
-                duration="Single dose",
-                instructions="Mix with water and take on empty stomach, preferably at bedtime",
-                side_effects="Nausea, diarrhea, headache",
-                follow_up="If symptoms persist after 3 days, contact healthcare provider"
-            )
+            return replace(FOSFOMYCIN_PLAN)
         
         # If multiple allergies contraindicate all options, refer for clinical evaluation
         else:
             return None
     
+    def possible_treatment_plans(self) -> List[TreatmentPlan]:
+        """Every plan select_treatment can return"""
+        if self.guidelines is not None:
+            return self.guidelines.current.possible_treatment_plans()
+        return [replace(NITROFURANTOIN_PLAN), replace(TMP_SMX_PLAN), replace(FOSFOMYCIN_PLAN)]
+    
+    def possible_referral_reasons(self) -> List[str]:
+        """Every referral_reason determine_eligibility can return"""
+        if self.guidelines is not None:
+            return self.guidelines.current.possible_referral_reasons()
+        reasons = [SYMPTOM_CRITERIA_REASON]
+        for size in range(1, len(COMPLICATION_FACTORS) + 1):
+            for complications in combinations(COMPLICATION_FACTORS, size):
+                # Pregnancy is only checked for female patients
+                if 'male_patient' in complications and 'pregnancy' in complications:
+                    continue
+                reasons.append(complication_reason(list(complications)))
+        reasons.extend(RECURRENCE_REASONS.values())
+        return reasons
+    
     def generate_referral_reason(self, complications: List[str]) -> str:
         return f"Clinical evaluation recommended due to: {', '.join(complications)}"
\ No newline at end of file
@@ -1,16 +1,26 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterator, AsyncIterator
+import asyncio
+import contextvars
 import os
+import time
 from enum import Enum
-from rich.console import Console
-from rich.panel import Panel
-from rich.markdown import Markdown
-from rich.text import Text
-from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData
+from models.patient_data import PatientData, PatientSnapshot, SymptomData, DemographicData, HistoryData
 from models.treatment_plan import EligibilityResult
 from core.input_parser import InputParser
+from core.extraction_schema import SYMPTOM_FIELDS, DEMOGRAPHIC_FIELDS, HISTORY_FIELDS
+from core.rule_extractor import RuleExtractor
 from core.clinical_engine import ClinicalDecisionEngine
+from core.guidelines import default_registry
 from core.response_gen import ResponseGenerator
+from core.explanation_library import ExplanationLibrary
+from core.renderer import ConsoleRenderer
+from core.session_store import SessionStore, SessionRecord
 from utils.llm_client import GeminiClient
+from utils.logger import EvaluationLogger
+from utils.audit_log import AuditLogError
+from utils.tracing import NULL_SPAN, NULL_TRACER, Tracer
+from utils.token_ledger import set_call_context
+from utils.async_runner import run_sync, iterate_sync
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,63 +34,175 @@ class ConversationState(Enum):
     COMPLETE = "complete"
 
 
+# The fields the agent's last question asked about, by the state it was asked in
+EXPECTED_FIELDS = {
+    ConversationState.GREETING: SYMPTOM_FIELDS,
+    ConversationState.SYMPTOM_COLLECTION: SYMPTOM_FIELDS,
+    ConversationState.DEMOGRAPHIC_COLLECTION: DEMOGRAPHIC_FIELDS,
+    ConversationState.HISTORY_COLLECTION: HISTORY_FIELDS,
+}
+
+
+async def _text_stream(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+WELCOME_MESSAGE = """Hello! I'm here to help assess your urinary symptoms and provide guidance.
+
+*Type 'quit' or 'exit' to end the session at any time.*
+
+Can you tell me what symptoms you're experiencing?"""
+
+
+# Shown instead of the recommendation when its audit entry cannot be made durable
+AUDIT_FAILURE_REASON = "Your assessment could not be recorded, so a treatment cannot be recommended here"
+
+# Approximate footprint of a headless manager and of one history entry, measured with tracemalloc
+MANAGER_BASE_BYTES = 1400
+HISTORY_ENTRY_BYTES = 400
+
+
+class _Speculation:
+    """A decision computed before the allergy answer, with its explanation generating in the background"""
+    __slots__ = ('eligibility', 'task')
+    
+    def __init__(self, eligibility: EligibilityResult, task: asyncio.Task):
+        self.eligibility = eligibility
+        self.task = task
+
+
 class ConversationManager:
-    def __init__(self, enable_llm: bool = True):
+    def __init__(self, enable_llm: bool = True, llm_client: Optional[GeminiClient] = None,
+                 session_id: str = "", renderer=None, fused_extraction: bool = True,
+                 library: Optional[ExplanationLibrary] = None, speculative_generation: bool = True,
+                 clinical_engine: Optional[ClinicalDecisionEngine] = None, session_store: Optional[SessionStore] = None,
+                 evaluation_logger: Optional[EvaluationLogger] = None, tracer: Optional[Tracer] = None,
+                 cascade: bool = True):
         self.state = ConversationState.GREETING
-        self.patient_data = PatientData()
-        self.console = Console()
+        self.patient_data = PatientData(session_id=session_id)
+        self.renderer = renderer or ConsoleRenderer()
         
         # Initialize LLM client if enabled and API key available
-        self.llm_client = None
-        if enable_llm:
+        self.llm_client = llm_client
+        if enable_llm and llm_client is None:
             try:
                 self.llm_client = GeminiClient(api_key=os.getenv('GOOGLE_API_KEY'))
             except ValueError as e:
                 self.display_warning(f"Warning: {e}")
                 self.display_warning("Falling back to basic parsing without LLM integration.")
         
-        self.input_parser = InputParser(self.llm_client)
-        self.clinical_engine = ClinicalDecisionEngine()
-        self.response_generator = ResponseGenerator(self.llm_client)
+        # Formulaic answers ("28, female", "no allergies") are read by anchored rules;
+        # only the fields they are unsure of are sent to the LLM
+        self.input_parser = InputParser(self.llm_client, RuleExtractor() if cascade else None)
+        self.clinical_engine = clinical_engine or ClinicalDecisionEngine(default_registry())
+        self.response_generator = ResponseGenerator(self.llm_client, library or ExplanationLibrary.load_default())
         self.conversation_history = []
+        
+        # Fused extraction fills all of PatientData from every message in one LLM call,
+        # so states whose data is already known are skipped. The keyword parsers are
+        # too loose to extract fields the patient was not asked about, so it needs the LLM.
+        self.fused_extraction = fused_extraction and self.llm_client is not None
+        
+        # While the patient answers the allergy question the decision rarely changes, so the
+        # final explanation is generated in the background and reused if it still applies.
+        # Templated responses are instant, so this only pays off with the LLM.
+        self.speculative_generation = speculative_generation and self.llm_client is not None
+        self._speculation: Optional[_Speculation] = None
+        self.speculation_stats = {'started': 0, 'committed': 0, 'discarded': 0}
+        
+        # State is saved after every turn; only sub-records changed since the last save are written
+        self.session_store = session_store
+        self.turns = 0
+        self._persisted: Optional[PatientSnapshot] = None
+        
+        # Turns and decisions are queued for a background writer, so logging stays off the request path
+        self.evaluation_logger = evaluation_logger
+        
+        # Per-stage latency spans; the default tracer is disabled and records nothing
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.backend = getattr(self.llm_client, 'backend', 'gemini') if self.llm_client else 'basic'
+        self.over_budget: Optional[str] = None
     
-    def track_conversation_state(self, user_input: str, response: str):
+    @classmethod
+    def resume(cls, record: SessionRecord, **kwargs) -> 'ConversationManager':
+        """Rebuild a manager from its stored state; the per-turn history starts empty"""
+        manager = cls(session_id=record.session_id, **kwargs)
+        snapshot = record.snapshot()
+        manager.state = ConversationState(record.state)
+        manager.patient_data = snapshot.restore()
+        manager.turns = record.turn
+        manager._persisted = snapshot
+        return manager
+    
+    def dormant_record(self) -> SessionRecord:
+        """Everything needed to resume this session: the state and the full patient data"""
+        return SessionRecord.from_snapshot(self.state.value, self.patient_data.snapshot(), self.turns)
+    
+    def estimated_bytes(self) -> int:
+        return MANAGER_BASE_BYTES + sum(
+            HISTORY_ENTRY_BYTES + len(entry['user_input']) + len(entry['response']) for entry in self.conversation_history
+        )
+    
+    def persist(self, snapshot: Optional[PatientSnapshot] = None):
+        """Queue the current state for the session store"""
+        if self.session_store is None:
+            return
+        snapshot = snapshot or self.patient_data.snapshot(self._persisted)
+        self.session_store.save(SessionRecord.from_snapshot(self.state.value, snapshot, self.turns, self._persisted))
+        self._persisted = snapshot
+    
+    def track_conversation_state(self, user_input: str, response: str, ttft_seconds: Optional[float] = None):
+        # Each turn keeps its own snapshot; sub-records the turn did not change are shared with the previous one
+        previous = self.conversation_history[-1]['patient_data'] if self.conversation_history else self._persisted
         self.conversation_history.append({
             'user_input': user_input,
             'response': response,
             'state': self.state.value,
-            'patient_data': self.patient_data
+            'patient_data': self.patient_data.snapshot(previous),
+            'ttft_seconds': ttft_seconds
         })
     
     def determine_next_question(self) -> str:
+        return run_sync(self.determine_next_question_async())
+    
+    async def determine_next_question_async(self) -> str:
+        return "".join([chunk async for chunk in self._next_response_stream()])
+    
+    def _next_response_stream(self) -> AsyncIterator[str]:
+        """Advance the state machine and return the stream of the next agent message"""
         if self.state == ConversationState.GREETING:
-            return "Hello! I'm here to help assess your urinary symptoms. Can you tell me what symptoms you're experiencing?"
+            return _text_stream("Hello! I'm here to help assess your urinary symptoms. Can you tell me what symptoms you're experiencing?")
         
-        elif self.state == ConversationState.SYMPTOM_COLLECTION:
+        if self.state == ConversationState.SYMPTOM_COLLECTION:
             missing_symptoms = self._check_missing_symptom_data()
             if missing_symptoms:
-                return self.response_generator.generate_followup_question(missing_symptoms)
-            else:
-                self.state = ConversationState.DEMOGRAPHIC_COLLECTION
-                return "Thank you. Now I need some basic information about you. What is your age and biological sex?"
+                return self.response_generator.stream_followup_question(missing_symptoms)
+            self.state = ConversationState.DEMOGRAPHIC_COLLECTION
+            if not self._already_collected(self._check_missing_demographic_data):
+                return _text_stream("Thank you. Now I need some basic information about you. What is your age and biological sex?")
         
-        elif self.state == ConversationState.DEMOGRAPHIC_COLLECTION:
+        if self.state == ConversationState.DEMOGRAPHIC_COLLECTION:
             missing_demographics = self._check_missing_demographic_data()
             if missing_demographics:
-                return self.response_generator.generate_followup_question(missing_demographics)
-            else:
-                self.state = ConversationState.HISTORY_COLLECTION
-                return "Do you have any allergies to medications, and are you currently taking any medications?"
+                return self.response_generator.stream_followup_question(missing_demographics)
+            self.state = ConversationState.HISTORY_COLLECTION
+            if not self._already_collected(self._check_missing_history_data):
+                self._start_speculation()
+                return _text_stream("Do you have any allergies to medications, and are you currently taking any medications?")
         
-        elif self.state == ConversationState.HISTORY_COLLECTION:
+        if self.state == ConversationState.HISTORY_COLLECTION:
             missing_history = self._check_missing_history_data()
             if missing_history:
-                return self.response_generator.generate_followup_question(missing_history)
-            else:
-                self.state = ConversationState.CLINICAL_ASSESSMENT
-                return self._perform_clinical_assessment()
+                self._start_speculation()
+                return self.response_generator.stream_followup_question(missing_history)
+            self.state = ConversationState.CLINICAL_ASSESSMENT
+            return self._clinical_assessment_stream()
         
-        return "Thank you for the information."
+        return _text_stream("Thank you for the information.")
+    
+    def _already_collected(self, check_missing) -> bool:
+        """In fused mode, a state whose data arrived in earlier messages is skipped"""
+        return self.fused_extraction and not check_missing()
     
     def _check_missing_symptom_data(self) -> Dict[str, Any]:
         missing = {}
@@ -98,109 +220,313 @@ class ConversationManager:
     
     def _check_missing_history_data(self) -> Dict[str, Any]:
         missing = {}
-        if not hasattr(self.patient_data.history, 'allergies_collected'):
+        if not self.patient_data.history.allergies_collected:
             missing['allergies'] = 'any medication allergies'
         return missing
     
-    def _perform_clinical_assessment(self) -> str:
-        eligibility = self.clinical_engine.determine_eligibility(self.patient_data)
+    def _clinical_assessment_stream(self) -> AsyncIterator[str]:
+        try:
+            with self._span('eligibility'):
+                eligibility = self.clinical_engine.determine_eligibility(self.patient_data)
+        except AuditLogError:
+            # The audit log has stopped, so no decision may be shown
+            self.state = ConversationState.COMPLETE
+            self.cancel_speculation()
+            return _text_stream(self._audit_failure_message())
+        self.state = ConversationState.COMPLETE
+        with self._span('log'):
+            self._log_decision(eligibility)
+        
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None:
+            if speculation.eligibility == eligibility:
+                return self._audited_stream(self._speculative_stream(speculation, eligibility))
+            speculation.task.cancel()
+            self.speculation_stats['discarded'] += 1
         
+        return self._audited_stream(self._explanation_stream(eligibility))
+    
+    async def _audited_stream(self, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        # A recommendation is only shown once its audit entry is on disk
+        if self.clinical_engine.audit_log is not None:
+            try:
+                with self._span('audit_sync'):
+                    await self.clinical_engine.audit_log.sync_async()
+            except AuditLogError:
+                await stream.aclose()
+                yield self._audit_failure_message()
+                return
+        async for chunk in stream:
+            yield chunk
+    
+    def _audit_failure_message(self) -> str:
+        return self.response_generator._generate_referral_basic(AUDIT_FAILURE_REASON)
+    
+    def _explanation_stream(self, eligibility: EligibilityResult) -> AsyncIterator[str]:
         if eligibility.treatment_plan:
-            response = self.response_generator.generate_treatment_explanation(eligibility.treatment_plan)
+            return self.response_generator.stream_treatment_explanation(eligibility.treatment_plan)
         else:
-            response = self.response_generator.generate_referral_message(eligibility.referral_reason)
-        
-        self.state = ConversationState.COMPLETE
-        return response
+            return self.response_generator.stream_referral_message(eligibility.referral_reason)
+    
+    async def _explanation_text(self, eligibility: EligibilityResult) -> str:
+        if eligibility.treatment_plan:
+            return await self.response_generator.generate_treatment_explanation_async(eligibility.treatment_plan)
+        else:
+            return await self.response_generator.generate_referral_message_async(eligibility.referral_reason)
+    
+    def _start_speculation(self):
+        """Decide on the data collected so far and start generating that explanation"""
+        if not self.speculative_generation or self._speculation is not None:
+            return
+        # The decision is computed now, so later merges into patient_data cannot change it. It is
+        # provisional, so it is not audited; the final assessment logs the decision the patient sees
+        eligibility = self.clinical_engine.determine_eligibility(self.patient_data, audit=False)
+        # Tokens spent on speculation are reported apart from the states that use the result
+        context = contextvars.copy_context()
+        context.run(set_call_context, self.session_id, 'speculation')
+        task = asyncio.get_running_loop().create_task(self._explanation_text(eligibility), context=context)
+        self._speculation = _Speculation(eligibility, task)
+        self.speculation_stats['started'] += 1
+    
+    async def _speculative_stream(self, speculation: _Speculation, eligibility: EligibilityResult) -> AsyncIterator[str]:
+        try:
+            text = await speculation.task
+        except Exception:
+            text = ""
+        if text:
+            self.speculation_stats['committed'] += 1
+            yield text
+        else:
+            # The background call failed; generate live rather than return nothing
+            self.speculation_stats['discarded'] += 1
+            async for chunk in self._explanation_stream(eligibility):
+                yield chunk
+    
+    def cancel_speculation(self):
+        """Drop any in-flight speculative generation, e.g. when the session ends"""
+        if self._speculation is not None:
+            self._speculation.task.cancel()
+            self._speculation = None
+            self.speculation_stats['discarded'] += 1
     
     def validate_information_completeness(self) -> bool:
         return (
             bool(self.patient_data.symptoms.onset) and
             bool(self.patient_data.demographics.age) and
             bool(self.patient_data.demographics.sex) and
-            hasattr(self.patient_data.history, 'allergies_collected')
+            self.patient_data.history.allergies_collected
         )
     
     def process_input(self, user_input: str) -> str:
-        if self.state == ConversationState.GREETING:
-            self.patient_data.symptoms = self.input_parser.extract_symptoms(user_input)
+        """Blocking wrapper around process_input_async for the CLI"""
+        return run_sync(self.process_input_async(user_input))
+    
+    def process_input_stream(self, user_input: str) -> Iterator[str]:
+        """Blocking wrapper around process_input_stream_async for the CLI"""
+        return iterate_sync(self.process_input_stream_async(user_input))
+    
+    async def process_input_async(self, user_input: str) -> str:
+        return "".join([chunk async for chunk in self.process_input_stream_async(user_input)])
+    
+    async def process_input_stream_async(self, user_input: str) -> AsyncIterator[str]:
+        """Process a patient message, yielding the agent's reply as it is generated"""
+        started = time.perf_counter()
+        self._enforce_token_budget()
+        set_call_context(self.session_id, self.state.value)
+        self.input_parser.last_parser = None
+        with self._span('parse') as span:
+            await self._apply_input_async(user_input)
+            if self.input_parser.last_parser in ('basic', 'rules'):
+                span.tag(backend=self.input_parser.last_parser)
+        
+        with self._span('transition'):
+            stream = self._next_response_stream()
+        # The reply is generated for the state the transition ended in
+        set_call_context(self.session_id, self.state.value)
+        
+        chunks = []
+        ttft_seconds = None
+        with self._span('generate'):
+            async for chunk in stream:
+                if ttft_seconds is None:
+                    ttft_seconds = time.perf_counter() - started
+                chunks.append(chunk)
+                yield chunk
+        
+        self.turns += 1
+        self.track_conversation_state(user_input, "".join(chunks), ttft_seconds)
+        with self._span('persist'):
+            self.persist(self.conversation_history[-1]['patient_data'])
+        with self._span('log'):
+            self._log_turn(user_input, "".join(chunks), ttft_seconds, time.perf_counter() - started)
+    
+    def _enforce_token_budget(self):
+        """Once the session or process token budget is used up, finish the session on the basic parsers and templates"""
+        ledger = getattr(self.llm_client, 'ledger', None)
+        if ledger is None:
+            return
+        exceeded = ledger.exceeded(self.session_id)
+        if exceeded is None:
+            return
+        # An in-flight speculation is already paid for, so it is left to finish; a failure falls back to templates
+        self.over_budget = exceeded
+        self.llm_client = None
+        self.input_parser.llm_client = None
+        self.response_generator.llm_client = None
+        self.fused_extraction = False
+        self.speculative_generation = False
+        self.backend = 'basic'
+        self.display_warning(f"Token budget ({exceeded}) exhausted; continuing with basic parsing and templated responses.")
+    
+    def _span(self, stage: str):
+        if not self.tracer.enabled:
+            return NULL_SPAN
+        return self.tracer.span(stage, session_id=self.session_id, state=self.state.value, backend=self.backend)
+    
+    def _log_turn(self, user_input: str, response: str, ttft_seconds: Optional[float], latency_seconds: float):
+        if self.evaluation_logger is None:
+            return
+        self.evaluation_logger.log_conversation({
+            'session_id': self.session_id,
+            'turn': self.turns,
+            'state': self.state.value,
+            'user_input': user_input,
+            'response': response,
+            'ttft_seconds': ttft_seconds,
+            'latency_seconds': latency_seconds,
+            'parser': self.input_parser.last_parser,
+            # Fields the rules could not settle, when the cascade sent some to the LLM
+            'escalated': (self.input_parser.last_route or {}).get('llm')
+        })
+    
+    def _log_decision(self, eligibility: EligibilityResult):
+        if self.evaluation_logger is None:
+            return
+        plan = eligibility.treatment_plan
+        self.evaluation_logger.log_clinical_decision({
+            'session_id': self.session_id,
+            # Decided during the turn in progress, which is counted once it finishes
+            'turn': self.turns + 1,
+            'guideline_version': self.clinical_engine.guideline_version,
+            'status': eligibility.status.value,
+            'medication': plan.medication if plan else None,
+            'referral_reason': eligibility.referral_reason,
+            'patient_data': self.patient_data.to_dict()
+        })
+    
+    @property
+    def last_ttft_seconds(self) -> Optional[float]:
+        """Time from receiving the last message to the first chunk of the reply"""
+        return self.conversation_history[-1]['ttft_seconds'] if self.conversation_history else None
+    
+    async def _apply_input_async(self, user_input: str):
+        """Extract data from the patient message and merge it into patient_data"""
+        if self.fused_extraction:
+            extracted = await self.input_parser.extract_patient_data_async(user_input, EXPECTED_FIELDS.get(self.state, ()))
+            self._merge_symptoms(extracted.symptoms)
+            self._merge_demographics(extracted.demographics)
+            self._merge_history(extracted.history)
+            # Any reply to the allergy question counts as an answer, even without named drugs
+            if self.state == ConversationState.HISTORY_COLLECTION:
+                self.patient_data.history.allergies_collected = True
+            elif self.state == ConversationState.GREETING:
+                self.state = ConversationState.SYMPTOM_COLLECTION
+        
+        elif self.state == ConversationState.GREETING:
+            self.patient_data.symptoms = await self.input_parser.extract_symptoms_async(user_input)
             self.state = ConversationState.SYMPTOM_COLLECTION
         
         elif self.state == ConversationState.SYMPTOM_COLLECTION:
-            updated_symptoms = self.input_parser.extract_symptoms(user_input)
-            # Merge with existing symptoms
-            for attr in ['dysuria', 'urgency', 'frequency', 'suprapubic_pain', 'hematuria', 'onset', 'severity']:
-                if hasattr(updated_symptoms, attr) and getattr(updated_symptoms, attr):
-                    setattr(self.patient_data.symptoms, attr, getattr(updated_symptoms, attr))
+            self._merge_symptoms(await self.input_parser.extract_symptoms_async(user_input))
         
         elif self.state == ConversationState.DEMOGRAPHIC_COLLECTION:
-            demographics = self.input_parser.extract_demographics(user_input)
-            if demographics.age:
-                self.patient_data.demographics.age = demographics.age
-            if demographics.sex:
-                self.patient_data.demographics.sex = demographics.sex
+            self._merge_demographics(await self.input_parser.extract_demographics_async(user_input))
         
         elif self.state == ConversationState.HISTORY_COLLECTION:
-            history = self.input_parser.extract_medical_history(user_input)
-            self.patient_data.history.allergies.extend(history.allergies)
-            self.patient_data.history.current_medications.extend(history.current_medications)
+            self._merge_history(await self.input_parser.extract_medical_history_async(user_input))
             self.patient_data.history.allergies_collected = True
-        
-        response = self.determine_next_question()
-        self.track_conversation_state(user_input, response)
-        return response
+    
+    def _merge_symptoms(self, updated_symptoms: SymptomData):
+        # Every flag, systemic symptoms included; a symptom once reported stays reported
+        self.patient_data.symptoms.flags |= updated_symptoms.flags
+        for attr in ['onset', 'severity']:
+            if getattr(updated_symptoms, attr):
+                setattr(self.patient_data.symptoms, attr, getattr(updated_symptoms, attr))
+    
+    def _merge_demographics(self, demographics: DemographicData):
+        # Outside the age question only an age the rules tie to the patient ("I'm 31") replaces one already given
+        if demographics.age and (not self.patient_data.demographics.age or self._age_answered()):
+            self.patient_data.demographics.age = demographics.age
+        if demographics.sex:
+            self.patient_data.demographics.sex = demographics.sex
+        if demographics.weight is not None:
+            self.patient_data.demographics.weight = demographics.weight
+        if demographics.pregnancy_status is not None:
+            self.patient_data.demographics.pregnancy_status = demographics.pregnancy_status
+    
+    def _age_answered(self) -> bool:
+        if self.state == ConversationState.DEMOGRAPHIC_COLLECTION:
+            return True
+        return 'age' in (self.input_parser.last_route or {}).get('rules', ())
+    
+    def _merge_history(self, history: HistoryData):
+        current = self.patient_data.history
+        current.allergies.extend(a for a in history.allergies if a not in current.allergies)
+        current.current_medications.extend(m for m in history.current_medications if m not in current.current_medications)
+        # recent_antibiotics, immunocompromised, the complication flags and allergies_collected
+        current.flags |= history.flags
     
     def is_complete(self) -> bool:
         return self.state == ConversationState.COMPLETE
     
+    @property
+    def session_id(self) -> str:
+        return self.patient_data.session_id
+    
     def display_welcome(self):
         """Display welcome message in agent box"""
-        welcome_text = """Hello! I'm here to help assess your urinary symptoms and provide guidance.
-
-*Type 'quit' or 'exit' to end the session at any time.*
-
-Can you tell me what symptoms you're experiencing?"""
-        
-        panel = Panel(
-            Markdown(welcome_text),
-            title="UTI Care Agent",
-            border_style="cyan",
-            padding=(1, 1)
-        )
-        self.console.print(panel)
+        self.renderer.render_response(WELCOME_MESSAGE)
     
     def display_agent_response(self, response: str):
         """Display agent response with cyan styling"""
-        panel = Panel(
-            Markdown(response),
-            title="UTI Care Agent",
-            border_style="cyan",
-            padding=(1, 1)
-        )
-        self.console.print(panel)
+        with self._span('render'):
+            self.renderer.render_response(response)
+    
+    def display_agent_response_stream(self, chunks: Iterator[str]) -> str:
+        """Render a reply progressively as chunks arrive; returns the full text"""
+        if not self.tracer.enabled:
+            return self.renderer.render_response_stream(chunks)
+        # Time spent waiting for the next chunk is generation, not rendering
+        waiting = 0.0
+        
+        def timed(iterator: Iterator[str]) -> Iterator[str]:
+            nonlocal waiting
+            while True:
+                started = time.perf_counter()
+                chunk = next(iterator, None)
+                waiting += time.perf_counter() - started
+                if chunk is None:
+                    return
+                yield chunk
+        
+        started = time.perf_counter()
+        text = self.renderer.render_response_stream(timed(iter(chunks)))
+        self.tracer.record('render', time.perf_counter() - started - waiting,
+                           session_id=self.session_id, state=self.state.value, backend=self.backend)
+        return text
     
     def display_user_input(self, user_input: str):
         """Display user input with blue border"""
-        panel = Panel(
-            user_input,
-            title="You",
-            border_style="blue",
-            padding=(0, 1)
-        )
-        self.console.print(panel)
+        self.renderer.render_user_input(user_input)
     
     def display_warning(self, message: str):
         """Display warning message"""
-        self.console.print(f"[yellow]{message}[/yellow]")
+        self.renderer.render_warning(message)
     
     def display_goodbye(self):
         """Display goodbye message"""
-        self.console.print("\n[green]Thank you for using the UTI Care Agent. Take care![/green]")
+        self.renderer.render_goodbye()
     
     def get_user_input(self) -> str:
         """Get user input with simple prompt"""
-        try:
-            user_input = self.console.input("\n[blue]You:[/blue] ").strip()
-            return user_input
-        except (EOFError, KeyboardInterrupt):
-            return "quit"
\ No newline at end of file
+        return self.renderer.read_input()
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Pre-generated treatment and referral explanations.
+
+ClinicalDecisionEngine can only produce a small, fixed set of outcomes, so the
+explanations for all of them are generated once at build time, safety-checked,
+and stored in a versioned JSON artifact. At runtime ResponseGenerator serves
+them with a dict lookup and only falls back to live generation for outcomes
+missing from the library.
+
+Build the library (uses the LLM when GOOGLE_API_KEY is set):
+
+    python -m core.explanation_library build --output data/explanations.json
+"""
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+from models.treatment_plan import TreatmentPlan
+from utils.llm_client import is_response_safe
+
+LIBRARY_FORMAT_VERSION = 1
+DEFAULT_LIBRARY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'explanations.json')
+
+
+def treatment_key(treatment_plan: TreatmentPlan) -> str:
+    return f"treatment:{treatment_plan.medication}|{treatment_plan.dosage}|{treatment_plan.duration}"
+
+
+def referral_key(reason: Optional[str]) -> str:
+    return f"referral:{reason}"
+
+
+def is_treatment_explanation_valid(text: str, treatment_plan: TreatmentPlan) -> bool:
+    """Safe wording, and the drug, dose and duration are stated exactly as prescribed"""
+    return (
+        bool(text) and is_response_safe(text) and
+        treatment_plan.medication.split()[0].lower() in text.lower() and
+        treatment_plan.dosage.lower() in text.lower() and
+        treatment_plan.duration.lower() in text.lower()
+    )
+
+
+def is_referral_message_valid(text: str) -> bool:
+    """Safe wording, and the patient is actually told to see a clinician"""
+    text_lower = text.lower()
+    return (
+        bool(text) and is_response_safe(text) and
+        any(term in text_lower for term in ['healthcare provider', 'doctor', 'clinician', 'urgent care', 'pharmacist'])
+    )
+
+
+class ExplanationLibrary:
+    def __init__(self, entries: Optional[Dict[str, str]] = None, metadata: Optional[Dict[str, Any]] = None):
+        self.entries = entries or {}
+        self.metadata = metadata or {}
+
+    @property
+    def version(self) -> str:
+        return self.metadata.get('version', '')
+
+    @classmethod
+    def load(cls, path: str) -> 'ExplanationLibrary':
+        with open(path, encoding='utf-8') as f:
+            artifact = json.load(f)
+        if artifact.get('format_version') != LIBRARY_FORMAT_VERSION:
+            raise ValueError(f"Unsupported explanation library format in {path}")
+        return cls(artifact['entries'], artifact['metadata'])
+
+    @classmethod
+    def load_default(cls) -> Optional['ExplanationLibrary']:
+        """Load the library from UTI_AGENT_EXPLANATION_LIBRARY or the default path, if built"""
+        path = os.getenv('UTI_AGENT_EXPLANATION_LIBRARY', DEFAULT_LIBRARY_PATH)
+        return cls.load(path) if os.path.exists(path) else None
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        artifact = {
+            'format_version': LIBRARY_FORMAT_VERSION,
+            'metadata': self.metadata,
+            'entries': self.entries
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(artifact, f, indent=2, sort_keys=True)
+
+    def get_treatment_explanation(self, treatment_plan: TreatmentPlan) -> Optional[str]:
+        return self.entries.get(treatment_key(treatment_plan))
+
+    def get_referral_message(self, reason: Optional[str]) -> Optional[str]:
+        return self.entries.get(referral_key(reason))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def _generate_vetted(generate: Callable[[], str], fallback: Callable[[], str],
+                     is_valid: Callable[[str], bool], attempts: int) -> tuple[str, str]:
+    for _ in range(attempts):
+        text = generate()
+        if is_valid(text):
+            return text, 'generated'
+    # The templated text is reviewed by hand, so it is the vetted fallback
+    return fallback(), 'template'
+
+
+def build_library(response_generator, clinical_engine, attempts: int = 3) -> ExplanationLibrary:
+    """Generate and safety-check an explanation for every possible engine outcome"""
+    entries: Dict[str, str] = {}
+    sources: Dict[str, str] = {}
+
+    for plan in clinical_engine.possible_treatment_plans():
+        key = treatment_key(plan)
+        entries[key], sources[key] = _generate_vetted(
+            lambda: response_generator.generate_treatment_explanation(plan),
+            lambda: response_generator._generate_treatment_basic(plan),
+            lambda text: is_treatment_explanation_valid(text, plan),
+            attempts
+        )
+
+    for reason in clinical_engine.possible_referral_reasons():
+        key = referral_key(reason)
+        entries[key], sources[key] = _generate_vetted(
+            lambda: response_generator.generate_referral_message(reason),
+            lambda: response_generator._generate_referral_basic(reason),
+            is_referral_message_valid,
+            attempts
+        )
+
+    digest = hashlib.sha256(json.dumps(entries, sort_keys=True).encode('utf-8')).hexdigest()
+    llm_client = response_generator.llm_client
+    metadata = {
+        'version': digest[:12],
+        'created_at': datetime.now().isoformat(),
+        'model': llm_client.model if llm_client else None,
+        'guideline_version': clinical_engine.guideline_version,
+        'generated': sum(1 for source in sources.values() if source == 'generated'),
+        'templated': sum(1 for source in sources.values() if source == 'template'),
+        'sources': sources
+    }
+    return ExplanationLibrary(entries, metadata)
+
+
+def main():
+    from dotenv import load_dotenv
+    from core.clinical_engine import ClinicalDecisionEngine
+    from core.guidelines import GuidelineRegistry, default_registry
+    from core.response_gen import ResponseGenerator
+    from utils.llm_client import GeminiClient
+
+    parser = argparse.ArgumentParser(description="Build or inspect the pre-generated explanation library")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="Generate explanations for every treatment plan and referral reason")
+    build.add_argument('--output', default=DEFAULT_LIBRARY_PATH)
+    build.add_argument('--no-llm', action='store_true', help="Store the templated explanations only")
+    build.add_argument('--attempts', type=int, default=3, help="LLM attempts per entry before using the template")
+    build.add_argument('--guidelines', help="Guideline file (default: UTI_AGENT_GUIDELINES or the bundled file)")
+    show = subparsers.add_parser('show', help="Print library metadata")
+    show.add_argument('path', nargs='?', default=DEFAULT_LIBRARY_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        library = ExplanationLibrary.load(args.path)
+        metadata = {k: v for k, v in library.metadata.items() if k != 'sources'}
+        print(json.dumps({**metadata, 'entries': len(library)}, indent=2))
+        return
+
+    load_dotenv()
+    llm_client = None if args.no_llm else GeminiClient()
+    # The outcomes must come from the guideline the server decides with
+    guidelines = GuidelineRegistry.from_file(args.guidelines) if args.guidelines else default_registry()
+    # The generator must not consult an existing library while rebuilding it
+    library = build_library(ResponseGenerator(llm_client), ClinicalDecisionEngine(guidelines), attempts=args.attempts)
+    library.save(args.output)
+    print(f"Wrote {len(library)} explanations (version {library.version}, guideline {guidelines.version}, "
+          f"{library.metadata['templated']} templated) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Response schemas for LLM extraction, generated from the patient data classes.
+
+The schemas are passed to the model as `response_schema`, so the reply is
+constrained to valid JSON with exactly these fields, and the field
+descriptions live here instead of in every prompt. Booleans (including
+the packed symptom and history flags) default to false and lists to empty;
+other values are null when the patient did not mention them.
+"""
+import typing
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from models.patient_data import SymptomData, DemographicData, HistoryData
+
+FIELD_DESCRIPTIONS = {
+    'dysuria': "burning pain during urination",
+    'urgency': "sudden strong urge to urinate",
+    'frequency': "urinating more often than usual",
+    'suprapubic_pain': "pain in lower abdomen/bladder area",
+    'hematuria': "blood in urine",
+    'fever': "fever or feeling feverish",
+    'rigors': "shaking chills",
+    'flank_pain': "pain in the side or flank",
+    'back_pain': "back pain",
+    'nausea': "nausea",
+    'vomiting': "vomiting",
+    'onset': "when symptoms started",
+    'severity': "symptom severity, if mentioned",
+    'age': "age in years",
+    'sex': "biological sex",
+    'weight': "weight in kg or lbs",
+    'pregnancy_status': "true if pregnant, null if unknown or not applicable",
+    'allergies': "medication allergies",
+    'current_medications': "current medications",
+    'recent_antibiotics': "antibiotics in the last 4 weeks",
+    'immunocompromised': "immunosuppressed, diabetes, etc.",
+    'abnormal_urinary_function': "known structural or functional urinary tract abnormality",
+    'indwelling_catheter': "has a urinary catheter",
+    'neurogenic_bladder': "neurogenic bladder",
+    'renal_stones': "kidney stones",
+    'renal_dysfunction': "kidney disease or reduced kidney function",
+    'allergies_mentioned': "true if the patient said whether or not they have medication allergies"
+}
+
+FIELD_ENUMS = {
+    'onset': ["hours", "1-2 days", "days", "weeks", "unknown"],
+    'severity': ["mild", "moderate", "severe"],
+    'sex': ["male", "female"]
+}
+
+_SCALARS = {bool: 'BOOLEAN', int: 'INTEGER', float: 'NUMBER', str: 'STRING'}
+
+
+def _field_schema(name: str, annotation) -> Dict[str, Any]:
+    nullable = False
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        annotation, nullable = args[0], True
+    if typing.get_origin(annotation) in (list, List):
+        schema = {'type': 'ARRAY', 'items': {'type': _SCALARS[typing.get_args(annotation)[0]]}}
+    else:
+        schema = {'type': _SCALARS[annotation]}
+        # Unset numbers and strings are sent as null, never as the dataclass' 0 or ""
+        nullable = nullable or annotation is not bool
+    if nullable:
+        schema['nullable'] = True
+    if name in FIELD_ENUMS:
+        schema['enum'] = FIELD_ENUMS[name]
+    if name in FIELD_DESCRIPTIONS:
+        schema['description'] = FIELD_DESCRIPTIONS[name]
+    return schema
+
+
+def dataclass_schema(*classes: type, fields: Sequence[str], extra: Optional[Dict[str, type]] = None) -> Dict[str, Any]:
+    """An OBJECT schema of `fields`, typed from the classes' annotations and packed flags, plus `extra` fields"""
+    annotations: Dict[str, Any] = {}
+    for cls in classes:
+        annotations.update({name: bool for name in getattr(cls, 'FLAG_BITS', {})})
+        annotations.update(typing.get_type_hints(cls))
+    annotations.update(extra or {})
+    return {
+        'type': 'OBJECT',
+        'properties': {name: _field_schema(name, annotations[name]) for name in fields},
+        'required': list(fields)
+    }
+
+
+# Systemic symptoms and urinary tract complications decide referral, so every schema that covers them asks for them
+SYSTEMIC_FIELDS = ['fever', 'rigors', 'flank_pain', 'back_pain', 'nausea', 'vomiting']
+COMPLICATION_FIELDS = ['abnormal_urinary_function', 'indwelling_catheter', 'neurogenic_bladder', 'renal_stones',
+                       'renal_dysfunction']
+SYMPTOM_FIELDS = ['dysuria', 'urgency', 'frequency', 'suprapubic_pain', 'hematuria'] + SYSTEMIC_FIELDS + ['onset', 'severity']
+DEMOGRAPHIC_FIELDS = ['age', 'sex', 'weight', 'pregnancy_status']
+HISTORY_FIELDS = ['allergies', 'current_medications', 'recent_antibiotics', 'immunocompromised'] + COMPLICATION_FIELDS
+
+SYMPTOM_SCHEMA = dataclass_schema(SymptomData, fields=SYMPTOM_FIELDS)
+DEMOGRAPHIC_SCHEMA = dataclass_schema(DemographicData, fields=DEMOGRAPHIC_FIELDS)
+HISTORY_SCHEMA = dataclass_schema(HistoryData, fields=HISTORY_FIELDS)
+PATIENT_FIELDS = SYMPTOM_FIELDS + DEMOGRAPHIC_FIELDS + ['allergies', 'allergies_mentioned', 'current_medications',
+                                                        'recent_antibiotics', 'immunocompromised'] + COMPLICATION_FIELDS
+
+
+@lru_cache(maxsize=256)
+def _schema_for(fields: Tuple[str, ...]) -> Dict[str, Any]:
+    return dataclass_schema(SymptomData, DemographicData, HistoryData, fields=fields,
+                            extra={'allergies_mentioned': bool})
+
+
+def schema_for(fields: Sequence[str]) -> Dict[str, Any]:
+    """The schema of any subset of PATIENT_FIELDS; the same subset always returns the same (shared, read-only) dict"""
+    return _schema_for(tuple(fields))
+
+
+PATIENT_SCHEMA = schema_for(PATIENT_FIELDS)
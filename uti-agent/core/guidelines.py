@@ -0,0 +1,326 @@
+"""
+Declarative OCP guideline rules, compiled to a bitmask evaluator.
+
+The symptom criteria, complicating factors, recurrence windows and the
+allergy-ordered drug ladder live in a versioned JSON file (guidelines/ocp_uti.json).
+CompiledGuideline turns it into integer masks over a fixed feature vocabulary;
+the symptom and complication outcome for each combination of rule inputs is
+computed once with bitwise tests and then served from a decision table.
+GuidelineRegistry holds the active compiled version and swaps
+it atomically, so a running server can change guidelines without restarting.
+"""
+import json
+import os
+import threading
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from itertools import combinations
+from bisect import bisect_right
+from operator import attrgetter
+from typing import Dict, Any, List, Optional, Tuple
+from models.patient_data import PatientData, SymptomData, HistoryData
+from models.treatment_plan import EligibilityResult, EligibilityStatus, TreatmentPlan
+
+DEFAULT_GUIDELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guidelines', 'ocp_uti.json')
+
+# Every boolean a rule may reference, in bit order: (attribute path, value it must equal or None for truthy)
+FEATURES = {
+    'dysuria': ('symptoms.dysuria', None),
+    'urgency': ('symptoms.urgency', None),
+    'frequency': ('symptoms.frequency', None),
+    'suprapubic_pain': ('symptoms.suprapubic_pain', None),
+    'hematuria': ('symptoms.hematuria', None),
+    'fever': ('symptoms.fever', None),
+    'rigors': ('symptoms.rigors', None),
+    'flank_pain': ('symptoms.flank_pain', None),
+    'back_pain': ('symptoms.back_pain', None),
+    'nausea': ('symptoms.nausea', None),
+    'vomiting': ('symptoms.vomiting', None),
+    'sex_male': ('demographics.sex', 'male'),
+    'sex_female': ('demographics.sex', 'female'),
+    'pregnant': ('demographics.pregnancy_status', None),
+    'immunocompromised': ('history.immunocompromised', None),
+    'abnormal_urinary_function': ('history.abnormal_urinary_function', None),
+    'indwelling_catheter': ('history.indwelling_catheter', None),
+    'neurogenic_bladder': ('history.neurogenic_bladder', None),
+    'renal_stones': ('history.renal_stones', None),
+    'renal_dysfunction': ('history.renal_dysfunction', None),
+}
+FEATURE_BITS = {name: 1 << bit for bit, name in enumerate(FEATURES)}
+
+# Sub-records whose findings are packed into a `flags` integer
+FLAG_RECORDS = {'symptoms': SymptomData, 'history': HistoryData}
+
+MAX_DECISION_TABLE_SIZE = 65536
+
+
+class GuidelineError(ValueError):
+    pass
+
+
+def _mask(names: List[str], bits: Dict[str, int], where: str) -> int:
+    mask = 0
+    for name in names:
+        if name not in bits:
+            raise GuidelineError(f"Unknown feature '{name}' in {where}")
+        mask |= bits[name]
+    return mask
+
+
+def _tuple_getter(names: List[str]):
+    """attrgetter that always returns a tuple, whatever the number of names"""
+    if len(names) > 1:
+        return attrgetter(*names)
+    if names:
+        name = names[0]
+        return lambda record: (getattr(record, name),)
+    return lambda record: ()
+
+
+class CompiledGuideline:
+    """One guideline version reduced to masks and lookup tables"""
+    __slots__ = ('name', 'version', 'source', '_sufficient', '_qualifying', '_min_qualifying', '_symptom_reason',
+                 '_complication_rules', '_complication_reasons', '_recurrence', '_allergy_bits', '_ladder',
+                 '_symptom_flags', '_history_flags', '_read_demographics', '_encoders', '_age_cuts', '_decisions')
+
+    def __init__(self, spec: Dict[str, Any]):
+        try:
+            self._compile(spec)
+        except (KeyError, TypeError) as e:
+            raise GuidelineError(f"Malformed guideline: {e!r}") from e
+
+    def _compile(self, spec: Dict[str, Any]):
+        self.name = spec['guideline']
+        self.version = str(spec['version'])
+        self.source = spec.get('source', '')
+
+        criteria = spec['symptom_criteria']
+        self._sufficient = _mask(criteria['sufficient'], FEATURE_BITS, 'symptom_criteria')
+        self._qualifying = _mask(criteria['qualifying'], FEATURE_BITS, 'symptom_criteria')
+        self._min_qualifying = int(criteria['min_qualifying'])
+        self._symptom_reason = criteria['referral_reason']
+
+        # (bit, kind, operand); kind is 'any', 'all' or 'age_below'
+        rules: List[Tuple[int, str, int]] = []
+        names = []
+        factors = spec['complicating_factors']
+        for bit, rule in enumerate(factors['rules']):
+            names.append(rule['name'])
+            if 'any' in rule:
+                rules.append((1 << bit, 'any', _mask(rule['any'], FEATURE_BITS, rule['name'])))
+            elif 'all' in rule:
+                rules.append((1 << bit, 'all', _mask(rule['all'], FEATURE_BITS, rule['name'])))
+            elif 'age_below' in rule:
+                rules.append((1 << bit, 'age_below', int(rule['age_below'])))
+            else:
+                raise GuidelineError(f"Complicating factor '{rule['name']}' has no condition")
+        self._complication_rules = tuple(rules)
+        # Every combination of factors maps straight to its referral text
+        template = factors['referral_reason']
+        self._complication_reasons = tuple(
+            template.format(factors=', '.join(name for bit, name in enumerate(names) if mask & (1 << bit)))
+            for mask in range(1 << len(names))
+        )
+
+        # (days, min_count, reason); min_count None means relapse after completed treatment
+        recurrence = []
+        for rule in spec['recurrence']:
+            if 'completed_within_days' in rule:
+                recurrence.append((int(rule['completed_within_days']), None, rule['referral_reason']))
+            else:
+                recurrence.append((int(rule['window_days']), int(rule['min_count']), rule['referral_reason']))
+        self._recurrence = tuple(recurrence)
+
+        allergens = sorted({a.lower() for step in spec['treatment_ladder'] for a in step['contraindicated_by']})
+        self._allergy_bits = {allergen: 1 << bit for bit, allergen in enumerate(allergens)}
+        # Plans are kept as keyword arguments; building a TreatmentPlan from them is cheaper than copying one
+        self._ladder = tuple(
+            (_mask([a.lower() for a in step['contraindicated_by']], self._allergy_bits, step['name']),
+             asdict(TreatmentPlan(**step['plan'])))
+            for step in spec['treatment_ladder']
+        )
+
+        # Symptom and history findings are packed flags, so each is read as one masked integer;
+        # demographics are read with a single attrgetter call
+        used = self._sufficient | self._qualifying
+        for _, kind, operand in self._complication_rules:
+            if kind != 'age_below':
+                used |= operand
+        flag_masks = {'symptoms': 0, 'history': 0}
+        demographic_attrs = []
+        encoders = []
+        for name, (path, equals) in FEATURES.items():
+            if not used & FEATURE_BITS[name]:
+                continue
+            record, attr = path.split('.')
+            if record in flag_masks:
+                flag_bit = FLAG_RECORDS[record].FLAG_BITS[attr]
+                flag_masks[record] |= flag_bit
+                encoders.append((0 if record == 'symptoms' else 1, flag_bit, None, FEATURE_BITS[name]))
+            else:
+                if attr not in demographic_attrs:
+                    demographic_attrs.append(attr)
+                encoders.append((2, demographic_attrs.index(attr), equals, FEATURE_BITS[name]))
+        self._symptom_flags, self._history_flags = flag_masks['symptoms'], flag_masks['history']
+        self._read_demographics = _tuple_getter(demographic_attrs)
+        self._encoders = tuple(encoders)
+        self._age_cuts = tuple(sorted({operand for _, kind, operand in self._complication_rules if kind == 'age_below'}))
+        # Decision table from rule inputs to the referral reason (or None) before recurrence,
+        # filled on first sight of each input combination
+        self._decisions: Dict[tuple, Optional[str]] = {}
+
+    def encode(self, key: tuple) -> int:
+        """Feature bits for a decision-table key"""
+        features = 0
+        for part, index, equals, bit in self._encoders:
+            if part < 2:
+                present = key[part] & index
+            else:
+                value = key[2][index]
+                present = value.lower() == equals if equals is not None else value
+            if present:
+                features |= bit
+        return features
+
+    def complication_mask(self, features: int, age: int) -> int:
+        mask = 0
+        for bit, kind, operand in self._complication_rules:
+            if kind == 'any':
+                if features & operand:
+                    mask |= bit
+            elif kind == 'all':
+                if features & operand == operand:
+                    mask |= bit
+            elif age < operand:
+                mask |= bit
+        return mask
+
+    def _decide(self, key: tuple, age: int) -> Optional[str]:
+        features = self.encode(key)
+        if not features & self._sufficient and (features & self._qualifying).bit_count() < self._min_qualifying:
+            return self._symptom_reason
+        complications = self.complication_mask(features, age)
+        return self._complication_reasons[complications] if complications else None
+
+    def recurrence_reason(self, history, now: datetime) -> Optional[str]:
+        for days, min_count, reason in self._recurrence:
+            cutoff = now - timedelta(days=days)
+            if min_count is None:
+                latest_completion = history.latest_treatment_completion()
+                if latest_completion and latest_completion >= cutoff:
+                    return reason
+            elif history.utis_since(cutoff) >= min_count:
+                return reason
+        return None
+
+    def select_treatment(self, allergies: List[str]) -> Optional[TreatmentPlan]:
+        allergy_mask = 0
+        for allergy in allergies:
+            allergy_mask |= self._allergy_bits.get(allergy.lower(), 0)
+        for contraindications, plan in self._ladder:
+            if not allergy_mask & contraindications:
+                return TreatmentPlan(**plan)
+        return None
+
+    def evaluate(self, patient_data: PatientData, now: Optional[datetime] = None) -> EligibilityResult:
+        demographics = patient_data.demographics
+        age = demographics.age
+        # Only the age bracket matters to the rules, which keeps the table small
+        key = (patient_data.symptoms.flags & self._symptom_flags, patient_data.history.flags & self._history_flags,
+               self._read_demographics(demographics), bisect_right(self._age_cuts, age))
+        try:
+            reason = self._decisions[key]
+        except KeyError:
+            if len(self._decisions) >= MAX_DECISION_TABLE_SIZE:
+                self._decisions.clear()
+            reason = self._decisions[key] = self._decide(key, age)
+
+        if reason is None:
+            reason = self.recurrence_reason(patient_data.history, now or datetime.now())
+        if reason is not None:
+            return EligibilityResult(status=EligibilityStatus.REQUIRES_REFERRAL, referral_reason=reason)
+
+        return EligibilityResult(status=EligibilityStatus.ELIGIBLE,
+                                 treatment_plan=self.select_treatment(patient_data.history.allergies))
+
+    def possible_treatment_plans(self) -> List[TreatmentPlan]:
+        return [TreatmentPlan(**plan) for _, plan in self._ladder]
+
+    def possible_referral_reasons(self) -> List[str]:
+        reasons = [self._symptom_reason]
+        # Ordered by combination size like ClinicalDecisionEngine, skipping unsatisfiable combinations
+        bits = [bit for bit, _, _ in self._complication_rules]
+        for size in range(1, len(bits) + 1):
+            for combo in combinations(bits, size):
+                mask = sum(combo)
+                if self._satisfiable(mask):
+                    reasons.append(self._complication_reasons[mask])
+        reasons.extend(reason for _, _, reason in self._recurrence)
+        return reasons
+
+    def _satisfiable(self, mask: int) -> bool:
+        # Rules that together require both sexes can never fire at once
+        required = 0
+        for bit, kind, operand in self._complication_rules:
+            if mask & bit and kind == 'all':
+                required |= operand
+        both_sexes = FEATURE_BITS['sex_male'] | FEATURE_BITS['sex_female']
+        return required & both_sexes != both_sexes
+
+
+def load_guideline(path: str) -> CompiledGuideline:
+    with open(path, encoding='utf-8') as f:
+        return CompiledGuideline(json.load(f))
+
+
+class GuidelineRegistry:
+    """Holds the active compiled guideline and replaces it atomically.
+
+    Readers take `current` once per decision, so an evaluation in flight keeps
+    the version it started with while new decisions see the swapped one.
+    """
+    def __init__(self, guideline: CompiledGuideline, path: Optional[str] = None):
+        self._current = guideline
+        self.path = path
+        self._mtime = os.path.getmtime(path) if path else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_GUIDELINE_PATH) -> 'GuidelineRegistry':
+        return cls(load_guideline(path), path)
+
+    @property
+    def current(self) -> CompiledGuideline:
+        return self._current
+
+    @property
+    def version(self) -> str:
+        return self._current.version
+
+    def load(self, path: Optional[str] = None) -> CompiledGuideline:
+        """Compile a guideline file and make it current; a bad file leaves the old version in place"""
+        with self._lock:
+            path = path or self.path
+            if path is None:
+                raise GuidelineError("No guideline path to load")
+            mtime = os.path.getmtime(path)
+            guideline = load_guideline(path)
+            self._current, self.path, self._mtime = guideline, path, mtime
+            return guideline
+
+    def reload_if_changed(self) -> bool:
+        if self.path is None or os.path.getmtime(self.path) == self._mtime:
+            return False
+        self.load()
+        return True
+
+
+_default_registry: Optional[GuidelineRegistry] = None
+
+
+def default_registry() -> GuidelineRegistry:
+    """Process-wide registry for UTI_AGENT_GUIDELINES or the bundled guideline file"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = GuidelineRegistry.from_file(os.getenv('UTI_AGENT_GUIDELINES', DEFAULT_GUIDELINE_PATH))
+    return _default_registry
@@ -1,164 +1,261 @@
-import re
-from typing import Optional
-from models.patient_data import SymptomData, DemographicData, HistoryData
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData
+from core.extraction_schema import (SYMPTOM_SCHEMA, DEMOGRAPHIC_SCHEMA, HISTORY_SCHEMA, PATIENT_SCHEMA,
+                                    SYMPTOM_FIELDS, DEMOGRAPHIC_FIELDS, HISTORY_FIELDS, PATIENT_FIELDS,
+                                    SYSTEMIC_FIELDS, COMPLICATION_FIELDS, schema_for)
+from core import lexicon
+from core.rule_extractor import RuleExtractor
 from utils.llm_client import GeminiClient
 
 
 class InputParser:
-    def __init__(self, llm_client: Optional[GeminiClient] = None):
+    def __init__(self, llm_client: Optional[GeminiClient] = None, rule_extractor: Optional[RuleExtractor] = None,
+                 confidence_threshold: float = 0.8):
         self.llm_client = llm_client
+        # With a rule extractor, only the fields it is not confident about are sent to the LLM
+        self.rule_extractor = rule_extractor
+        self.confidence_threshold = confidence_threshold
+        # How the last message was parsed: 'rules' (no LLM call was needed), 'llm',
+        # 'llm_empty' (the call failed or found nothing) or 'basic'
+        self.last_parser: Optional[str] = None
+        # Which fields of the last message the rules answered and which went to the LLM
+        self.last_route: Optional[Dict[str, List[str]]] = None
+    
+    def _track_llm(self, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+        self.last_parser = 'llm' if extracted_data else 'llm_empty'
+        return extracted_data
+    
+    def _route(self, user_text: str, fields: Sequence[str],
+               expected: Optional[Sequence[str]] = None) -> Tuple[Dict[str, Any], List[str]]:
+        """The values the rules are confident about, and the fields left for the LLM"""
+        if self.rule_extractor is None:
+            self.last_route = None
+            return {}, list(fields)
+        # A targeted extraction answers the question for its own fields
+        extraction = self.rule_extractor.extract(user_text, fields if expected is None else expected)
+        confident = {name: extraction.values[name] for name in fields
+                     if extraction.confidence[name] >= self.confidence_threshold}
+        escalated = [name for name in fields if name not in confident]
+        self.last_route = {'rules': list(confident), 'llm': escalated}
+        if not escalated:
+            self.last_parser = 'rules'
+        return confident, escalated
+    
+    def _extract(self, prompt: str, user_text: str, fields: Sequence[str], schema: Dict[str, Any],
+                 expected: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        values, escalated = self._route(user_text, fields, expected)
+        if escalated:
+            partial = schema if len(escalated) == len(fields) else schema_for(escalated)
+            # Values the LLM returns take precedence over the rules'
+            values.update(self._track_llm(self.llm_client.extract_structured_data(prompt, user_text, partial)))
+        return values
+    
+    async def _extract_async(self, prompt: str, user_text: str, fields: Sequence[str],
+                             schema: Dict[str, Any], expected: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        values, escalated = self._route(user_text, fields, expected)
+        if escalated:
+            partial = schema if len(escalated) == len(fields) else schema_for(escalated)
+            values.update(self._track_llm(await self.llm_client.aio.extract_structured_data(prompt, user_text, partial)))
+        return values
     
     def extract_symptoms(self, user_text: str) -> SymptomData:
         if self.llm_client:
             return self._extract_symptoms_llm(user_text)
         else:
+            self.last_parser = 'basic'
+            return self._extract_symptoms_basic(user_text)
+    
+    async def extract_symptoms_async(self, user_text: str) -> SymptomData:
+        if self.llm_client:
+            extracted_data = await self._extract_async(
+                "Extract urinary symptoms from the following patient description:",
+                user_text,
+                SYMPTOM_FIELDS,
+                SYMPTOM_SCHEMA
+            )
+            return self._symptoms_from_extracted(extracted_data)
+        else:
+            self.last_parser = 'basic'
             return self._extract_symptoms_basic(user_text)
     
     def _extract_symptoms_llm(self, user_text: str) -> SymptomData:
         """Extract symptoms using LLM with structured output"""
-        expected_format = """
-        {
-            "dysuria": boolean (burning pain during urination),
-            "urgency": boolean (sudden strong urge to urinate),
-            "frequency": boolean (urinating more often than usual),
-            "suprapubic_pain": boolean (pain in lower abdomen/bladder area),
-            "hematuria": boolean (blood in urine),
-            "onset": string (when symptoms started: "hours", "1-2 days", "days", "weeks", or "unknown"),
-            "severity": string or null (mild, moderate, severe, or null if not mentioned)
-        }"""
-        
-        extracted_data = self.llm_client.extract_structured_data(
+        extracted_data = self._extract(
             "Extract urinary symptoms from the following patient description:",
             user_text,
-            expected_format
+            SYMPTOM_FIELDS,
+            SYMPTOM_SCHEMA
         )
-        
+        return self._symptoms_from_extracted(extracted_data)
+    
+    def _symptoms_from_extracted(self, extracted_data: Dict[str, Any]) -> SymptomData:
         symptoms = SymptomData()
         if extracted_data:
-            symptoms.dysuria = extracted_data.get('dysuria', False)
-            symptoms.urgency = extracted_data.get('urgency', False) 
-            symptoms.frequency = extracted_data.get('frequency', False)
-            symptoms.suprapubic_pain = extracted_data.get('suprapubic_pain', False)
-            symptoms.hematuria = extracted_data.get('hematuria', False)
-            symptoms.onset = extracted_data.get('onset', '')
+            symptoms.dysuria = bool(extracted_data.get('dysuria'))
+            symptoms.urgency = bool(extracted_data.get('urgency'))
+            symptoms.frequency = bool(extracted_data.get('frequency'))
+            symptoms.suprapubic_pain = bool(extracted_data.get('suprapubic_pain'))
+            symptoms.hematuria = bool(extracted_data.get('hematuria'))
+            for name in SYSTEMIC_FIELDS:
+                setattr(symptoms, name, bool(extracted_data.get(name)))
+            symptoms.onset = extracted_data.get('onset') or ''
             symptoms.severity = extracted_data.get('severity')
         
         return symptoms
     
     def _extract_symptoms_basic(self, user_text: str) -> SymptomData:
-        """Fallback basic keyword extraction"""
-        symptoms = SymptomData()
-        text_lower = user_text.lower()
-        
-        symptoms.dysuria = any(word in text_lower for word in ['burn', 'burning', 'pain', 'hurt', 'sting'])
-        symptoms.urgency = any(word in text_lower for word in ['urgent', 'urgency', 'rush', 'sudden'])
-        symptoms.frequency = any(word in text_lower for word in ['frequent', 'often', 'many times', 'lot'])
-        symptoms.suprapubic_pain = any(word in text_lower for word in ['lower', 'bladder', 'pelvic'])
-        symptoms.hematuria = any(word in text_lower for word in ['blood', 'red', 'pink'])
-        
-        if any(word in text_lower for word in ['today', 'this morning', 'hours']):
-            symptoms.onset = "hours"
-        elif any(word in text_lower for word in ['yesterday', 'day', 'days']):
-            symptoms.onset = "1-2 days"
-        elif any(word in text_lower for word in ['week', 'weeks']):
-            symptoms.onset = "weeks"
-        
-        return symptoms
+        """Fallback lexicon extraction"""
+        return self._symptoms_from_scan(lexicon.scan(user_text))
+    
+    def _symptoms_from_scan(self, found: lexicon.LexiconScan) -> SymptomData:
+        return SymptomData(onset=found.onset, flags=found.symptom_flags)
     
     def extract_demographics(self, user_text: str) -> DemographicData:
         if self.llm_client:
             return self._extract_demographics_llm(user_text)
         else:
+            self.last_parser = 'basic'
+            return self._extract_demographics_basic(user_text)
+    
+    async def extract_demographics_async(self, user_text: str) -> DemographicData:
+        if self.llm_client:
+            extracted_data = await self._extract_async(
+                "Extract demographic information:",
+                user_text,
+                DEMOGRAPHIC_FIELDS,
+                DEMOGRAPHIC_SCHEMA
+            )
+            return self._demographics_from_extracted(extracted_data)
+        else:
+            self.last_parser = 'basic'
             return self._extract_demographics_basic(user_text)
     
     def _extract_demographics_llm(self, user_text: str) -> DemographicData:
         """Extract demographics using LLM"""
-        expected_format = """
-{
-    "age": integer or null (age in years),
-    "sex": string or null ("male" or "female", biological sex),
-    "weight": number or null (weight in kg or lbs),
-    "pregnancy_status": boolean or null (true if pregnant, null if unknown/not applicable)
-}"""
-        
-        extracted_data = self.llm_client.extract_structured_data(
+        extracted_data = self._extract(
             "Extract demographic information:",
             user_text,
-            expected_format
+            DEMOGRAPHIC_FIELDS,
+            DEMOGRAPHIC_SCHEMA
         )
-        
+        return self._demographics_from_extracted(extracted_data)
+    
+    def _demographics_from_extracted(self, extracted_data: Dict[str, Any]) -> DemographicData:
         demographics = DemographicData()
         if extracted_data:
-            demographics.age = extracted_data.get('age', 0)
-            demographics.sex = extracted_data.get('sex', '')
+            demographics.age = extracted_data.get('age') or 0
+            demographics.sex = extracted_data.get('sex') or ''
             demographics.weight = extracted_data.get('weight')
             demographics.pregnancy_status = extracted_data.get('pregnancy_status')
         
         return demographics
     
     def _extract_demographics_basic(self, user_text: str) -> DemographicData:
-        """Fallback basic demographic extraction"""
-        demographics = DemographicData()
-        
-        age_match = re.search(r'\b(\d{1,2})\b', user_text)
-        if age_match:
-            demographics.age = int(age_match.group(1))
-        
-        text_lower = user_text.lower()
-        if any(word in text_lower for word in ['female', 'woman', 'girl', 'f']):
-            demographics.sex = "female"
-        elif any(word in text_lower for word in ['male', 'man', 'boy', 'm']):
-            demographics.sex = "male"
-        
-        return demographics
+        """Fallback lexicon demographic extraction"""
+        return self._demographics_from_scan(lexicon.scan(user_text))
+    
+    def _demographics_from_scan(self, found: lexicon.LexiconScan) -> DemographicData:
+        return DemographicData(age=found.age, sex=found.sex, pregnancy_status=found.pregnant)
     
     def extract_medical_history(self, user_text: str) -> HistoryData:
         if self.llm_client:
             return self._extract_history_llm(user_text)
         else:
+            self.last_parser = 'basic'
+            return self._extract_history_basic(user_text)
+    
+    async def extract_medical_history_async(self, user_text: str) -> HistoryData:
+        if self.llm_client:
+            extracted_data = await self._extract_async(
+                "Extract medical history information:",
+                user_text,
+                HISTORY_FIELDS,
+                HISTORY_SCHEMA
+            )
+            return self._history_from_extracted(extracted_data)
+        else:
+            self.last_parser = 'basic'
             return self._extract_history_basic(user_text)
     
     def _extract_history_llm(self, user_text: str) -> HistoryData:
         """Extract medical history using LLM"""
-        expected_format = """
-{
-    "allergies": array of strings (medication allergies, empty array if none),
-    "current_medications": array of strings (current medications, empty array if none),
-    "recent_antibiotics": boolean (antibiotics in last 4 weeks),
-    "immunocompromised": boolean (immunosuppressed, diabetes, etc.),
-    "previous_utis": array (history of UTIs, can be empty)
-}"""
-        
-        extracted_data = self.llm_client.extract_structured_data(
+        extracted_data = self._extract(
             "Extract medical history information:",
             user_text,
-            expected_format
+            HISTORY_FIELDS,
+            HISTORY_SCHEMA
         )
-        
+        return self._history_from_extracted(extracted_data)
+    
+    def _history_from_extracted(self, extracted_data: Dict[str, Any]) -> HistoryData:
         history = HistoryData()
         if extracted_data:
-            history.allergies = extracted_data.get('allergies', [])
-            history.current_medications = extracted_data.get('current_medications', [])
-            history.recent_antibiotics = extracted_data.get('recent_antibiotics', False)
-            history.immunocompromised = extracted_data.get('immunocompromised', False)
+            history.allergies = extracted_data.get('allergies') or []
+            history.current_medications = extracted_data.get('current_medications') or []
+            history.recent_antibiotics = bool(extracted_data.get('recent_antibiotics'))
+            history.immunocompromised = bool(extracted_data.get('immunocompromised'))
+            for name in COMPLICATION_FIELDS:
+                setattr(history, name, bool(extracted_data.get(name)))
         
         return history
     
     def _extract_history_basic(self, user_text: str) -> HistoryData:
-        """Fallback basic history extraction"""
-        history = HistoryData()
-        text_lower = user_text.lower()
-        
-        if 'no' in text_lower and ('allerg' in text_lower or 'medication' in text_lower):
-            history.allergies = []
-        elif any(word in text_lower for word in ['penicillin', 'sulfa', 'trimethoprim']):
-            if 'penicillin' in text_lower:
-                history.allergies.append('penicillin')
-            if 'sulfa' in text_lower:
-                history.allergies.append('sulfonamides')
-        
+        """Fallback lexicon history extraction"""
+        return self._history_from_scan(lexicon.scan(user_text))
+    
+    def _history_from_scan(self, found: lexicon.LexiconScan) -> HistoryData:
+        history = HistoryData(allergies=found.allergies, current_medications=found.medications)
+        history.allergies_collected = found.allergy_mentioned
         return history
     
+    def extract_patient_data(self, user_text: str, expected: Sequence[str] = ()) -> PatientData:
+        """Extract symptoms, demographics and history in a single pass; `expected` are the fields just asked about"""
+        if self.llm_client:
+            extracted_data = self._extract(
+                "Extract symptoms, demographics and medical history:",
+                user_text,
+                PATIENT_FIELDS,
+                PATIENT_SCHEMA,
+                expected
+            )
+            return self._patient_data_from_extracted(extracted_data)
+        else:
+            self.last_parser = 'basic'
+            return self._extract_patient_data_basic(user_text)
+    
+    async def extract_patient_data_async(self, user_text: str, expected: Sequence[str] = ()) -> PatientData:
+        if self.llm_client:
+            extracted_data = await self._extract_async(
+                "Extract symptoms, demographics and medical history:",
+                user_text,
+                PATIENT_FIELDS,
+                PATIENT_SCHEMA,
+                expected
+            )
+            return self._patient_data_from_extracted(extracted_data)
+        else:
+            self.last_parser = 'basic'
+            return self._extract_patient_data_basic(user_text)
+    
+    def _patient_data_from_extracted(self, extracted_data: Dict[str, Any]) -> PatientData:
+        patient_data = PatientData(
+            symptoms=self._symptoms_from_extracted(extracted_data),
+            demographics=self._demographics_from_extracted(extracted_data),
+            history=self._history_from_extracted(extracted_data)
+        )
+        if extracted_data:
+            patient_data.history.allergies_collected = bool(extracted_data.get('allergies_mentioned'))
+        return patient_data
+    
+    def _extract_patient_data_basic(self, user_text: str) -> PatientData:
+        # One scan serves all three records
+        found = lexicon.scan(user_text)
+        return PatientData(
+            symptoms=self._symptoms_from_scan(found),
+            demographics=self._demographics_from_scan(found),
+            history=self._history_from_scan(found)
+        )
+    
     def validate_extracted_data(self, data) -> bool:
         # Basic validation placeholder
         return True
\ No newline at end of file
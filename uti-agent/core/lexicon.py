@@ -0,0 +1,238 @@
+"""
+Single-pass lexicon matching for the basic parsers.
+
+Every term the basic parsers look for (symptoms, onset, age, sex, pregnancy,
+drug names and allergy or medication cues) is compiled into one regular
+expression with word boundaries, longest terms first. A message is
+scanned once, however many terms the lexicon holds. Negation cues ("no",
+"not", "don't", "without", ...) are matched in the same pass. They negate
+the terms that follow, up to NEGATION_WINDOW words or the end of the clause
+(punctuation, "but"). So "no burning, but it stings" reads as stinging only.
+An exception ("except", "other than", "apart from", "besides") ends the
+scope without ending the clause, so "no allergies except penicillin" records
+penicillin as an allergy.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from models.patient_data import SymptomData
+from core.rule_extractor import ALLERGENS
+
+NEGATION_WINDOW = 5
+
+SYMPTOM_TERMS = {
+    'dysuria': ['burn', 'burns', 'burning', 'burned', 'burnt', 'sting', 'stings', 'stinging', 'pain', 'painful',
+                'hurt', 'hurts', 'hurting', 'dysuria'],
+    'urgency': ['urgent', 'urgency', 'urgently', 'urge', 'rush', 'rushing', 'sudden', 'suddenly'],
+    'frequency': ['frequent', 'frequently', 'frequency', 'often', 'many times', 'a lot', 'all the time', 'constantly'],
+    'suprapubic_pain': ['lower belly', 'lower abdomen', 'lower tummy', 'lower stomach', 'bladder', 'pelvic', 'pelvis',
+                        'suprapubic'],
+    'hematuria': ['blood', 'bloody', 'red', 'pink', 'hematuria'],
+}
+ONSET_TERMS = {
+    'hours': ['today', 'this morning', 'this afternoon', 'this evening', 'tonight', 'last night', 'hour', 'hours'],
+    '1-2 days': ['yesterday', 'day', 'days', 'a day or two', 'couple of days', 'a couple of days'],
+    'weeks': ['week', 'weeks', 'last week', 'month', 'months'],
+}
+# Earlier onsets win when a message mentions several, as in the keyword parser
+ONSET_ORDER = ['hours', '1-2 days', 'days', 'weeks']
+SEX_TERMS = {
+    # Single letters only count as whole words ("30, f"), never inside one
+    'female': ['female', 'woman', 'girl', 'lady', 'f'],
+    'male': ['male', 'man', 'boy', 'guy', 'gentleman', 'm'],
+}
+ALLERGY_CUES = ['allergy', 'allergies', 'allergic', 'nkda', 'reaction', 'react']
+MEDICATION_CUES = ['take', 'takes', 'taking', 'prescribed', 'using', 'medication', 'medications', 'meds']
+# Nouns that are the object of an allergy cue before them ("allergic to any medications"), not cues of their own
+_MEDICATION_NOUNS = {'medication', 'medications', 'meds'}
+
+_NEGATIONS = ['no', 'not', 'never', 'none', 'nor', 'without', 'deny', 'denies', 'denied'] + [
+    verb + suffix for verb in ['do', 'does', 'did', 'have', 'has', 'had', 'is', 'are', 'was', 'were', 'ca', 'could',
+                               'would', 'wo', 'should', 'ai'] for suffix in ("n't", "nt")]
+# Phrases that start with a negation word but do not negate what follows
+_PSEUDO_NEGATIONS = ['not sure', 'not certain', 'no idea', 'not only', 'no doubt']
+_CLAUSE_WORDS = ['but', 'however', 'although', 'though']
+_EXCEPTIONS = ['except', 'other than', 'apart from', 'besides']
+_NUMBER_WORDS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+                 'couple': 2, 'few': 3, 'several': 4}
+
+
+def _build_terms() -> Dict[str, Tuple[str, object]]:
+    """Every word or phrase with its (kind, value); symptom values are SymptomData flag bits, so they OR together"""
+    terms: Dict[str, Tuple[str, object]] = {}
+    for name, words in SYMPTOM_TERMS.items():
+        terms.update({word: ('symptom', SymptomData.FLAG_BITS[name]) for word in words})
+    for onset, words in ONSET_TERMS.items():
+        terms.update({word: ('onset', onset) for word in words})
+    for sex, words in SEX_TERMS.items():
+        terms.update({word: ('sex', sex) for word in words})
+    terms.update({word: ('drug', allergen) for word, allergen in ALLERGENS.items()})
+    terms.update({word: ('allergy_cue', None) for word in ALLERGY_CUES})
+    terms.update({word: ('medication_cue', None) for word in MEDICATION_CUES})
+    terms['pregnant'] = ('pregnant', None)
+    terms.update({word: ('negation', None) for word in _NEGATIONS})
+    terms.update({word: ('pseudo', None) for word in _PSEUDO_NEGATIONS})
+    terms.update({word: ('clause', None) for word in _CLAUSE_WORDS})
+    terms.update({word: ('exception', None) for word in _EXCEPTIONS})
+    return terms
+
+
+TERMS = _build_terms()
+
+
+def _alternation(terms) -> str:
+    """A regex matching any of `terms`, as a prefix trie so each position branches on one character at a time.
+
+    Python's `re` tries the branches of a flat alternation one by one, so this
+    keeps the cost per position flat as the lexicon grows. Optional tails are
+    greedy, so the longest term wins.
+    """
+    root: Dict[str, dict] = {}
+    for term in terms:
+        node = root
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [(r'\s+' if char == ' ' else re.escape(char)) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if '' in node else group
+    return build(root)
+
+
+_COUNT = r"\d{1,3}|an?|one|two|three|four|five|six|seven|(?:a\s+)?(?:couple(?:\s+of)?|few)|several"
+# Alternatives at the same position are tried in order, so durations ("a few hours") come before the
+# terms they start with. Alternatives with inner groups are wrapped in an outer one, so match.lastgroup
+# names the alternative. Everything but punctuation starts at a word, so positions inside a word (or a
+# contraction, the m of i'm) are rejected by the lookbehinds before any alternative is tried.
+PATTERN = re.compile(
+    r"(?P<stop>[.;!?,])"
+    r"|(?<!\w)(?<!\w')(?:"
+    rf"(?P<duration>(?P<count>{_COUNT})\s+(?P<unit>hours?|hrs?|days?|weeks?|wks?|months?)\b)"
+    r"|(?P<age_sex>(?P<compact_age>\d{1,3})\s?(?P<compact_sex>[fm])\b"
+    r"|(?P<compact_sex_first>[fm])\s?[,/]?\s?(?P<compact_age_after>\d{1,3})\b)"
+    r"|(?P<years>\d{1,3})\s*-?\s*(?:years?|yrs?|y/?o)\b"
+    r"|(?:i'm|i am|im|aged?)\s+(?P<cue_age>\d{1,3})\b"
+    r"|(?P<number>\d{1,3})\b"
+    rf"|(?P<term>{_alternation(TERMS)})\b"
+    r")"
+)
+_SPACES = re.compile(r'\s+')
+
+
+@dataclass
+class LexiconScan:
+    """What one pass over a message found; negated terms are left out"""
+    symptom_flags: int = 0
+    onsets: List[str] = field(default_factory=list)
+    age: int = 0
+    sex: str = ""
+    pregnant: Optional[bool] = None
+    allergies: List[str] = field(default_factory=list)
+    medications: List[str] = field(default_factory=list)
+    allergy_mentioned: bool = False
+
+    @property
+    def onset(self) -> str:
+        return min(self.onsets, key=ONSET_ORDER.index) if self.onsets else ""
+
+
+def _duration_onset(count: str, unit: str) -> str:
+    count = count.replace(' of', '').split()[-1]
+    n = int(count) if count.isdigit() else _NUMBER_WORDS.get(count, 3)
+    if unit.startswith('h'):
+        return "hours"
+    if unit.startswith('d'):
+        return "1-2 days" if n <= 2 else "days" if n < 7 else "weeks"
+    return "weeks"
+
+
+def _is_medication(start: int, clause: int, cues: List[Tuple[int, int, bool]]) -> bool:
+    """Whether the cue nearest a drug is about taking it: the last one before it in its clause, else the first
+    after it in its clause ("bactrim is what I take"), else the last one in an earlier clause ("allergic to
+    penicillin, sulfa"). A drug without any cue is read as an allergy, the question the basic parser answers."""
+    same_clause = [cue for cue in cues if cue[1] == clause]
+    before = [cue for cue in same_clause if cue[0] < start]
+    after = [cue for cue in same_clause if cue[0] > start]
+    earlier = [cue for cue in cues if cue[1] < clause]
+    nearest = before[-1] if before else after[0] if after else earlier[-1] if earlier else None
+    return nearest is not None and nearest[2]
+
+
+def scan(text: str) -> LexiconScan:
+    text = text.lower().replace('’', "'")
+    result = LexiconScan()
+    negation_end = -1
+    clause = 0
+    bare_age = 0
+    # Drugs and cues with their clause and position; each drug takes the nearest cue (see _is_medication)
+    drugs: List[Tuple[str, int, int]] = []
+    cues: List[Tuple[int, int, bool]] = []
+
+    for match in PATTERN.finditer(text):
+        group = match.lastgroup
+        if group == 'term':
+            term = match.group('term')
+            kind, value = TERMS.get(term) or TERMS[_SPACES.sub(' ', term)]
+            if kind == 'negation':
+                negation_end = match.end()
+                continue
+            if kind == 'clause':
+                negation_end = -1
+                clause += 1
+                continue
+            if kind == 'exception':
+                # The cues before it still apply to what follows
+                negation_end = -1
+                continue
+            # The scope is counted in words between the cue and the term
+            negated = negation_end >= 0 and text.count(' ', negation_end, match.start()) <= NEGATION_WINDOW
+            if kind == 'symptom':
+                if not negated:
+                    result.symptom_flags |= value
+            elif kind == 'onset':
+                result.onsets.append(value)
+            elif kind == 'sex':
+                if not negated and not result.sex:
+                    result.sex = value
+            elif kind == 'drug':
+                if not negated:
+                    drugs.append((value, clause, match.start()))
+            elif kind == 'allergy_cue':
+                result.allergy_mentioned = True
+                cues.append((match.start(), clause, False))
+            elif kind == 'medication_cue':
+                follows_allergy = bool(cues) and cues[-1][1] == clause and not cues[-1][2]
+                if not (term in _MEDICATION_NOUNS and follows_allergy):
+                    cues.append((match.start(), clause, True))
+            elif kind == 'pregnant':
+                result.pregnant = not negated
+        elif group == 'stop':
+            negation_end = -1
+            clause += 1
+        elif group == 'duration':
+            result.onsets.append(_duration_onset(match.group('count'), match.group('unit')))
+        elif group == 'age_sex':
+            sex = match.group('compact_sex') or match.group('compact_sex_first')
+            result.age = result.age or int(match.group('compact_age') or match.group('compact_age_after'))
+            result.sex = result.sex or ('female' if sex == 'f' else 'male')
+        elif group == 'years':
+            result.age = result.age or int(match.group('years'))
+        elif group == 'cue_age':
+            result.age = result.age or int(match.group('cue_age'))
+        elif group == 'number':
+            bare_age = bare_age or int(match.group('number'))
+
+    if not result.age and 0 < bare_age <= 120:
+        result.age = bare_age
+    for drug, drug_clause, start in drugs:
+        target = result.medications if _is_medication(start, drug_clause, cues) else result.allergies
+        if drug not in target:
+            target.append(drug)
+    return result
@@ -0,0 +1,83 @@
+import logging
+from typing import Iterator
+from rich.console import Console
+from rich.live import Live
+from rich.panel import Panel
+from rich.markdown import Markdown
+
+
+class ConsoleRenderer:
+    """Renders the conversation to a terminal using rich"""
+    def __init__(self, console: Console = None):
+        self.console = console or Console()
+    
+    def render_response(self, response: str):
+        """Display agent response with cyan styling"""
+        self.console.print(self._response_panel(response))
+    
+    def render_response_stream(self, chunks: Iterator[str]) -> str:
+        """Display agent response in a live panel that grows as chunks arrive"""
+        text = ""
+        with Live(self._response_panel(text), console=self.console, refresh_per_second=12) as live:
+            for chunk in chunks:
+                text += chunk
+                live.update(self._response_panel(text))
+        return text
+    
+    def _response_panel(self, response: str) -> Panel:
+        return Panel(
+            Markdown(response),
+            title="UTI Care Agent",
+            border_style="cyan",
+            padding=(1, 1)
+        )
+    
+    def render_user_input(self, user_input: str):
+        """Display user input with blue border"""
+        panel = Panel(
+            user_input,
+            title="You",
+            border_style="blue",
+            padding=(0, 1)
+        )
+        self.console.print(panel)
+    
+    def render_warning(self, message: str):
+        """Display warning message"""
+        self.console.print(f"[yellow]{message}[/yellow]")
+    
+    def render_goodbye(self):
+        """Display goodbye message"""
+        self.console.print("\n[green]Thank you for using the UTI Care Agent. Take care![/green]")
+    
+    def read_input(self) -> str:
+        """Get user input with simple prompt"""
+        try:
+            user_input = self.console.input("\n[blue]You:[/blue] ").strip()
+            return user_input
+        except (EOFError, KeyboardInterrupt):
+            return "quit"
+
+
+class HeadlessRenderer:
+    """No-op renderer for network transports, which return the markdown responses as-is"""
+    def __init__(self):
+        self.logger = logging.getLogger('uti_agent.server')
+    
+    def render_response(self, response: str):
+        pass
+    
+    def render_response_stream(self, chunks: Iterator[str]) -> str:
+        return "".join(chunks)
+    
+    def render_user_input(self, user_input: str):
+        pass
+    
+    def render_warning(self, message: str):
+        self.logger.warning(message)
+    
+    def render_goodbye(self):
+        pass
+    
+    def read_input(self) -> str:
+        raise RuntimeError("HeadlessRenderer cannot read input; messages arrive through the transport")
@@ -1,24 +1,49 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from models.treatment_plan import TreatmentPlan
 from utils.llm_client import GeminiClient
+from core.explanation_library import ExplanationLibrary
 
 
 class ResponseGenerator:
-    def __init__(self, llm_client: Optional[GeminiClient] = None):
+    def __init__(self, llm_client: Optional[GeminiClient] = None, library: Optional[ExplanationLibrary] = None):
         self.llm_client = llm_client
+        self.library = library
+    
     def generate_followup_question(self, missing_data: Dict[str, Any]) -> str:
         if self.llm_client:
             return self._generate_followup_llm(missing_data)
         else:
             return self._generate_followup_basic(missing_data)
     
+    async def generate_followup_question_async(self, missing_data: Dict[str, Any]) -> str:
+        if self.llm_client:
+            return await self.llm_client.aio.generate_conversational_response(
+                context=self._followup_context(missing_data),
+                user_input="Need follow-up information",
+                response_type="followup"
+            )
+        else:
+            return self._generate_followup_basic(missing_data)
+    
+    async def stream_followup_question(self, missing_data: Dict[str, Any]) -> AsyncIterator[str]:
+        if self.llm_client:
+            async for chunk in self.llm_client.aio.generate_conversational_response_stream(
+                context=self._followup_context(missing_data),
+                user_input="Need follow-up information",
+                response_type="followup"
+            ):
+                yield chunk
+        else:
+            yield self._generate_followup_basic(missing_data)
+    
+    def _followup_context(self, missing_data: Dict[str, Any]) -> str:
+        missing_items = list(missing_data.keys())
+        return f"Patient consultation for UTI symptoms. Need to ask about: {', '.join(missing_items)}"
+    
     def _generate_followup_llm(self, missing_data: Dict[str, Any]) -> str:
         """Generate empathetic follow-up questions using LLM"""
-        missing_items = list(missing_data.keys())
-        context = f"Patient consultation for UTI symptoms. Need to ask about: {', '.join(missing_items)}"
-        
         return self.llm_client.generate_conversational_response(
-            context=context,
+            context=self._followup_context(missing_data),
             user_input="Need follow-up information",
             response_type="followup"
         )
@@ -37,13 +62,39 @@ class ResponseGenerator:
             return "Could you provide more details about that?"
     
     def generate_treatment_explanation(self, treatment_plan: TreatmentPlan) -> str:
+        if self.library and (explanation := self.library.get_treatment_explanation(treatment_plan)):
+            return explanation
         if self.llm_client:
             return self._generate_treatment_llm(treatment_plan)
         else:
             return self._generate_treatment_basic(treatment_plan)
     
-    def _generate_treatment_llm(self, treatment_plan: TreatmentPlan) -> str:
-        """Generate empathetic treatment explanation using LLM"""
+    async def generate_treatment_explanation_async(self, treatment_plan: TreatmentPlan) -> str:
+        if self.library and (explanation := self.library.get_treatment_explanation(treatment_plan)):
+            return explanation
+        if self.llm_client:
+            return await self.llm_client.aio.generate_conversational_response(
+                context=self._treatment_context(treatment_plan),
+                user_input="Explain treatment plan",
+                response_type="treatment"
+            )
+        else:
+            return self._generate_treatment_basic(treatment_plan)
+    
+    async def stream_treatment_explanation(self, treatment_plan: TreatmentPlan) -> AsyncIterator[str]:
+        if self.library and (explanation := self.library.get_treatment_explanation(treatment_plan)):
+            yield explanation
+        elif self.llm_client:
+            async for chunk in self.llm_client.aio.generate_conversational_response_stream(
+                context=self._treatment_context(treatment_plan),
+                user_input="Explain treatment plan",
+                response_type="treatment"
+            ):
+                yield chunk
+        else:
+            yield self._generate_treatment_basic(treatment_plan)
+    
+    def _treatment_context(self, treatment_plan: TreatmentPlan) -> str:
         treatment_info = f"""
             Medication: {treatment_plan.medication}
             Dosage: {treatment_plan.dosage}
@@ -53,10 +104,12 @@ class ResponseGenerator:
             Follow-up: {treatment_plan.follow_up}
         """
         
-        context = f"UTI treatment recommendation: {treatment_info}"
-        
+        return f"UTI treatment recommendation: {treatment_info}"
+    
+    def _generate_treatment_llm(self, treatment_plan: TreatmentPlan) -> str:
+        """Generate empathetic treatment explanation using LLM"""
         return self.llm_client.generate_conversational_response(
-            context=context,
+            context=self._treatment_context(treatment_plan),
             user_input="Explain treatment plan",
             response_type="treatment"
         )
@@ -86,17 +139,45 @@ This recommendation is based on clinical guidelines for uncomplicated UTIs. Alwa
         return explanation
     
     def generate_referral_message(self, reason: str) -> str:
+        if self.library and (message := self.library.get_referral_message(reason)):
+            return message
         if self.llm_client:
             return self._generate_referral_llm(reason)
         else:
             return self._generate_referral_basic(reason)
     
+    async def generate_referral_message_async(self, reason: str) -> str:
+        if self.library and (message := self.library.get_referral_message(reason)):
+            return message
+        if self.llm_client:
+            return await self.llm_client.aio.generate_conversational_response(
+                context=self._referral_context(reason),
+                user_input="Need referral recommendation",
+                response_type="referral"
+            )
+        else:
+            return self._generate_referral_basic(reason)
+    
+    async def stream_referral_message(self, reason: str) -> AsyncIterator[str]:
+        if self.library and (message := self.library.get_referral_message(reason)):
+            yield message
+        elif self.llm_client:
+            async for chunk in self.llm_client.aio.generate_conversational_response_stream(
+                context=self._referral_context(reason),
+                user_input="Need referral recommendation",
+                response_type="referral"
+            ):
+                yield chunk
+        else:
+            yield self._generate_referral_basic(reason)
+    
+    def _referral_context(self, reason: str) -> str:
+        return f"Patient needs referral to healthcare provider. Reason: {reason}"
+    
     def _generate_referral_llm(self, reason: str) -> str:
         """Generate empathetic referral message using LLM"""
-        context = f"Patient needs referral to healthcare provider. Reason: {reason}"
-        
         return self.llm_client.generate_conversational_response(
-            context=context,
+            context=self._referral_context(reason),
             user_input="Need referral recommendation",
             response_type="referral"
         )
@@ -0,0 +1,238 @@
+"""
+Deterministic extraction with per-field confidence, run before the LLM.
+
+Most replies to "what is your age and sex?", "when did it start?" or "any
+allergies?" are short and formulaic. RuleExtractor reads them with
+anchored patterns and reports, for every extraction field, a value and a
+confidence:
+- MATCHED: found by a pattern that says who it is about ("I'm 34",
+  "allergic to penicillin"), or by any pattern in a fully explained message
+- ABSENT: not mentioned, in a message where something was matched and every
+  other word is filler, so the default (false, empty, null) is known to be right
+- PARTIAL: found by a loose pattern ("female", a bare number) in a message
+  with other content, which may be about someone else; a bare number is
+  always PARTIAL unless the question being answered asked for the age, as
+  "about 2" after "how long?" is a duration
+- UNKNOWN: not found in a message with unexplained words or with nothing
+  matched at all ("yes", "ok"), or conflicting matches ("male ... female",
+  two ages, "I take X and am allergic to Y")
+
+InputParser sends only the fields below its threshold to the LLM.
+"""
+import bisect
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+from core.extraction_schema import PATIENT_FIELDS
+
+MATCHED = 0.95
+ABSENT = 0.9
+PARTIAL = 0.5
+UNKNOWN = 0.0
+
+# Words that carry no clinical information in a reply to a direct question
+FILLER = frozenset("""
+    a about after all also am an and any anything around at be been but do don't dont for from had has have hello hey
+    hi i i'd i'm i've im is it it's its ive just me my n't no none nope not nothing of ok okay on only or please really
+    since so started start starting began begun sure symptoms that the they them this thank thanks to uh um was well
+    yeah yep yes you ago old year years aged age moment
+""".split())
+
+_NUMBER_WORDS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'couple': 2, 'a couple': 2, 'a couple of': 2, 'couple of': 2,
+                 'three': 3, 'few': 3, 'a few': 3, 'four': 4, 'several': 4, 'five': 5, 'six': 6, 'seven': 7}
+
+_DURATION = re.compile(
+    r"\b(?P<n>\d{1,3}|an?|one|two|three|four|five|six|seven|a few|few|several|a couple(?: of)?|couple of)"
+    r"\s+(?P<unit>hours?|hrs?|days?|weeks?|wks?|months?)(?:\s+ago)?\b"
+)
+_ONSET_WORDS = [
+    (re.compile(r"\b(?:this|earlier this) (?:morning|afternoon|evening)\b|\btoday\b|\btonight\b|\blast night\b"), "hours"),
+    (re.compile(r"\byesterday\b|\ba day or two\b|\bday before yesterday\b"), "1-2 days"),
+    (re.compile(r"\blast week\b|\bover a week\b"), "weeks"),
+]
+
+_AGE_STRONG = [
+    re.compile(r"\b(\d{1,3})\s*(?:-\s*)?(?:years?|yrs?)(?:\s*-?\s*old)?\b"),
+    re.compile(r"\b(\d{1,3})\s*(?:y/?o|yo)\b"),
+    re.compile(r"\b(?:i'm|i am|im|aged?|age is)\s*:?\s*(\d{1,3})\b"),
+]
+_AGE_BARE = re.compile(r"\b(\d{1,3})\b")
+# "34f", "34 m"
+_AGE_SEX = re.compile(r"\b(\d{1,3})\s*([fm])\b")
+
+_FEMALE = r"female|woman|girl|lady"
+_MALE = r"male|man|boy|guy|gentleman"
+_SEX_STRONG = re.compile(
+    r"\b(?:i'm|i am|im)\s+(?:an?\s+)?(?:\d{1,3}\s*(?:-?\s*(?:years?|yrs?)\s*-?\s*old|y/?o|yo)?\s*,?\s*(?:and\s+)?)?"
+    rf"({_FEMALE}|{_MALE})\b"
+)
+_SEX_LOOSE = re.compile(rf"\b({_FEMALE}|{_MALE})\b")
+
+_NEGATION = r"(?:no|not|never|n't|without)"
+# A negation covers the terms after it, up to NEGATION_WINDOW words or the end of the clause, as in core.lexicon
+NEGATION_WINDOW = 5
+_NEGATION_CUE = re.compile(r"\b(?:no|not|never|nor|without|den(?:y|ies|ied))\b|n't\b")
+_CLAUSE_BREAK = re.compile(r"[.;!?,]|\b(?:but|however|although|though)\b")
+# The verbs of core.lexicon's medication cues; "any medications" is left out, as it also follows "allergic to"
+_MEDICATION_CUE = re.compile(r"\b(?:tak(?:e|es|ing)|took|prescribed|using|(?:i'm|i am|im|currently) on)\b")
+_PREGNANT = re.compile(r"\b(?:(i'm|i am|im)\s+)?(?:(not|n't)\s+)?(?:currently\s+)?pregnant\b")
+
+# Allergens in the guideline's vocabulary, so the drug ladder recognises them
+ALLERGENS = {
+    'penicillin': 'penicillin', 'penicillins': 'penicillin', 'amoxicillin': 'amoxicillin',
+    'sulfa': 'sulfonamides', 'sulpha': 'sulfonamides', 'sulfonamide': 'sulfonamides', 'sulfonamides': 'sulfonamides',
+    'sulfamethoxazole': 'sulfamethoxazole', 'trimethoprim': 'trimethoprim', 'septra': 'tmp/smx', 'bactrim': 'tmp/smx',
+    'nitrofurantoin': 'nitrofurantoin', 'macrobid': 'nitrofurantoin', 'fosfomycin': 'fosfomycin',
+}
+_ALLERGEN = re.compile(r"\b(" + "|".join(sorted(ALLERGENS, key=len, reverse=True)) + r")(?:\s+(?:drugs?|antibiotics?|medications?))?\b")
+_NO_ALLERGIES = re.compile(
+    rf"\b(?:{_NEGATION}|don't have any|do not have any|nkda|nil)\s+(?:known\s+)?(?:drug\s+|medication\s+)?allerg(?:y|ies)\b"
+    r"|\bnot allergic to (?:anything|any (?:medications?|drugs|medicines?))\b|\bnkda\b"
+)
+_ALLERGIC = re.compile(r"\ballerg(?:ic|y|ies)\b(?:\s+to\b)?")
+_NO_MEDICATIONS = re.compile(
+    rf"\b(?:{_NEGATION}|not on any|not taking any|don't take any|do not take any)\s+(?:other\s+|current\s+|regular\s+)?"
+    r"(?:medications?|meds|medicines?|drugs|tablets|pills)\b"
+)
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+@dataclass
+class RuleExtraction:
+    values: Dict[str, Any]
+    confidence: Dict[str, float]
+    # Words neither matched nor filler; while any remain, unmatched fields are UNKNOWN
+    unexplained: List[str] = field(default_factory=list)
+
+    def confident(self, threshold: float) -> Dict[str, Any]:
+        return {name: self.values[name] for name, score in self.confidence.items() if score >= threshold}
+
+
+def _default(name: str) -> Any:
+    if name in ('allergies', 'current_medications'):
+        return []
+    if name in ('age', 'sex', 'weight', 'pregnancy_status', 'onset', 'severity'):
+        return None
+    return False
+
+
+def _negated(text: str, start: int) -> bool:
+    """Whether a negation cue earlier in the same clause reaches the term at `start`"""
+    clause_start = max((match.end() for match in _CLAUSE_BREAK.finditer(text, 0, start)), default=0)
+    words = _WORD.findall(text, clause_start, start)
+    return any(_NEGATION_CUE.search(word) for word in words[-(NEGATION_WINDOW + 1):])
+
+
+def _duration_onset(count: str, unit: str) -> str:
+    n = int(count) if count.isdigit() else _NUMBER_WORDS.get(count, 3)
+    if unit.startswith('h'):
+        return "hours"
+    if unit.startswith('d'):
+        return "1-2 days" if n <= 2 else "days" if n < 7 else "weeks"
+    return "weeks"
+
+
+class RuleExtractor:
+    """Anchored patterns for the replies the LLM is least needed for"""
+    def extract(self, text: str, expected: Iterable[str] = ()) -> RuleExtraction:
+        """`expected` names the fields the pending question asked for"""
+        expected = set(expected)
+        text = text.lower().replace('’', "'")
+        # Matched spans are blanked out, so later patterns and the filler check only see what is left
+        rest = list(text)
+        found: Dict[str, List[Tuple[Any, bool]]] = {}
+
+        def masked() -> str:
+            return ''.join(rest)
+
+        def consume(match: re.Match, group: int = 0):
+            start, end = match.span(group)
+            rest[start:end] = ' ' * (end - start)
+
+        def add(name: str, value: Any, strong: bool, match: re.Match, group: int = 0):
+            found.setdefault(name, []).append((value, strong))
+            consume(match, group)
+
+        for match in _DURATION.finditer(text):
+            add('onset', _duration_onset(match.group('n'), match.group('unit')), True, match)
+        for pattern, value in _ONSET_WORDS:
+            for match in pattern.finditer(text):
+                add('onset', value, True, match)
+
+        for match in _AGE_SEX.finditer(masked()):
+            add('age', int(match.group(1)), True, match)
+            add('sex', 'female' if match.group(2) == 'f' else 'male', True, match)
+        for match in _SEX_STRONG.finditer(masked()):
+            # Only the sex word is consumed; the age inside the span is read next
+            add('sex', self._sex(match.group(1)), True, match, 1)
+        for pattern in _AGE_STRONG:
+            for match in pattern.finditer(masked()):
+                add('age', int(match.group(1)), True, match)
+        for match in _SEX_LOOSE.finditer(masked()):
+            add('sex', self._sex(match.group(1)), False, match)
+        for match in _AGE_BARE.finditer(masked()):
+            add('age', int(match.group(1)), False, match)
+
+        for match in _PREGNANT.finditer(text):
+            add('pregnancy_status', match.group(2) is None, match.group(1) is not None, match)
+
+        for match in _NO_ALLERGIES.finditer(text):
+            add('allergies', (), True, match)
+            add('allergies_mentioned', True, True, match)
+        allergic = list(_ALLERGIC.finditer(masked()))
+        allergens = list(_ALLERGEN.finditer(text))
+        # "not allergic to sulfa", "penicillin but not sulfa": a negated allergen is read, but not recorded
+        negated = {match.start() for match in allergens if _negated(text, match.start())}
+        if allergic:
+            for match in allergic:
+                add('allergies_mentioned', True, True, match)
+            for match in allergens:
+                if match.start() in negated:
+                    consume(match)
+                else:
+                    add('allergies', (ALLERGENS[match.group(1)],), True, match)
+        for match in _NO_MEDICATIONS.finditer(text):
+            add('current_medications', (), True, match)
+        # Which drugs are taken and which are allergies is left to the LLM when the cues share a clause
+        breaks = [match.end() for match in _CLAUSE_BREAK.finditer(text)]
+        medication_clauses = {bisect.bisect_right(breaks, match.start()) for match in _MEDICATION_CUE.finditer(text)}
+        mixed = allergic and any(bisect.bisect_right(breaks, match.start()) in medication_clauses
+                                 for match in allergic + allergens)
+
+        unexplained = [word for word in _WORD.findall(masked()) if word not in FILLER]
+        values, confidence = {}, {}
+        for name in PATIENT_FIELDS:
+            matches = found.get(name)
+            if not matches:
+                values[name] = _default(name)
+                # A reply of filler alone ("yes", "no") answers nothing the rules can place
+                confidence[name] = UNKNOWN if unexplained or not found else ABSENT
+                continue
+            if name == 'allergies':
+                # Named allergens add up; "no allergies" next to a named one is a contradiction
+                named = sorted({allergen for value, _ in matches for allergen in value})
+                values[name] = named
+                contradiction = bool(allergens) and any(not value for value, _ in matches)
+                confidence[name] = UNKNOWN if contradiction else MATCHED
+                continue
+            distinct = {value for value, _ in matches}
+            if len(distinct) > 1 or (name == 'age' and not 0 < next(iter(distinct)) <= 120):
+                values[name], confidence[name] = _default(name), UNKNOWN
+                continue
+            value = next(iter(distinct))
+            values[name] = list(value) if isinstance(value, tuple) else value
+            strong = any(strong for _, strong in matches)
+            if name == 'age' and not strong and name not in expected:
+                confidence[name] = PARTIAL
+            else:
+                confidence[name] = MATCHED if strong or not unexplained else PARTIAL
+        # An allergy without a drug we know, or one that only names drugs it is not, is left to the LLM
+        if allergic and not found.get('allergies') and (negated or not allergens):
+            confidence['allergies'] = UNKNOWN
+        if mixed:
+            confidence['allergies'] = confidence['current_medications'] = UNKNOWN
+        return RuleExtraction(values, confidence, unexplained)
+
+    @staticmethod
+    def _sex(word: str) -> str:
+        return "female" if re.fullmatch(_FEMALE, word) else "male"
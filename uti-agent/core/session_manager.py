@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, AsyncIterator
+from core.conversation import ConversationManager, WELCOME_MESSAGE
+from core.renderer import HeadlessRenderer
+from core.explanation_library import ExplanationLibrary
+from core.clinical_engine import ClinicalDecisionEngine
+from core.guidelines import GuidelineRegistry, default_registry
+from core.session_store import SessionStore
+from core.session_registry import SessionRegistry
+from utils.llm_client import GeminiClient
+from utils.logger import EvaluationLogger
+from utils.audit_log import AuditLog
+from utils.tracing import NULL_TRACER, STAGES, Tracer
+from utils.token_ledger import TokenLedger
+
+
+class SessionNotFoundError(KeyError):
+    pass
+
+
+class ServerBusyError(RuntimeError):
+    pass
+
+
+class SessionExistsError(ValueError):
+    pass
+
+
+@dataclass
+class TurnResult:
+    session_id: str
+    response: str
+    state: str
+    complete: bool
+    ttft_seconds: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'session_id': self.session_id,
+            'response': self.response,
+            'state': self.state,
+            'complete': self.complete,
+            'ttft_ms': round(self.ttft_seconds * 1000, 1) if self.ttft_seconds is not None else None
+        }
+
+
+class _Session:
+    __slots__ = ('manager', 'lock', 'last_used', 'size', 'active')
+
+    def __init__(self, manager: ConversationManager):
+        self.manager = manager
+        self.lock = asyncio.Lock()
+        self.last_used = 0.0
+        self.size = manager.estimated_bytes()
+        # Turns queued or running; the registry never evicts an active session
+        self.active = 0
+
+
+class SessionManager:
+    """Hosts many concurrent consultations keyed by session id.
+
+    - Turns for one session are serialized by a per-session lock.
+    - At most `max_concurrency` turns are processed at once across all sessions.
+    - Once `max_pending` turns are queued or running, new turns are rejected
+      with ServerBusyError so callers can shed load instead of piling up.
+    - Idle sessions, and the least recently used ones beyond `max_hot_sessions`
+      or `memory_budget_bytes`, are kept only as dormant state and rehydrated
+      on their next message. Dormant state is dropped after `dormant_seconds`.
+    - `max_sessions` caps the hot sessions only, so abandoned sessions never
+      hold a slot once they have gone dormant.
+    """
+    def __init__(self, max_sessions: int = 1000, max_concurrency: int = 64, max_pending: int = 256,
+                 enable_llm: bool = True, llm_client: Optional[GeminiClient] = None,
+                 guidelines: Optional[GuidelineRegistry] = None, store: Optional[SessionStore] = None,
+                 max_hot_sessions: int = 1000, idle_seconds: float = 900.0,
+                 memory_budget_bytes: int = 256 * 1024 * 1024, dormant_seconds: float = 24 * 3600.0,
+                 evaluation_logger: Optional[EvaluationLogger] = None, audit_log: Optional[AuditLog] = None,
+                 tracer: Optional[Tracer] = None, token_ledger: Optional[TokenLedger] = None, cascade: bool = True):
+        self.max_sessions = max_sessions
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.logger = logging.getLogger('uti_agent.server')
+
+        # One client is shared by every session so connections are pooled
+        self.llm_client = llm_client
+        if enable_llm and llm_client is None:
+            try:
+                self.llm_client = GeminiClient(api_key=os.getenv('GOOGLE_API_KEY'))
+            except ValueError as e:
+                self.logger.warning(f"{e} Falling back to basic parsing without LLM integration.")
+        # Sessions check the client's ledger before each turn and drop to the basic parsers once over budget
+        if token_ledger is not None and self.llm_client is not None:
+            self.llm_client.ledger = token_ledger
+
+        # Loaded once and shared, so every session serves the same library version
+        self.library = ExplanationLibrary.load_default()
+        # Sessions read the registry per decision, so reloading it switches every session at once
+        self.guidelines = guidelines or default_registry()
+        # Every decision is appended to the audit log before the patient sees it
+        self.clinical_engine = ClinicalDecisionEngine(self.guidelines, audit_log=audit_log)
+
+        # Sessions missing from memory (after a restart, or owned by another worker) resume from here
+        self.store = store
+        self.resumed = 0
+        self.evaluation_logger = evaluation_logger
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.cascade = cascade
+
+        self.registry = SessionRegistry(max_hot_sessions, idle_seconds, memory_budget_bytes,
+                                        dormant_seconds=dormant_seconds)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending = 0
+
+    def create_session(self, session_id: Optional[str] = None) -> TurnResult:
+        # Idle sessions go dormant first, so they do not count against the limit
+        self.registry.enforce()
+        if self.registry.hot_count >= self.max_sessions:
+            raise ServerBusyError(f"Session limit reached ({self.max_sessions})")
+
+        if not session_id:
+            session_id = uuid.uuid4().hex
+        elif session_id in self.registry or (self.store is not None and self.store.load(session_id) is not None):
+            raise SessionExistsError(f"Session {session_id} already exists")
+
+        manager = ConversationManager(session_id=session_id, **self._manager_options())
+        manager.persist()
+        self.registry.add(session_id, _Session(manager))
+        self.registry.enforce()
+        return TurnResult(session_id, WELCOME_MESSAGE, manager.state.value, False)
+
+    def _manager_options(self) -> Dict[str, Any]:
+        return {
+            'enable_llm': False,
+            'llm_client': self.llm_client,
+            'renderer': HeadlessRenderer(),
+            'library': self.library,
+            'clinical_engine': self.clinical_engine,
+            'session_store': self.store,
+            'evaluation_logger': self.evaluation_logger,
+            'tracer': self.tracer,
+            'cascade': self.cascade
+        }
+
+    def _lookup(self, session_id: str) -> _Session:
+        """The hot session, rehydrating it from its dormant record or the store if needed"""
+        session = self.registry.get_hot(session_id)
+        if session is not None:
+            return session
+        record = self.registry.take_dormant(session_id)
+        if record is None and self.store is not None:
+            record = self.store.load(session_id)
+            if record is not None:
+                if self.registry.hot_count >= self.max_sessions:
+                    raise ServerBusyError(f"Session limit reached ({self.max_sessions})")
+                self.resumed += 1
+        if record is None:
+            raise SessionNotFoundError(session_id)
+        session = _Session(ConversationManager.resume(record, **self._manager_options()))
+        self.registry.add(session_id, session)
+        return session
+
+    def get_session(self, session_id: str) -> ConversationManager:
+        return self._lookup(session_id).manager
+
+    def end_session(self, session_id: str):
+        known = session_id in self.registry
+        session = self.registry.remove(session_id)
+        if not known and (self.store is None or self.store.load(session_id) is None):
+            raise SessionNotFoundError(session_id)
+        if session is not None:
+            session.manager.cancel_speculation()
+        if self.llm_client is not None:
+            self.llm_client.ledger.forget(session_id)
+        if self.store is not None:
+            self.store.delete(session_id)
+
+    def close(self):
+        """Cancel background work and make every saved turn durable"""
+        for session in self.registry.hot_sessions():
+            session.manager.cancel_speculation()
+        if self.store is not None:
+            self.store.close()
+        if self.evaluation_logger is not None:
+            self.evaluation_logger.flush()
+        if self.clinical_engine.audit_log is not None:
+            self.clinical_engine.audit_log.close()
+
+    def _admit(self, session_id: str) -> _Session:
+        session = self._lookup(session_id)
+        if self._pending >= self.max_pending:
+            raise ServerBusyError("Too many requests in flight")
+        return session
+
+    def _turn_result(self, manager: ConversationManager, response: str) -> TurnResult:
+        return TurnResult(manager.session_id, response, manager.state.value, manager.is_complete(), manager.last_ttft_seconds)
+
+    async def handle_message(self, session_id: str, message: str) -> TurnResult:
+        session = self._admit(session_id)
+        self._pending += 1
+        session.active += 1
+        try:
+            async with session.lock:
+                async with self._semaphore:
+                    response = await session.manager.process_input_async(message)
+                    return self._turn_result(session.manager, response)
+        finally:
+            self._pending -= 1
+            self._release(session)
+
+    async def handle_message_stream(self, session_id: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield {'delta': text} events as the reply is generated, then a final summary event"""
+        session = self._admit(session_id)
+        self._pending += 1
+        session.active += 1
+        try:
+            async with session.lock:
+                async with self._semaphore:
+                    chunks = []
+                    async for chunk in session.manager.process_input_stream_async(message):
+                        chunks.append(chunk)
+                        yield {'delta': chunk}
+                    summary = self._turn_result(session.manager, "".join(chunks)).to_dict()
+                    yield {'done': True, **summary}
+        finally:
+            self._pending -= 1
+            self._release(session)
+
+    def _release(self, session: _Session):
+        session.active -= 1
+        self.registry.resize(session, session.manager.estimated_bytes())
+        self.registry.enforce()
+
+    def evict_idle(self):
+        """Squeeze idle sessions down to their dormant state; called periodically by the server"""
+        self.registry.enforce()
+
+    def reload_guidelines(self, path: Optional[str] = None) -> str:
+        """Compile and activate a guideline file; turns already deciding finish on the old version"""
+        previous = self.guidelines.version
+        guideline = self.guidelines.load(path)
+        self.logger.info(f"Guidelines {previous} -> {guideline.version} from {self.guidelines.path}")
+        return guideline.version
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            'sessions': len(self.registry),
+            'pending': self._pending,
+            'max_sessions': self.max_sessions,
+            'max_concurrency': self.max_concurrency,
+            'max_pending': self.max_pending,
+            **self.registry.stats(),
+            'guideline_version': self.guidelines.version
+        }
+        if self.store is not None:
+            stats['resumed_sessions'] = self.resumed
+        if self.evaluation_logger is not None:
+            writer = self.evaluation_logger.writer
+            stats['log_records'] = {'written': writer.written, 'dropped': writer.dropped}
+        if self.llm_client is not None:
+            stats['extraction_cache'] = self.llm_client.cache.stats.to_dict()
+            stats['tokens'] = self.llm_client.ledger.stats()
+        if self.tracer.enabled:
+            stats['stage_latency_ms'] = {
+                stage: {'count': histogram.count, 'p50': _ms(histogram.quantile(0.5)), 'p99': _ms(histogram.quantile(0.99))}
+                for stage, histogram in ((stage, self.tracer.stage_histogram(stage)) for stage in STAGES)
+                if histogram.count
+            }
+        return stats
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
@@ -0,0 +1,148 @@
+"""
+Memory-bounded registry of live sessions.
+
+Recently active sessions stay hot: a full ConversationManager, kept in LRU
+order. A session that has been idle longer than `idle_seconds`, or that falls
+off the end of the LRU order while the hot set is over its session count or
+memory budget, is squeezed down to a dormant SessionRecord. The record holds
+only the conversation state and the encoded PatientData, and the session is
+rehydrated from it on its next message. Dormant records are dropped once they
+have gone untouched for `dormant_seconds`; a session store, if configured,
+still holds them.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from core.session_store import SessionRecord
+from models.patient_data import SNAPSHOT_RECORDS
+
+# Rough in-memory cost of a dormant record beyond its encoded patient data
+DORMANT_OVERHEAD_BYTES = 200
+
+
+class SessionRegistry:
+    """Hot sessions in LRU order plus dormant records for the evicted ones.
+
+    Sessions are objects with `manager`, `last_used`, `size` and `active`
+    attributes; a session with turns queued or running (`active` > 0) is never
+    evicted.
+    """
+    def __init__(self, max_hot: int = 1000, idle_seconds: float = 900.0,
+                 memory_budget_bytes: int = 256 * 1024 * 1024, clock: Callable[[], float] = time.monotonic,
+                 dormant_seconds: float = 24 * 3600.0):
+        self.max_hot = max_hot
+        self.idle_seconds = idle_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self.clock = clock
+        self.dormant_seconds = dormant_seconds
+
+        self._hot: 'OrderedDict[str, Any]' = OrderedDict()
+        # Dormant records with the time they were evicted, oldest first
+        self._dormant: 'OrderedDict[str, Tuple[SessionRecord, float]]' = OrderedDict()
+        self.hot_bytes = 0
+        self.dormant_bytes = 0
+        self.evictions = {'idle': 0, 'memory': 0, 'capacity': 0}
+        self.rehydrations = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._hot) + len(self._dormant)
+
+    @property
+    def hot_count(self) -> int:
+        return len(self._hot)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._hot or session_id in self._dormant
+
+    def hot_sessions(self):
+        return list(self._hot.values())
+
+    def get_hot(self, session_id: str) -> Optional[Any]:
+        session = self._hot.get(session_id)
+        if session is not None:
+            self._hot.move_to_end(session_id)
+            session.last_used = self.clock()
+        return session
+
+    def take_dormant(self, session_id: str) -> Optional[SessionRecord]:
+        """Remove and return a dormant record so the caller can rehydrate it"""
+        entry = self._dormant.pop(session_id, None)
+        if entry is None:
+            return None
+        self.dormant_bytes -= _record_size(entry[0])
+        self.rehydrations += 1
+        return entry[0]
+
+    def add(self, session_id: str, session: Any):
+        session.last_used = self.clock()
+        self._hot[session_id] = session
+        self.hot_bytes += session.size
+
+    def resize(self, session: Any, size: int):
+        """Record a session's new footprint after a turn"""
+        if self._hot.get(session.manager.session_id) is session:
+            self.hot_bytes += size - session.size
+        session.size = size
+
+    def remove(self, session_id: str) -> Optional[Any]:
+        """Forget a session; returns the hot session if it was in memory"""
+        session = self._hot.pop(session_id, None)
+        if session is not None:
+            self.hot_bytes -= session.size
+        entry = self._dormant.pop(session_id, None)
+        if entry is not None:
+            self.dormant_bytes -= _record_size(entry[0])
+        return session
+
+    def enforce(self):
+        """Expire old dormant records, evict idle sessions, then least recently used ones until within count and memory limits"""
+        now = self.clock()
+        dormant_cutoff = now - self.dormant_seconds
+        for session_id, (record, evicted_at) in list(self._dormant.items()):
+            if evicted_at > dormant_cutoff:
+                break
+            del self._dormant[session_id]
+            self.dormant_bytes -= _record_size(record)
+            self.expired += 1
+
+        cutoff = now - self.idle_seconds
+        for session_id, session in list(self._hot.items()):
+            if session.last_used > cutoff:
+                break
+            self._evict(session_id, session, 'idle')
+
+        for session_id, session in list(self._hot.items()):
+            if len(self._hot) <= self.max_hot and self.hot_bytes <= self.memory_budget_bytes:
+                break
+            self._evict(session_id, session, 'capacity' if len(self._hot) > self.max_hot else 'memory')
+
+    def _evict(self, session_id: str, session: Any, reason: str):
+        if session.active:
+            return
+        record = session.manager.dormant_record()
+        session.manager.cancel_speculation()
+        del self._hot[session_id]
+        self.hot_bytes -= session.size
+        self._dormant[session_id] = (record, self.clock())
+        self.dormant_bytes += _record_size(record)
+        self.evictions[reason] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hot = len(self._hot)
+        return {
+            'hot_sessions': hot,
+            'dormant_sessions': len(self._dormant),
+            'hot_bytes': self.hot_bytes,
+            'dormant_bytes': self.dormant_bytes,
+            'bytes_per_hot_session': round(self.hot_bytes / hot) if hot else 0,
+            'bytes_per_dormant_session': round(self.dormant_bytes / len(self._dormant)) if self._dormant else 0,
+            'memory_budget_bytes': self.memory_budget_bytes,
+            'evictions': dict(self.evictions),
+            'rehydrations': self.rehydrations,
+            'expired_sessions': self.expired
+        }
+
+
+def _record_size(record: SessionRecord) -> int:
+    return DORMANT_OVERHEAD_BYTES + sum(len(getattr(record, name) or b'') for name in SNAPSHOT_RECORDS)
@@ -0,0 +1,217 @@
+"""
+Durable conversation state, so sessions survive restarts and can move between workers.
+
+After every turn ConversationManager hands its store a SessionRecord holding
+the conversation state and the PatientData sub-records that changed that turn.
+SQLiteSessionStore queues records in memory, coalesces repeated turns of the
+same session, and writes them from a background thread in one transaction
+per batch, so saving adds no disk I/O to the request path. A session that is
+not in memory is rebuilt from its stored record on its next message.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+from models.patient_data import PatientSnapshot, SNAPSHOT_RECORDS
+
+
+@dataclass(frozen=True)
+class SessionRecord:
+    """Stored session state; a sub-record left as None is unchanged since the last save"""
+    session_id: str
+    state: str
+    symptoms: Optional[bytes] = None
+    demographics: Optional[bytes] = None
+    history: Optional[bytes] = None
+    turn: int = 0
+    updated_at: float = 0.0
+
+    @classmethod
+    def from_snapshot(cls, state: str, snapshot: PatientSnapshot, turn: int,
+                      previous: Optional[PatientSnapshot] = None) -> 'SessionRecord':
+        changed = snapshot.changed_records(previous)
+        return cls(
+            session_id=snapshot.session_id,
+            state=state,
+            turn=turn,
+            updated_at=time.time(),
+            **{name: getattr(snapshot, name) for name in changed}
+        )
+
+    def merged(self, delta: 'SessionRecord') -> 'SessionRecord':
+        """This record with a later delta applied on top"""
+        changes = {name: getattr(delta, name) for name in SNAPSHOT_RECORDS if getattr(delta, name) is not None}
+        return replace(self, state=delta.state, turn=delta.turn, updated_at=delta.updated_at, **changes)
+
+    @property
+    def complete(self) -> bool:
+        return all(getattr(self, name) is not None for name in SNAPSHOT_RECORDS)
+
+    def snapshot(self) -> PatientSnapshot:
+        return PatientSnapshot(self.symptoms, self.demographics, self.history, session_id=self.session_id)
+
+
+class SessionStore:
+    """Interface for persisting SessionRecords"""
+    def save(self, record: SessionRecord):
+        raise NotImplementedError
+
+    def load(self, session_id: str) -> Optional[SessionRecord]:
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def flush(self):
+        """Block until everything saved so far is durable"""
+
+    def close(self):
+        self.flush()
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str, flush_interval: float = 0.05, max_batch: int = 512):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.batches_written = 0
+        self.records_written = 0
+        self.logger = logging.getLogger('uti_agent.server')
+
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, symptoms BLOB, demographics BLOB, history BLOB, "
+            "turn INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+        # session_id -> pending delta, or None for a pending delete
+        self._pending: Dict[str, Optional[SessionRecord]] = {}
+        # The batch being written, still visible to load() until it commits
+        self._writing: Dict[str, Optional[SessionRecord]] = {}
+        self._written_generation = 0
+        self._queued_generation = 0
+        self._flush_target = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="uti-agent-session-store", daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, session_id: str, record: Optional[SessionRecord]):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Session store is closed")
+            pending = self._pending.get(session_id)
+            if record is not None and pending is not None:
+                record = pending.merged(record)
+            self._pending[session_id] = record
+            self._queued_generation += 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+
+    def save(self, record: SessionRecord):
+        self._enqueue(record.session_id, record)
+
+    def delete(self, session_id: str):
+        self._enqueue(session_id, None)
+
+    def load(self, session_id: str) -> Optional[SessionRecord]:
+        # Capture queued changes before reading the table; a batch committing in between is applied twice, harmlessly
+        with self._cond:
+            overlays = [batch[session_id] for batch in (self._writing, self._pending) if session_id in batch]
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT session_id, state, symptoms, demographics, history, turn, updated_at FROM sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        record = SessionRecord(*row) if row else None
+        for delta in overlays:
+            record = None if delta is None else (record.merged(delta) if record else delta)
+        return record if record is not None and record.complete else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                if len(self._pending) < self.max_batch and not self._closed and self._flush_target <= self._written_generation:
+                    # Let a few more turns arrive so they share one transaction
+                    self._cond.wait(self.flush_interval)
+                self._writing, self._pending = self._pending, {}
+                generation = self._queued_generation
+            try:
+                self._write(self._writing)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Session store write failed, retrying: {e}")
+                with self._cond:
+                    self._requeue(self._writing)
+                    self._writing = {}
+                time.sleep(self.flush_interval)
+                continue
+            with self._cond:
+                self._writing = {}
+                self._written_generation = generation
+                self._cond.notify_all()
+
+    def _requeue(self, batch: Dict[str, Optional[SessionRecord]]):
+        # Older records go underneath anything queued since the batch was taken
+        for session_id, record in batch.items():
+            if session_id not in self._pending:
+                self._pending[session_id] = record
+            elif record is not None and self._pending[session_id] is not None:
+                self._pending[session_id] = record.merged(self._pending[session_id])
+
+    def _write(self, batch: Dict[str, Optional[SessionRecord]]):
+        deletes = [(session_id,) for session_id, record in batch.items() if record is None]
+        upserts = [
+            (r.session_id, r.state, r.symptoms, r.demographics, r.history, r.turn, r.updated_at)
+            for r in batch.values() if r is not None
+        ]
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", deletes)
+                # Unchanged sub-records arrive as NULL and keep their stored value
+                self._conn.executemany(
+                    "INSERT INTO sessions (session_id, state, symptoms, demographics, history, turn, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+                    "state = excluded.state, turn = excluded.turn, updated_at = excluded.updated_at, "
+                    "symptoms = COALESCE(excluded.symptoms, symptoms), "
+                    "demographics = COALESCE(excluded.demographics, demographics), "
+                    "history = COALESCE(excluded.history, history)",
+                    upserts
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.batches_written += 1
+        self.records_written += len(batch)
+
+    def flush(self):
+        with self._cond:
+            target = self._flush_target = self._queued_generation
+            self._cond.notify_all()
+            while self._written_generation < target and self._thread.is_alive():
+                self._cond.wait(0.1)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._db_lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
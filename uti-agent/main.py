@@ -4,13 +4,26 @@ Livewell UTI Agent - CLI Entry Point
 import sys
 import signal
 from core.conversation import ConversationManager
+from core.clinical_engine import ClinicalDecisionEngine
+from core.guidelines import default_registry
 from utils.logger import EvaluationLogger
+from utils.audit_log import AuditLog
+from utils.tracing import Tracer
+
+TRACE_FILE = "uti_agent_trace.json"
 
 
 class PatientInterface:
     def __init__(self):
-        self.conversation_manager = ConversationManager()
         self.logger = EvaluationLogger()
+        self.audit_log = AuditLog("uti_agent_audit")
+        # UTI_AGENT_TRACING=1 times every stage of each turn and writes the histograms to TRACE_FILE on exit
+        self.tracer = Tracer.from_env()
+        self.conversation_manager = ConversationManager(
+            clinical_engine=ClinicalDecisionEngine(default_registry(), audit_log=self.audit_log),
+            evaluation_logger=self.logger,
+            tracer=self.tracer
+        )
         self.running = True
         
         # Handle graceful exit
@@ -19,8 +32,13 @@ class PatientInterface:
     def _signal_handler(self, signum, frame):
         self.conversation_manager.display_goodbye()
         self.running = False
+        self._dump_trace()
         sys.exit(0)
     
+    def _dump_trace(self):
+        if self.tracer.enabled:
+            self.tracer.dump(TRACE_FILE)
+    
     def manage_conversation_flow(self):
         self.conversation_manager.display_welcome()
         
@@ -34,22 +52,34 @@ class PatientInterface:
             if not user_input:
                 continue
                 
-            response = self.conversation_manager.process_input(user_input)
-            self.conversation_manager.display_agent_response(response)
+            chunks = self.conversation_manager.process_input_stream(user_input)
+            self.conversation_manager.display_agent_response_stream(chunks)
             
             # Check if conversation is complete
             if self.conversation_manager.is_complete():
                 self.conversation_manager.display_goodbye()
                 break
+        
+        self._dump_trace()
+    
+    def close(self):
+        """Commit any queued audit entries and stop the writer"""
+        self.audit_log.close()
+        self.logger.flush()
 
 
 def main():
+    interface = None
     try:
         interface = PatientInterface()
         interface.manage_conversation_flow()
     except Exception as e:
         print(f"An error occurred: {e}")
         sys.exit(1)
+    finally:
+        # Also runs on Ctrl+C, which exits from the signal handler
+        if interface is not None:
+            interface.close()
 
 
 if __name__ == "__main__":
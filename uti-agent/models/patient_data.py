@@ -1,60 +1,398 @@
+import struct
+from bisect import bisect_left
 from dataclasses import dataclass, field
-from typing import List, Optional
-from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
 
+# Binary layout version written by PatientData.to_bytes
+PATIENT_FORMAT_VERSION = 1
 
-@dataclass
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_U8, _U32, _I32, _I64, _F64 = struct.Struct('<B'), struct.Struct('<I'), struct.Struct('<i'), struct.Struct('<q'), struct.Struct('<d')
+
+
+class _Flag:
+    """Boolean attribute stored as one bit of the instance's `flags` integer"""
+    __slots__ = ('bit',)
+
+    def __init__(self, bit: int):
+        self.bit = bit
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return bool(instance.flags & self.bit)
+
+    def __set__(self, instance, value):
+        if value:
+            instance.flags |= self.bit
+        else:
+            instance.flags &= ~self.bit
+
+
+def packed_flags(*names: str):
+    """Expose each name as a bool attribute backed by the class's `flags` field.
+
+    The constructor keeps accepting the flags as keyword arguments, so
+    SymptomData(dysuria=True) and symptoms.dysuria behave as plain bool fields.
+    """
+    def decorate(cls):
+        bits = {name: 1 << i for i, name in enumerate(names)}
+        for name, bit in bits.items():
+            setattr(cls, name, _Flag(bit))
+        field_init = cls.__init__
+
+        def __init__(self, *args, **kwargs):
+            flags = kwargs.pop('flags', 0)
+            for name, bit in bits.items():
+                if kwargs.pop(name, False):
+                    flags |= bit
+            field_init(self, *args, flags=flags, **kwargs)
+
+        def __repr__(self):
+            values = [f"{f}={getattr(self, f)!r}" for f in cls.__dataclass_fields__ if f != 'flags' and cls.__dataclass_fields__[f].repr]
+            values += [name for name, bit in bits.items() if self.flags & bit]
+            return f"{cls.__name__}({', '.join(values)})"
+
+        __init__.__doc__ = field_init.__doc__
+        cls.__init__ = __init__
+        cls.__repr__ = __repr__
+        cls.FLAG_BITS = bits
+        return cls
+    return decorate
+
+
+class _Writer:
+    __slots__ = ('parts',)
+
+    def __init__(self):
+        self.parts = []
+
+    def u8(self, value: int):
+        self.parts.append(_U8.pack(value))
+
+    def u32(self, value: int):
+        self.parts.append(_U32.pack(value))
+
+    def i32(self, value: int):
+        self.parts.append(_I32.pack(value))
+
+    def f64(self, value: float):
+        self.parts.append(_F64.pack(value))
+
+    def text(self, value: Optional[str]):
+        # Length 0xFFFFFFFF marks None
+        if value is None:
+            self.parts.append(_U32.pack(0xFFFFFFFF))
+            return
+        data = value.encode('utf-8')
+        self.parts.append(_U32.pack(len(data)))
+        self.parts.append(data)
+
+    def texts(self, values: List[str]):
+        self.u32(len(values))
+        for value in values:
+            self.text(value)
+
+    def time(self, value: Optional[datetime]):
+        # Naive datetimes as microseconds since the epoch; a leading byte marks None
+        if value is None:
+            self.u8(0)
+            return
+        self.u8(1)
+        self.parts.append(_I64.pack((value - _EPOCH) // _MICROSECOND))
+
+    def getvalue(self) -> bytes:
+        return b''.join(self.parts)
+
+
+class _Reader:
+    __slots__ = ('data', 'offset')
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def _unpack(self, fmt: struct.Struct):
+        value, = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return value
+
+    def u8(self) -> int:
+        return self._unpack(_U8)
+
+    def u32(self) -> int:
+        return self._unpack(_U32)
+
+    def i32(self) -> int:
+        return self._unpack(_I32)
+
+    def f64(self) -> float:
+        return self._unpack(_F64)
+
+    def text(self) -> Optional[str]:
+        length = self.u32()
+        if length == 0xFFFFFFFF:
+            return None
+        end = self.offset + length
+        value = self.data[self.offset:end].decode('utf-8')
+        self.offset = end
+        return value
+
+    def texts(self) -> List[str]:
+        return [self.text() for _ in range(self.u32())]
+
+    def time(self) -> Optional[datetime]:
+        if not self.u8():
+            return None
+        return _EPOCH + self._unpack(_I64) * _MICROSECOND
+
+
+@packed_flags('dysuria', 'urgency', 'frequency', 'suprapubic_pain', 'hematuria',
+              # Systemic symptoms that indicate complications
+              'fever', 'rigors', 'flank_pain', 'back_pain', 'nausea', 'vomiting')
+@dataclass(slots=True)
 class SymptomData:
-    dysuria: bool = False
-    urgency: bool = False
-    frequency: bool = False
-    suprapubic_pain: bool = False
-    hematuria: bool = False
     onset: str = ""
     severity: Optional[str] = None
-    # Systemic symptoms that indicate complications
-    fever: bool = False
-    rigors: bool = False
-    flank_pain: bool = False
-    back_pain: bool = False
-    nausea: bool = False
-    vomiting: bool = False
+    flags: int = 0
+
+    def _write(self, out: _Writer):
+        out.u32(self.flags)
+        out.text(self.onset)
+        out.text(self.severity)
+
+    @classmethod
+    def _read(cls, data: _Reader) -> 'SymptomData':
+        flags = data.u32()
+        return cls(onset=data.text(), severity=data.text(), flags=flags)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**{name: getattr(self, name) for name in self.FLAG_BITS}, 'onset': self.onset, 'severity': self.severity}
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SymptomData':
+        return cls(onset=data.get('onset') or "", severity=data.get('severity'),
+                   **{name: bool(data.get(name)) for name in cls.FLAG_BITS})
 
-@dataclass
+
+@dataclass(slots=True)
 class DemographicData:
     age: int = 0
     sex: str = ""
     weight: Optional[float] = None
     pregnancy_status: Optional[bool] = None
 
+    def _write(self, out: _Writer):
+        out.i32(self.age)
+        out.text(self.sex)
+        out.u8(0 if self.weight is None else 1)
+        if self.weight is not None:
+            out.f64(self.weight)
+        out.u8(2 if self.pregnancy_status is None else int(bool(self.pregnancy_status)))
+
+    @classmethod
+    def _read(cls, data: _Reader) -> 'DemographicData':
+        age, sex = data.i32(), data.text()
+        weight = data.f64() if data.u8() else None
+        pregnancy = data.u8()
+        return cls(age=age, sex=sex, weight=weight, pregnancy_status=None if pregnancy == 2 else bool(pregnancy))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'age': self.age, 'sex': self.sex, 'weight': self.weight, 'pregnancy_status': self.pregnancy_status}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DemographicData':
+        return cls(age=data.get('age') or 0, sex=data.get('sex') or "", weight=data.get('weight'),
+                   pregnancy_status=data.get('pregnancy_status'))
 
-@dataclass
+
+@dataclass(slots=True)
 class UTIHistory:
     date: datetime
     treatment: str
     resolved: bool
     treatment_completion_date: Optional[datetime] = None
 
+    def to_dict(self) -> Dict[str, Any]:
+        completion = self.treatment_completion_date
+        return {
+            'date': self.date.isoformat(),
+            'treatment': self.treatment,
+            'resolved': self.resolved,
+            'treatment_completion_date': completion.isoformat() if completion else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'UTIHistory':
+        completion = data.get('treatment_completion_date')
+        return cls(date=datetime.fromisoformat(data['date']), treatment=data.get('treatment') or "",
+                   resolved=bool(data.get('resolved')),
+                   treatment_completion_date=datetime.fromisoformat(completion) if completion else None)
 
-@dataclass
+
+@packed_flags('recent_antibiotics', 'immunocompromised',
+              # Urinary tract complications
+              'abnormal_urinary_function', 'indwelling_catheter', 'neurogenic_bladder', 'renal_stones', 'renal_dysfunction',
+              # Set once the patient has answered the allergy question (including "none")
+              'allergies_collected')
+@dataclass(slots=True)
 class HistoryData:
     allergies: List[str] = field(default_factory=list)
     current_medications: List[str] = field(default_factory=list)
-    recent_antibiotics: bool = False
     previous_utis: List[UTIHistory] = field(default_factory=list)
-    immunocompromised: bool = False
-    # Urinary tract complications
-    abnormal_urinary_function: bool = False
-    indwelling_catheter: bool = False
-    neurogenic_bladder: bool = False
-    renal_stones: bool = False
-    renal_dysfunction: bool = False
+    flags: int = 0
+    # Episode dates it was built from, sorted UTI dates and latest treatment completion
+    _uti_index: Optional[Tuple[tuple, List[datetime], Optional[datetime]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def _index(self) -> Tuple[List[datetime], Optional[datetime]]:
+        # Keyed by the episodes' dates, so appends, replacements and in-place edits all rebuild it
+        key = tuple((uti.date, uti.treatment_completion_date) for uti in self.previous_utis)
+        index = self._uti_index
+        if index is None or index[0] != key:
+            completions = [completion for _, completion in key if completion]
+            index = (key, sorted(date for date, _ in key), max(completions, default=None))
+            self._uti_index = index
+        return index[1], index[2]
+
+    def utis_since(self, cutoff: datetime) -> int:
+        """Number of previous UTIs dated on or after cutoff"""
+        dates, _ = self._index()
+        return len(dates) - bisect_left(dates, cutoff)
+
+    def latest_treatment_completion(self) -> Optional[datetime]:
+        return self._index()[1]
+
+    def _write(self, out: _Writer):
+        out.u32(self.flags)
+        out.texts(self.allergies)
+        out.texts(self.current_medications)
+        out.u32(len(self.previous_utis))
+        for uti in self.previous_utis:
+            out.time(uti.date)
+            out.text(uti.treatment)
+            out.u8(int(bool(uti.resolved)))
+            out.time(uti.treatment_completion_date)
+
+    @classmethod
+    def _read(cls, data: _Reader) -> 'HistoryData':
+        flags = data.u32()
+        allergies, medications = data.texts(), data.texts()
+        utis = [
+            UTIHistory(date=data.time(), treatment=data.text(), resolved=bool(data.u8()), treatment_completion_date=data.time())
+            for _ in range(data.u32())
+        ]
+        return cls(allergies=allergies, current_medications=medications, previous_utis=utis, flags=flags)
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'allergies': list(self.allergies),
+            'current_medications': list(self.current_medications),
+            'previous_utis': [uti.to_dict() for uti in self.previous_utis],
+            **{name: getattr(self, name) for name in self.FLAG_BITS}
+        }
 
-@dataclass
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HistoryData':
+        return cls(allergies=list(data.get('allergies') or []), current_medications=list(data.get('current_medications') or []),
+                   previous_utis=[UTIHistory.from_dict(uti) for uti in data.get('previous_utis') or []],
+                   **{name: bool(data.get(name)) for name in cls.FLAG_BITS})
+
+
+@dataclass(slots=True)
 class PatientData:
     symptoms: SymptomData = field(default_factory=SymptomData)
     demographics: DemographicData = field(default_factory=DemographicData)
     history: HistoryData = field(default_factory=HistoryData)
-    session_id: str = ""
\ No newline at end of file
+    session_id: str = ""
+
+    def to_bytes(self) -> bytes:
+        out = _Writer()
+        out.u8(PATIENT_FORMAT_VERSION)
+        out.text(self.session_id)
+        self.symptoms._write(out)
+        self.demographics._write(out)
+        self.history._write(out)
+        return out.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'PatientData':
+        reader = _Reader(data)
+        version = reader.u8()
+        if version != PATIENT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported patient data format version {version}")
+        session_id = reader.text()
+        return cls(
+            symptoms=SymptomData._read(reader),
+            demographics=DemographicData._read(reader),
+            history=HistoryData._read(reader),
+            session_id=session_id
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'session_id': self.session_id,
+            'symptoms': self.symptoms.to_dict(),
+            'demographics': self.demographics.to_dict(),
+            'history': self.history.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PatientData':
+        """Inverse of to_dict, e.g. for patient data read back from the logs"""
+        return cls(
+            symptoms=SymptomData.from_dict(data.get('symptoms') or {}),
+            demographics=DemographicData.from_dict(data.get('demographics') or {}),
+            history=HistoryData.from_dict(data.get('history') or {}),
+            session_id=data.get('session_id') or ""
+        )
+
+    def snapshot(self, previous: Optional['PatientSnapshot'] = None) -> 'PatientSnapshot':
+        """Immutable copy of the current state, sharing unchanged sub-records with `previous`"""
+        encoded = []
+        for name in SNAPSHOT_RECORDS:
+            data = _record_bytes(getattr(self, name))
+            if previous is not None:
+                shared = getattr(previous, name)
+                if shared == data:
+                    data = shared
+            encoded.append(data)
+        return PatientSnapshot(*encoded, session_id=self.session_id)
+
+
+SNAPSHOT_RECORDS = ('symptoms', 'demographics', 'history')
+
+
+def _record_bytes(record) -> bytes:
+    out = _Writer()
+    record._write(out)
+    return out.getvalue()
+
+
+@dataclass(frozen=True, slots=True)
+class PatientSnapshot:
+    """PatientData frozen at one turn; each sub-record is stored encoded and shared while unchanged"""
+    symptoms: bytes
+    demographics: bytes
+    history: bytes
+    session_id: str = ""
+
+    def restore(self) -> PatientData:
+        return PatientData(
+            symptoms=SymptomData._read(_Reader(self.symptoms)),
+            demographics=DemographicData._read(_Reader(self.demographics)),
+            history=HistoryData._read(_Reader(self.history)),
+            session_id=self.session_id
+        )
+
+    def changed_records(self, previous: Optional['PatientSnapshot']) -> List[str]:
+        """Names of the sub-records that differ from `previous`"""
+        if previous is None:
+            return list(SNAPSHOT_RECORDS)
+        return [name for name in SNAPSHOT_RECORDS if getattr(self, name) is not getattr(previous, name)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.restore().to_dict()
@@ -0,0 +1,359 @@
+"""
+Livewell UTI Agent - HTTP Server Entry Point
+
+Hosts many concurrent consultations over a small JSON API:
+
+    POST   /sessions                 start a session, returns the welcome message
+    POST   /sessions/{id}/messages   {"message": "..."} -> agent response (markdown)
+    POST   /sessions/{id}/messages/stream
+                                     same, streamed as server-sent events while generated
+    GET    /sessions/{id}            current conversation state
+    DELETE /sessions/{id}            end a session
+    GET    /health                   server statistics
+    GET    /metrics                  per-stage latency histograms, Prometheus text format (with --trace)
+    GET    /admin/guidelines         active guideline version
+    POST   /admin/guidelines         {"path": "..."} (optional) -> compile and swap in a guideline file
+"""
+import argparse
+import asyncio
+import json
+import logging
+from http import HTTPStatus
+from typing import Dict, Any, Tuple, Optional, Union
+from core.session_manager import SessionManager, SessionNotFoundError, ServerBusyError, SessionExistsError
+from core.guidelines import GuidelineRegistry, GuidelineError
+from core.session_store import SQLiteSessionStore
+from utils.logger import EvaluationLogger, OVERFLOW_POLICIES
+from utils.audit_log import AuditLog
+from utils.fake_llm import LatencyModel, fake_gemini_client
+from utils.tracing import Tracer
+from utils.token_ledger import TokenLedger
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AgentServer:
+    def __init__(self, session_manager: SessionManager, host: str = "127.0.0.1", port: int = 8080,
+                 guideline_poll_seconds: Optional[float] = None, sweep_seconds: float = 30.0,
+                 trace_dump_path: Optional[str] = None):
+        self.session_manager = session_manager
+        self.host = host
+        self.port = port
+        self.guideline_poll_seconds = guideline_poll_seconds
+        self.sweep_seconds = sweep_seconds
+        self.trace_dump_path = trace_dump_path
+        self.logger = logging.getLogger('uti_agent.server')
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.logger.info(f"Serving on http://{self.host}:{self.port}")
+        tasks = [asyncio.create_task(self.sweep_sessions())]
+        if self.guideline_poll_seconds:
+            tasks.append(asyncio.create_task(self.watch_guidelines()))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def sweep_sessions(self):
+        """Evict idle sessions even when no traffic arrives to trigger it"""
+        while True:
+            await asyncio.sleep(self.sweep_seconds)
+            self.session_manager.evict_idle()
+            if self.trace_dump_path:
+                self.session_manager.tracer.dump(self.trace_dump_path)
+
+    async def watch_guidelines(self):
+        """Reload the guideline file whenever its modification time changes"""
+        guidelines = self.session_manager.guidelines
+        while True:
+            await asyncio.sleep(self.guideline_poll_seconds)
+            try:
+                if guidelines.reload_if_changed():
+                    self.logger.info(f"Reloaded guidelines {guidelines.version} from {guidelines.path}")
+            except (OSError, GuidelineError) as e:
+                self.logger.warning(f"Keeping guidelines {guidelines.version}: {e}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, version = self._parse_request_line(request_line)
+                headers = await self._read_headers(reader)
+                body = await self._read_body(reader, headers)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                stream_session_id = self._stream_route(method, path)
+                if stream_session_id is not None:
+                    await self.stream_message(writer, stream_session_id, body, keep_alive)
+                    if not keep_alive:
+                        break
+                    continue
+
+                try:
+                    status, payload = await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (HTTPError, ValueError) as e:
+            status = e.status if isinstance(e, HTTPError) else HTTPStatus.BAD_REQUEST
+            self._write_response(writer, status, {'error': str(e)}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _parse_request_line(self, line: bytes) -> Tuple[str, str, str]:
+        parts = line.decode('latin-1').strip().split()
+        if len(parts) != 3:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        return parts[0].upper(), parts[1].split('?', 1)[0], parts[2]
+
+    async def _read_headers(self, reader: asyncio.StreamReader) -> Dict[str, str]:
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> Dict[str, Any]:
+        length = int(headers.get('content-length', 0) or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        if not length:
+            return {}
+        raw = await reader.readexactly(length)
+        try:
+            body = json.loads(raw)
+        except json.JSONDecodeError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        return body
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload: Union[Dict[str, Any], str], keep_alive: bool):
+        # Text payloads are Prometheus exposition; everything else is JSON
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode('utf-8'), "application/json"
+        headers = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+
+    def _stream_route(self, method: str, path: str) -> Optional[str]:
+        parts = [p for p in path.split('/') if p]
+        if method == 'POST' and len(parts) == 4 and parts[0] == 'sessions' and parts[2:] == ['messages', 'stream']:
+            return parts[1]
+        return None
+
+    def _message_from_body(self, body: Dict[str, Any]) -> str:
+        message = body.get('message')
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'message' must be a non-empty string")
+        return message.strip()
+
+    async def stream_message(self, writer: asyncio.StreamWriter, session_id: str, body: Dict[str, Any], keep_alive: bool):
+        """Forward reply chunks as server-sent events using chunked transfer encoding"""
+        try:
+            events = self.session_manager.handle_message_stream(session_id, self._message_from_body(body))
+            # Pull the first event before committing to a 200 so admission errors keep their status
+            first_event = await events.__anext__()
+        except HTTPError as e:
+            status, payload = e.status, {'error': e.message}
+        except SessionNotFoundError as e:
+            status, payload = HTTPStatus.NOT_FOUND, {'error': f"Unknown session {e.args[0]}"}
+        except ServerBusyError as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}
+        except Exception:
+            self.logger.exception(f"Unhandled error streaming to session {session_id}")
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal server error"}
+        else:
+            status = None
+        if status is not None:
+            self._write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            return
+
+        headers = [
+            "HTTP/1.1 200 OK",
+            "Content-Type: text/event-stream",
+            "Cache-Control: no-cache",
+            "Transfer-Encoding: chunked",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1'))
+
+        event = first_event
+        try:
+            while event is not None:
+                data = f"data: {json.dumps(event)}\n\n".encode('utf-8')
+                writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+                # Slow readers apply backpressure to generation instead of buffering unboundedly
+                await writer.drain()
+                event = await anext(events, None)
+        finally:
+            # A client that disconnects mid-stream must still release its pending slot
+            await events.aclose()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def dispatch(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        parts = [p for p in path.split('/') if p]
+        sessions = self.session_manager
+
+        try:
+            if parts == ['health'] and method == 'GET':
+                return HTTPStatus.OK, sessions.stats()
+
+            if parts == ['metrics'] and method == 'GET':
+                return HTTPStatus.OK, sessions.tracer.prometheus_text()
+
+            if parts == ['admin', 'guidelines']:
+                if method == 'GET':
+                    return HTTPStatus.OK, {'version': sessions.guidelines.version, 'path': sessions.guidelines.path}
+                if method == 'POST':
+                    try:
+                        version = sessions.reload_guidelines(body.get('path'))
+                    except (OSError, GuidelineError) as e:
+                        raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, f"Guidelines not reloaded: {e}")
+                    return HTTPStatus.OK, {'version': version, 'path': sessions.guidelines.path}
+
+            if parts == ['sessions'] and method == 'POST':
+                result = sessions.create_session(body.get('session_id'))
+                return HTTPStatus.CREATED, result.to_dict()
+
+            if len(parts) == 2 and parts[0] == 'sessions':
+                session_id = parts[1]
+                if method == 'GET':
+                    manager = sessions.get_session(session_id)
+                    return HTTPStatus.OK, {
+                        'session_id': session_id,
+                        'state': manager.state.value,
+                        'complete': manager.is_complete()
+                    }
+                if method == 'DELETE':
+                    sessions.end_session(session_id)
+                    return HTTPStatus.OK, {'session_id': session_id, 'ended': True}
+
+            if len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'messages' and method == 'POST':
+                result = await sessions.handle_message(parts[1], self._message_from_body(body))
+                return HTTPStatus.OK, result.to_dict()
+
+        except SessionNotFoundError as e:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown session {e.args[0]}")
+        except ServerBusyError as e:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+        except SessionExistsError as e:
+            raise HTTPError(HTTPStatus.CONFLICT, str(e))
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        except HTTPError:
+            raise
+        except Exception:
+            self.logger.exception(f"Unhandled error for {method} {path}")
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "Internal server error")
+
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the UTI Care Agent as a multi-session HTTP server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-sessions', type=int, default=1000, help="Maximum number of open sessions")
+    parser.add_argument('--max-concurrency', type=int, default=64, help="Maximum turns processed at once")
+    parser.add_argument('--max-pending', type=int, default=256, help="Maximum turns queued before rejecting with 503")
+    parser.add_argument('--no-llm', action='store_true', help="Use the basic parsers and templated responses")
+    parser.add_argument('--fake-llm', action='store_true',
+                        help="Answer LLM calls from the offline fake backend, for load tests")
+    parser.add_argument('--fake-llm-latency', type=float, nargs=2, default=[0.4, 1.5], metavar=('P50', 'P99'),
+                        help="Fake LLM latency, in seconds")
+    parser.add_argument('--fake-llm-error-rate', type=float, default=0.0, help="Share of fake LLM calls that fail")
+    parser.add_argument('--max-hot-sessions', type=int, default=1000, help="Sessions kept fully in memory")
+    parser.add_argument('--idle-timeout', type=float, default=900, help="Seconds before an idle session goes dormant")
+    parser.add_argument('--memory-budget-mb', type=float, default=256, help="Memory budget for hot sessions")
+    parser.add_argument('--dormant-timeout', type=float, default=24 * 3600,
+                        help="Seconds before a dormant session is dropped from memory")
+    parser.add_argument('--session-store', metavar='PATH',
+                        help="SQLite file that persists sessions so they resume after a restart")
+    parser.add_argument('--guidelines', help="Guideline file to load instead of the bundled one")
+    parser.add_argument('--guideline-poll', type=float, metavar='SECONDS',
+                        help="Reload the guideline file automatically when it changes")
+    parser.add_argument('--audit-log', metavar='PATH', default='uti_agent_audit',
+                        help="Hash-chained decision log, written as PATH.NNNNNN.wal segments")
+    parser.add_argument('--evaluation-log', metavar='PATH',
+                        help="Write turns and decisions to rotating PATH.NNNNNN.jsonl segments")
+    parser.add_argument('--log-overflow', choices=OVERFLOW_POLICIES, default='drop_newest',
+                        help="What to do with evaluation records when the log buffer is full")
+    parser.add_argument('--trace', action='store_true', help="Record per-stage latency histograms, served at /metrics")
+    parser.add_argument('--trace-dump', metavar='PATH', help="Also write them to a JSON file every sweep (implies --trace)")
+    parser.add_argument('--session-token-budget', type=int, metavar='TOKENS',
+                        help="LLM tokens a session may use before it continues on the basic parsers and templates")
+    parser.add_argument('--process-token-budget', type=int, metavar='TOKENS',
+                        help="LLM tokens the whole server may use before every session falls back the same way")
+    parser.add_argument('--no-cascade', action='store_true',
+                        help="Send every message to the LLM instead of trying the deterministic extractor first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    evaluation_logger = EvaluationLogger(args.evaluation_log, overflow=args.log_overflow) if args.evaluation_log else None
+    session_manager = SessionManager(
+        max_sessions=args.max_sessions,
+        max_concurrency=args.max_concurrency,
+        max_pending=args.max_pending,
+        enable_llm=not args.no_llm,
+        llm_client=fake_gemini_client(
+            latency=LatencyModel(*args.fake_llm_latency), error_rate=args.fake_llm_error_rate
+        ) if args.fake_llm and not args.no_llm else None,
+        guidelines=GuidelineRegistry.from_file(args.guidelines) if args.guidelines else None,
+        store=SQLiteSessionStore(args.session_store) if args.session_store else None,
+        max_hot_sessions=args.max_hot_sessions,
+        idle_seconds=args.idle_timeout,
+        dormant_seconds=args.dormant_timeout,
+        memory_budget_bytes=int(args.memory_budget_mb * 1024 * 1024),
+        evaluation_logger=evaluation_logger,
+        audit_log=AuditLog(args.audit_log),
+        tracer=Tracer(enabled=args.trace or bool(args.trace_dump)),
+        # Per-call usage goes to the evaluation log for `python -m utils.token_ledger`
+        token_ledger=TokenLedger(args.session_token_budget, args.process_token_budget, evaluation_logger),
+        cascade=not args.no_cascade
+    )
+    server = AgentServer(session_manager, args.host, args.port, args.guideline_poll, trace_dump_path=args.trace_dump)
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session_manager.close()
+        if args.trace_dump:
+            session_manager.tracer.dump(args.trace_dump)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import sys
+import os
+import json
+import asyncio
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.clinical_engine import ClinicalDecisionEngine
+from core.conversation import AUDIT_FAILURE_REASON
+from core.session_manager import SessionManager
+from tests.test_conversation_flow import _StubLLM, _reach_allergy_question
+from utils.audit_log import AuditLog, AuditLogError, segment_path, segment_paths, verify, verify_segment
+
+
+def test_chain_detects_tampering_and_gaps(tmp_path):
+    """Test: Edited, removed or torn entries break verification, across segment rotation and restarts"""
+    base = str(tmp_path / 'audit')
+    log = AuditLog(base, max_segment_bytes=2000, fsync=False)
+    for i in range(30):
+        log.sync(log.append({'decision': i}))
+    log.close()
+    assert len(segment_paths(base)) > 1
+
+    # A torn final line is cut off on restart and the chain continues
+    with open(segment_paths(base)[-1], 'ab') as f:
+        f.write(b'31 deadbeef')
+    log = AuditLog(base, fsync=False)
+    log.append({'decision': 30})
+    log.close()
+    result = verify(base)
+    assert result.ok and (result.entries, result.last_seq) == (31, 31)
+
+    first = segment_path(base, 1)
+    with open(first, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+
+    with open(first, 'wb') as f:
+        f.write(b''.join(lines[:2] + [lines[2].replace(b'"decision":2', b'"decision":7')] + lines[3:]))
+    assert any("hash mismatch" in e for e in verify_segment(first).errors)
+
+    with open(first, 'wb') as f:
+        f.write(b''.join(lines[:2] + lines[3:]))
+    errors = verify(base).errors
+    assert any("sequence 4 follows 2" in e for e in errors)
+    assert any("does not link" in e for e in errors)
+
+
+def test_concurrent_decisions_share_fsyncs(tmp_path):
+    """Test: Entries appended from many threads are durable after sync, with fewer commits than entries"""
+    log = AuditLog(str(tmp_path / 'audit'))
+
+    def decide(worker):
+        for i in range(50):
+            log.sync(log.append({'worker': worker, 'i': i}))
+
+    threads = [threading.Thread(target=decide, args=(w,)) for w in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.close()
+
+    assert log.durable_seq == 400
+    assert log.commits < 400
+    assert verify(str(tmp_path / 'audit')).ok
+
+
+def test_every_decision_is_audited_before_it_is_shown(tmp_path):
+    """Test: The final recommendation is durable in the audit log when the patient receives it"""
+    base = str(tmp_path / 'audit')
+
+    async def consult():
+        sessions = SessionManager(enable_llm=False, audit_log=AuditLog(base))
+        session_id = sessions.create_session().session_id
+        for message in ["burning when I pee since yesterday", "I am 25, female", "no allergies"]:
+            result = await sessions.handle_message(session_id, message)
+        durable = sessions.clinical_engine.audit_log.durable_seq
+        sessions.close()
+        return session_id, result, durable
+
+    session_id, result, durable = asyncio.run(consult())
+    assert result.complete and durable == 1
+    with open(segment_path(base, 1), 'rb') as f:
+        entry = json.loads(f.readline().split(b' ', 3)[3])
+    assert entry['session_id'] == session_id
+    assert entry['guideline_version'] == '2022.12'
+    assert entry['status'] == 'eligible' and entry['medication'].startswith("Nitrofurantoin")
+    assert entry['inputs']['demographics']['age'] == 25
+
+
+def test_speculative_decisions_are_not_audited(tmp_path):
+    """Test: The decision made for speculative generation leaves the log unchanged; only the final one is logged"""
+    log = AuditLog(str(tmp_path / 'audit'), fsync=False)
+    llm = _StubLLM({})
+    manager = _reach_allergy_question(llm, clinical_engine=ClinicalDecisionEngine(audit_log=log))
+    log.sync()
+    assert manager.speculation_stats['started'] == 1 and log.durable_seq == 0
+
+    llm.extracted = {'allergies': []}
+    manager.process_input("no allergies")
+    log.close()
+    assert manager.speculation_stats['committed'] == 1 and log.durable_seq == 1
+
+
+class _StalledFile:
+    """Segment file whose writes fail, or block until `release` is set"""
+    def __init__(self, file, release=None):
+        self.file = file
+        self.release = release
+
+    def write(self, data):
+        if self.release is None:
+            raise OSError(28, "No space left on device")
+        self.release.wait()
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_failed_or_stalled_writes_refer_instead_of_hanging(tmp_path):
+    """Test: A stalled audit write times out, and a failing one stops the log and the patient is referred"""
+    release = threading.Event()
+    stalled = AuditLog(str(tmp_path / 'stalled'), fsync=False)
+    stalled._file = _StalledFile(stalled._file, release)
+
+    async def wait_stalled():
+        stalled.append({'decision': 1})
+        await stalled.sync_async(timeout=0.05)
+
+    try:
+        asyncio.run(wait_stalled())
+        assert False, "sync_async returned before the entry was durable"
+    except AuditLogError:
+        pass
+    release.set()
+    stalled.close()
+    assert stalled.durable_seq == 1
+
+    log = AuditLog(str(tmp_path / 'audit'), fsync=False, write_attempts=2)
+    log._file = _StalledFile(log._file)
+
+    async def consult():
+        sessions = SessionManager(enable_llm=False, audit_log=log)
+        session_id = sessions.create_session().session_id
+        for message in ["burning when I pee since yesterday", "I am 25, female", "no allergies"]:
+            result = await sessions.handle_message(session_id, message)
+        return result
+
+    started = time.monotonic()
+    result = asyncio.run(consult())
+    assert time.monotonic() - started < 5
+    assert result.complete and AUDIT_FAILURE_REASON in result.response and "Nitrofurantoin" not in result.response
+    assert log.failed and not log.sync()
+    try:
+        log.append({'decision': 2})
+        assert False, "append succeeded on a stopped log"
+    except AuditLogError:
+        pass
+    log.close()
@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cache import LRUCache, SQLiteCache, ExtractionCache
+from utils.llm_client import GeminiClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recent_and_expires():
+    """Test: LRU tier is bounded by size and honours TTL"""
+    clock = FakeClock()
+    cache = LRUCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    cache.get('a')
+    cache.set('c', '3')
+    
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    
+    clock.now += 11
+    assert cache.get('a') is None
+    assert cache.evictions == 1
+
+
+def test_sqlite_tier_ttl_and_size_bound(tmp_path):
+    """Test: SQLite tier expires entries and evicts down below its bound"""
+    clock = FakeClock()
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=10, ttl_seconds=60, clock=clock)
+    for i in range(11):
+        clock.now += 1
+        cache.set(f"k{i}", str(i))
+    
+    assert len(cache) <= 10
+    assert cache.get('k0') is None
+    assert cache.get('k10') == '10'
+    
+    clock.now += 61
+    assert cache.get('k10') is None
+
+
+def test_disk_hits_are_promoted_and_counted(tmp_path):
+    """Test: A fresh process finds results on disk and promotes them to memory"""
+    path = str(tmp_path / "cache.db")
+    key = ExtractionCache.make_key("No allergies.", "{}", "model", "1")
+    ExtractionCache(disk=SQLiteCache(path)).set(key, {'allergies': []})
+    
+    cache = ExtractionCache(disk=SQLiteCache(path))
+    assert cache.get(key) == {'allergies': []}
+    assert cache.get(key) == {'allergies': []}
+    assert cache.get(ExtractionCache.make_key("no allergies", "{}", "model", "2")) is None
+    assert (cache.stats.disk_hits, cache.stats.memory_hits, cache.stats.misses) == (1, 1, 1)
+
+
+def test_client_skips_llm_for_equivalent_utterances():
+    """Test: Normalized repeats of an utterance are served without another LLM call"""
+    class CountingClient(GeminiClient):
+        calls = 0
+        
+        def generate_structured_response(self, prompt, system_instruction="", max_tokens=1000, temperature=0.3, **kwargs):
+            CountingClient.calls += 1
+            return '{"allergies": []}'
+    
+    client = CountingClient(api_key="test", cache=ExtractionCache())
+    first = client.extract_structured_data("", "No allergies.", "{}")
+    first['allergies'].append('mutated')
+    second = client.extract_structured_data("", "  no   ALLERGIES ", "{}")
+    
+    assert CountingClient.calls == 1
+    assert second == {'allergies': []}
+    assert client.cache.stats.to_dict()['llm_calls_avoided'] == 1
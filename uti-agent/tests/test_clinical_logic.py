@@ -1,9 +1,10 @@
 import sys
 import os
+from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.clinical_engine import ClinicalDecisionEngine
-from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData
+from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData, UTIHistory
 from models.treatment_plan import EligibilityStatus
 
 
@@ -54,6 +55,35 @@ def test_first_line_treatment():
     assert "Nitrofurantoin" in treatment.medication
 
 
+def test_recurrence_uses_injected_clock():
+    """Test: Recurrence windows are evaluated against the engine clock and follow appended and edited history"""
+    now = datetime(2024, 6, 1)
+    engine = ClinicalDecisionEngine(clock=lambda: now)
+    history = HistoryData(previous_utis=[
+        UTIHistory(date=now - timedelta(days=days), treatment='nitrofurantoin', resolved=True)
+        for days in [700, 400, 200]
+    ])
+    
+    assert engine.check_recurrence_relapse(history) == (False, "")
+    
+    history.previous_utis.append(UTIHistory(date=now - timedelta(days=90), treatment='nitrofurantoin', resolved=True))
+    assert engine.check_recurrence_relapse(history) == (False, "")
+    assert engine.check_recurrence_relapse(history, now=now + timedelta(days=30)) == (False, "")
+    
+    history.previous_utis.append(UTIHistory(date=now - timedelta(days=30), treatment='fosfomycin', resolved=True,
+                                            treatment_completion_date=now - timedelta(days=20)))
+    assert engine.check_recurrence_relapse(history) == (True, "relapse")
+    # Same history a year later: nothing falls inside any window
+    assert engine.check_recurrence_relapse(history, now=now + timedelta(days=400)) == (False, "")
+    assert engine.check_recurrence_relapse(history, now=now + timedelta(days=60)) == (True, "recurrent_6_months")
+    
+    # Edits that keep the list and its length still change the outcome
+    history.previous_utis[-1].treatment_completion_date = None
+    assert engine.check_recurrence_relapse(history) == (True, "recurrent_6_months")
+    history.previous_utis[3] = UTIHistory(date=now - timedelta(days=300), treatment='nitrofurantoin', resolved=True)
+    assert engine.check_recurrence_relapse(history) == (True, "recurrent_12_months")
+
+
 if __name__ == "__main__":
     # Simple test runner
     print("Running basic clinical engine tests...")
@@ -0,0 +1,173 @@
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.conversation import ConversationManager, ConversationState
+from utils.fake_llm import LatencyModel, fake_gemini_client
+from utils.tracing import Tracer
+
+
+def test_sync_flow_reaches_treatment():
+    """Test: Sync wrapper drives a full basic-parser consultation to completion"""
+    manager = ConversationManager(enable_llm=False)
+    manager.process_input("I have burning when I pee since yesterday")
+    manager.process_input("I am 25, female")
+    response = manager.process_input("no allergies")
+    
+    assert manager.is_complete()
+    assert "Nitrofurantoin" in response
+
+
+def test_history_keeps_per_turn_snapshots():
+    """Test: Each history entry records the patient data as of that turn, sharing unchanged records"""
+    manager = ConversationManager(enable_llm=False)
+    manager.process_input("I have burning when I pee since yesterday")
+    manager.process_input("I am 25, female")
+    manager.process_input("no allergies")
+    
+    snapshots = [entry['patient_data'] for entry in manager.conversation_history]
+    assert [s.restore().demographics.age for s in snapshots] == [0, 25, 25]
+    assert [s.restore().history.allergies_collected for s in snapshots] == [False, False, True]
+    assert snapshots[1].symptoms is snapshots[0].symptoms
+    assert snapshots[2].changed_records(snapshots[1]) == ['history']
+    assert snapshots[-1].restore() == manager.patient_data
+
+
+def test_async_sessions_run_concurrently():
+    """Test: Many async consultations can be in flight on one event loop"""
+    async def consult(manager):
+        await manager.process_input_async("burning when I pee since yesterday")
+        await manager.process_input_async("I am 30, female")
+        return await manager.process_input_async("no allergies")
+    
+    async def run_all():
+        managers = [ConversationManager(enable_llm=False) for _ in range(20)]
+        responses = await asyncio.gather(*(consult(m) for m in managers))
+        return managers, responses
+    
+    managers, responses = asyncio.run(run_all())
+    assert all(m.state == ConversationState.COMPLETE for m in managers)
+    assert all("Nitrofurantoin" in r for r in responses)
+
+
+class _StubLLM:
+    """Minimal stand-in for GeminiClient returning a fixed extraction"""
+    def __init__(self, extracted):
+        self.extracted = extracted
+        self.extraction_calls = 0
+        self.generated = []
+        self.aio = self
+    
+    async def extract_structured_data(self, prompt, user_input, expected_format):
+        self.extraction_calls += 1
+        return self.extracted
+    
+    async def generate_conversational_response(self, context, user_input, response_type="general"):
+        self.generated.append(response_type)
+        return f"[{response_type}] {context}"
+    
+    async def generate_conversational_response_stream(self, context, user_input, response_type="general"):
+        self.generated.append(response_type)
+        yield f"[{response_type}] "
+        yield context
+
+
+def test_fused_extraction_skips_completed_states():
+    """Test: One detailed message fills every state and goes straight to assessment"""
+    llm = _StubLLM({
+        'dysuria': True, 'onset': '1-2 days', 'age': 30, 'sex': 'female',
+        'allergies': ['sulfa'], 'allergies_mentioned': True
+    })
+    manager = ConversationManager(llm_client=llm)
+    response = manager.process_input("I'm a 30 y/o woman, burning since yesterday, allergic to sulfa")
+    
+    assert manager.is_complete()
+    assert llm.extraction_calls == 1
+    assert response.startswith("[treatment]")
+    assert manager.patient_data.history.allergies == ['sulfa']
+
+
+def test_fused_extraction_keeps_systemic_symptoms():
+    """Test: Fever and complication fields from the fused extraction reach patient data and force referral"""
+    llm = _StubLLM({
+        'dysuria': True, 'fever': True, 'onset': '1-2 days', 'age': 30, 'sex': 'female',
+        'indwelling_catheter': True, 'allergies': [], 'allergies_mentioned': True
+    })
+    manager = ConversationManager(llm_client=llm)
+    response = manager.process_input("Burning since yesterday and a fever, I have a catheter, 30F, no allergies")
+
+    assert manager.patient_data.symptoms.fever and manager.patient_data.symptoms.dysuria
+    assert manager.patient_data.history.indwelling_catheter
+    assert manager.is_complete()
+    assert response.startswith("[referral]")
+
+
+def test_fused_extraction_asks_only_for_missing_state():
+    """Test: Known demographics are skipped but the allergy question is still asked"""
+    llm = _StubLLM({'dysuria': True, 'onset': 'hours', 'age': 22, 'sex': 'female'})
+    manager = ConversationManager(llm_client=llm)
+    response = manager.process_input("22F, burning since this morning")
+    
+    assert manager.state == ConversationState.HISTORY_COLLECTION
+    assert "allergies" in response
+    
+    llm.extracted = {}
+    manager.process_input("none")
+    assert manager.is_complete()
+
+
+def _reach_allergy_question(llm, **options):
+    manager = ConversationManager(llm_client=llm, fused_extraction=False, **options)
+    llm.extracted = {'dysuria': True, 'onset': 'hours'}
+    manager.process_input("burning since this morning")
+    llm.extracted = {'age': 28, 'sex': 'female'}
+    manager.process_input("28, female")
+    return manager
+
+
+def test_speculative_explanation_is_committed_when_decision_holds():
+    """Test: The explanation generated during history collection is reused"""
+    llm = _StubLLM({})
+    manager = _reach_allergy_question(llm)
+    assert manager.state == ConversationState.HISTORY_COLLECTION
+    
+    llm.extracted = {'allergies': []}
+    response = manager.process_input("no allergies")
+    
+    assert "Nitrofurantoin" in response
+    assert llm.generated == ['treatment']
+    assert manager.speculation_stats == {'started': 1, 'committed': 1, 'discarded': 0}
+
+
+def test_speculative_explanation_is_discarded_when_allergy_changes_drug():
+    """Test: An allergy that changes the drug discards the speculative explanation"""
+    llm = _StubLLM({})
+    manager = _reach_allergy_question(llm)
+    
+    llm.extracted = {'allergies': ['nitrofurantoin']}
+    response = manager.process_input("I'm allergic to nitrofurantoin")
+    
+    assert "Trimethoprim" in response
+    assert manager.speculation_stats['discarded'] == 1
+
+
+def test_fake_llm_drives_full_pipeline_offline():
+    """Test: The fake Gemini backend answers fused extraction and streamed replies, and every stage is traced"""
+    client = fake_gemini_client(latency=LatencyModel(p50=0.001, p99=0.005))
+    tracer = Tracer()
+    # Without the cascade every turn is an LLM call
+    manager = ConversationManager(llm_client=client, tracer=tracer, cascade=False)
+    manager.process_input("I have burning when I pee and need to go a lot since yesterday")
+    assert manager.input_parser.last_parser == 'llm'
+    manager.process_input("I am 25, female")
+    response = "".join(manager.process_input_stream("no allergies"))
+    
+    assert manager.is_complete()
+    assert response
+    stages = {(span['stage'], span['state'], span['backend']) for span in tracer.spans}
+    assert ('parse', 'greeting', 'fake') in stages
+    assert ('eligibility', 'clinical_assessment', 'fake') in stages
+    assert {'transition', 'generate', 'persist', 'log'} <= {stage for stage, _, _ in stages}
+    assert all(span['session_id'] == manager.session_id for span in tracer.spans)
+    assert client.client.calls >= 3 and client.client.errors == 0
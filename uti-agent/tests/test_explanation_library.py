@@ -0,0 +1,51 @@
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.clinical_engine import ClinicalDecisionEngine
+from core.explanation_library import ExplanationLibrary, build_library
+from core.response_gen import ResponseGenerator
+from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData, UTIHistory
+
+
+def test_library_covers_every_engine_outcome(tmp_path):
+    """Test: Every decision the engine can make has a pre-generated explanation"""
+    engine = ClinicalDecisionEngine()
+    path = str(tmp_path / "explanations.json")
+    build_library(ResponseGenerator(), engine).save(path)
+    library = ExplanationLibrary.load(path)
+    
+    recent = datetime.now() - timedelta(days=30)
+    patients = [
+        PatientData(symptoms=SymptomData(urgency=True), demographics=DemographicData(age=30, sex='female')),
+        PatientData(symptoms=SymptomData(dysuria=True, fever=True), demographics=DemographicData(age=8, sex='male')),
+        PatientData(symptoms=SymptomData(dysuria=True), demographics=DemographicData(age=30, sex='female', pregnancy_status=True),
+                    history=HistoryData(immunocompromised=True, renal_stones=True)),
+        PatientData(symptoms=SymptomData(dysuria=True), demographics=DemographicData(age=30, sex='female'),
+                    history=HistoryData(previous_utis=[UTIHistory(recent, 'x', True), UTIHistory(recent, 'x', True)])),
+    ]
+    for allergies in ([], ['nitrofurantoin'], ['nitrofurantoin', 'sulfonamides']):
+        patients.append(PatientData(symptoms=SymptomData(dysuria=True), demographics=DemographicData(age=30, sex='female'),
+                                    history=HistoryData(allergies=allergies)))
+    
+    for patient in patients:
+        result = engine.determine_eligibility(patient)
+        if result.treatment_plan:
+            assert library.get_treatment_explanation(result.treatment_plan)
+        else:
+            assert library.get_referral_message(result.referral_reason)
+    assert library.version
+
+
+def test_library_is_served_before_live_generation():
+    """Test: A library hit never reaches the LLM"""
+    class FailingLLM:
+        def generate_conversational_response(self, *args, **kwargs):
+            raise AssertionError("LLM should not be called")
+    
+    plan = ClinicalDecisionEngine().possible_treatment_plans()[0]
+    library = build_library(ResponseGenerator(), ClinicalDecisionEngine())
+    generator = ResponseGenerator(FailingLLM(), library)
+    
+    assert plan.medication in generator.generate_treatment_explanation(plan)
@@ -0,0 +1,48 @@
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types
+from core.extraction_schema import PATIENT_SCHEMA, HISTORY_SCHEMA, SYMPTOM_SCHEMA
+from core.input_parser import InputParser
+from utils.fake_llm import fake_gemini_client
+from utils.llm_client import EXTRACTION_INSTRUCTION
+
+
+def test_schemas_follow_the_patient_dataclasses():
+    """Test: Field types come from the dataclasses and packed flags, and the provider accepts the schemas"""
+    properties = PATIENT_SCHEMA['properties']
+    assert properties['dysuria'] == {'type': 'BOOLEAN', 'description': "burning pain during urination"}
+    assert properties['age']['type'] == 'INTEGER' and properties['age']['nullable']
+    assert properties['weight']['type'] == 'NUMBER'
+    assert properties['sex']['enum'] == ['male', 'female']
+    assert properties['allergies']['type'] == 'ARRAY' and properties['allergies']['items'] == {'type': 'STRING'}
+    assert 'nullable' not in properties['allergies_mentioned']
+    assert PATIENT_SCHEMA['required'] == list(properties)
+    assert set(SYMPTOM_SCHEMA['properties']) < set(properties)
+    assert 'previous_utis' not in HISTORY_SCHEMA['properties']
+    for schema in (PATIENT_SCHEMA, HISTORY_SCHEMA, SYMPTOM_SCHEMA):
+        types.Schema.model_validate(schema)
+
+
+def test_extraction_uses_schema_and_static_instruction():
+    """Test: Extraction sends the schema as JSON mode with one short static instruction, built once per schema"""
+    client = fake_gemini_client()
+    config = client._extraction_config(PATIENT_SCHEMA)
+    assert config.response_mime_type == 'application/json' and config.response_schema == PATIENT_SCHEMA
+    assert config.system_instruction == EXTRACTION_INSTRUCTION and config.thinking_config.thinking_budget == 0
+    assert client._extraction_config(PATIENT_SCHEMA) is config
+
+    patient = InputParser(client).extract_patient_data("Burning when I pee since yesterday, I'm 30, female")
+    assert patient.symptoms.dysuria and patient.demographics.age == 30
+    parser = InputParser(client)
+    parser.extract_medical_history("I'm allergic to penicillin")
+    asyncio.run(parser.extract_symptoms_async("It stings and I need to rush to the toilet"))
+    assert client.ledger.total.calls == 3
+
+    # A failed call returns nothing, and the next one goes through as usual
+    client.client.error_rate = 1.0
+    assert client.extract_structured_data("Extract demographic information:", "I'm 41", PATIENT_SCHEMA) == {}
+    client.client.error_rate = 0.0
+    assert InputParser(client).extract_demographics("I'm 41").age == 41
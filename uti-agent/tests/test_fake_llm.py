@@ -0,0 +1,44 @@
+import sys
+import os
+import asyncio
+import json
+import random
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.input_parser import InputParser
+from core.extraction_schema import DEMOGRAPHIC_SCHEMA
+from utils.fake_llm import FakeGenaiClient, LatencyModel, fake_gemini_client
+
+
+def test_fake_backend_is_deterministic_with_injected_failures(tmp_path):
+    """Test: Latency and failures repeat for the same seed, recordings win over rules, and rules fit the prompt"""
+    def outcomes(seed):
+        fake = FakeGenaiClient(error_rate=0.2, seed=seed)
+        results = []
+        for i in range(200):
+            try:
+                results.append(fake.models.generate_content('fake', f"prompt {i % 20}").text)
+            except RuntimeError:
+                results.append(None)
+        return results, fake.errors
+
+    results, errors = outcomes(1)
+    assert outcomes(1) == (results, errors)
+    assert outcomes(2) != (results, errors)
+    assert 20 <= errors <= 60
+
+    latency = LatencyModel(p50=0.4, p99=1.5)
+    rng = random.Random(0)
+    samples = sorted(latency.sample(rng) for _ in range(20000))
+    assert abs(samples[10000] - 0.4) < 0.02 and abs(samples[19800] - 1.5) < 0.15
+
+    recordings = tmp_path / 'recordings.jsonl'
+    recordings.write_text(json.dumps({'system_instruction': '', 'contents': 'hello', 'text': 'recorded'}) + '\n')
+    client = fake_gemini_client(str(recordings))
+    assert client.generate_structured_response('hello') == 'recorded'
+    assert client.client.recorded_hits == 1
+
+    # The rule responder answers with exactly the keys the extraction format asks for
+    extracted = asyncio.run(client.aio.extract_structured_data("Extract demographic information:", "I'm 25, female", DEMOGRAPHIC_SCHEMA))
+    assert extracted == {'age': 25, 'sex': 'female', 'weight': None, 'pregnancy_status': None}
+    assert InputParser(client).extract_demographics("I'm 25, female").age == 25
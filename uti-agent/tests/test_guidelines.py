@@ -0,0 +1,59 @@
+import sys
+import os
+import json
+import random
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from core.clinical_engine import ClinicalDecisionEngine
+from core.guidelines import GuidelineRegistry, GuidelineError, DEFAULT_GUIDELINE_PATH
+from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData
+from models.treatment_plan import EligibilityStatus
+from utils.synthetic_patients import random_patient
+
+
+def test_compiled_guideline_matches_hand_written_engine():
+    """Test: The bundled guideline file decides exactly like the hand-written rules"""
+    rng = random.Random(11)
+    now = datetime.now()
+    guideline = GuidelineRegistry.from_file().current
+    engine = ClinicalDecisionEngine()
+    
+    for row in range(3000):
+        patient = random_patient(rng, now)
+        assert guideline.evaluate(patient, now=now) == engine.determine_eligibility(patient, now=now), f"row {row}"
+    
+    assert guideline.possible_referral_reasons() == engine.possible_referral_reasons()
+    assert guideline.possible_treatment_plans() == engine.possible_treatment_plans()
+
+
+def test_guideline_hot_swap(tmp_path):
+    """Test: Reloading swaps the active version, and a broken file leaves it in place"""
+    with open(DEFAULT_GUIDELINE_PATH, encoding='utf-8') as f:
+        spec = json.load(f)
+    registry = GuidelineRegistry.from_file()
+    engine = ClinicalDecisionEngine(registry)
+    patient = PatientData(
+        symptoms=SymptomData(dysuria=True),
+        demographics=DemographicData(age=30, sex='female'),
+        history=HistoryData(allergies_collected=True)
+    )
+    assert engine.determine_eligibility(patient).treatment_plan.medication == "Nitrofurantoin macrocrystals"
+    
+    # A newer version that makes fosfomycin first-line
+    spec['version'] = 'test-2'
+    spec['treatment_ladder'].insert(0, spec['treatment_ladder'].pop())
+    updated = tmp_path / 'ocp_uti.json'
+    updated.write_text(json.dumps(spec))
+    registry.load(str(updated))
+    
+    assert engine.guideline_version == 'test-2'
+    assert engine.determine_eligibility(patient).treatment_plan.medication == "Fosfomycin trometamol"
+    
+    spec['complicating_factors']['rules'][0]['any'].append('not_a_feature')
+    updated.write_text(json.dumps(spec))
+    with pytest.raises(GuidelineError):
+        registry.load()
+    assert engine.guideline_version == 'test-2'
+    assert engine.determine_eligibility(patient).status == EligibilityStatus.ELIGIBLE
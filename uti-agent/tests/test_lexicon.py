@@ -0,0 +1,71 @@
+import sys
+import os
+import re
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.input_parser import InputParser
+from core.lexicon import scan, TERMS, _alternation
+from core.rule_extractor import RuleExtractor
+from utils.fake_llm import fake_gemini_client
+
+
+def test_terms_match_whole_words_with_negation_scope():
+    """Test: Single letters and word fragments no longer match, and negation covers only its own clause"""
+    parser = InputParser()
+    assert parser.extract_demographics("I'm here because of my bladder").sex == ""
+    assert parser.extract_demographics("I'm 30, f").sex == "female"
+    assert parser.extract_demographics("I'm a 34 year old woman").sex == "female"
+    assert parser.extract_demographics("22M").sex == "male"
+
+    symptoms = parser.extract_symptoms("no burning, but I need to go very often")
+    assert not symptoms.dysuria and symptoms.frequency
+    assert not parser.extract_symptoms("I don't have any pain or blood").hematuria
+    # "not sure" does not negate what follows
+    assert parser.extract_symptoms("Not sure if it burns").dysuria
+    assert parser.extract_symptoms("burning for 3 days").onset == "days"
+
+    demographics = parser.extract_demographics("I'm 30 and I'm not pregnant")
+    assert demographics.age == 30 and demographics.pregnancy_status is False
+
+    history = parser.extract_medical_history("not allergic to penicillin but allergic to sulfa")
+    assert history.allergies == ['sulfonamides'] and history.allergies_collected
+    history = parser.extract_medical_history("I take nitrofurantoin, and I'm allergic to amoxicillin")
+    assert history.allergies == ['amoxicillin'] and history.current_medications == ['nitrofurantoin']
+
+
+def test_exceptions_end_the_negation_scope():
+    """Test: A drug named after "except" and similar is outside the negation and keeps the allergy cue"""
+    assert scan("no allergies except penicillin").allergies == ['penicillin']
+    assert scan("no allergies other than sulfa").allergies == ['sulfonamides']
+    assert scan("not allergic to anything except sulfa").allergies == ['sulfonamides']
+    assert scan("No allergies apart from bactrim, besides that I'm fine").allergies == ['tmp/smx']
+    # Before the exception the negation still holds
+    found = scan("no burning except when I pee")
+    assert not found.symptom_flags
+
+
+def test_each_drug_takes_its_nearest_cue():
+    """Test: A drug is an allergy or a medication by the cue nearest it, not by everything in its clause"""
+    found = scan("I take nitrofurantoin and am allergic to sulfa")
+    assert found.medications == ['nitrofurantoin'] and found.allergies == ['sulfonamides']
+    found = scan("macrobid is what I take, allergic to penicillin, sulfa")
+    assert found.medications == ['nitrofurantoin'] and found.allergies == ['penicillin', 'sulfonamides']
+    # "medications" after "allergic to" is what the allergy is to
+    assert scan("allergic to some medications like bactrim").allergies == ['tmp/smx']
+
+    parser = InputParser(fake_gemini_client(), RuleExtractor())
+    history = parser.extract_medical_history("I take nitrofurantoin and am allergic to sulfa")
+    assert history.allergies == ['sulfonamides'] and history.current_medications == ['nitrofurantoin']
+
+
+def test_one_scan_fills_every_record():
+    """Test: The fused basic parse scans once, and the trie pattern matches exactly the lexicon's terms"""
+    found = scan("22F, burning and blood since this morning, allergic to bactrim")
+    patient = InputParser()._extract_patient_data_basic("22F, burning and blood since this morning, allergic to bactrim")
+    assert (patient.demographics.age, patient.demographics.sex) == (found.age, found.sex) == (22, 'female')
+    assert patient.symptoms.dysuria and patient.symptoms.hematuria and patient.symptoms.onset == 'hours'
+    assert patient.history.allergies == ['tmp/smx']
+
+    trie = re.compile(rf"(?:{_alternation(TERMS)})")
+    assert all(trie.fullmatch(term) for term in TERMS)
+    assert not trie.fullmatch("burnin") and not trie.fullmatch("females")
@@ -0,0 +1,118 @@
+import sys
+import os
+import json
+import random
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from core.batch_engine import PatientTable, determine_eligibility_batch
+from core.clinical_engine import ClinicalDecisionEngine
+from utils.logger import segment_path, log_segments
+from utils.log_analytics import LogAnalytics
+from utils.log_archive import ArchiveReader, archive_path, compact
+from utils.review_queue import ReviewIndex
+from tests.test_batch_engine import random_patient
+
+START = 1_700_000_000.0
+
+
+def write_log(base, sessions, segments=3):
+    """Sessions spread over several closed segments plus the open one; returns the logged patients"""
+    rng = random.Random(3)
+    engine = ClinicalDecisionEngine()
+    patients = []
+    per_segment = sessions // segments
+    for segment in range(1, segments + 2):
+        with open(segment_path(base, segment), 'w') as f:
+            for i in range(per_segment if segment <= segments else 5):
+                n = len(patients)
+                at = START + n * 60
+                decided_at = datetime.fromtimestamp(at)
+                patient = random_patient(rng, decided_at)
+                result = engine.determine_eligibility(patient, now=decided_at)
+                for turn in (1, 2):
+                    f.write(f'{{"timestamp": {at}, "session_type": "conversation", "data": {{"session_id": "s{n}", '
+                            f'"turn": {turn}, "parser": "{rng.choice(["llm", "llm_empty", "basic"])}", '
+                            f'"latency_seconds": 0.25, "response": "ok"}}}}\n')
+                f.write(json.dumps({'timestamp': at, 'session_type': 'clinical_decision', 'data': {
+                    'session_id': f"s{n}", 'turn': 2, 'guideline_version': '2022.12', 'status': result.status.value,
+                    'medication': result.treatment_plan.medication if result.treatment_plan else None,
+                    'referral_reason': result.referral_reason, 'patient_data': patient.to_dict()
+                }}) + '\n')
+                patients.append((patient, decided_at))
+            f.write('not json\n')
+    return patients
+
+
+def test_archive_projection_pushdown_and_batch_reads(tmp_path):
+    """Test: Compaction keeps every record, skips non-matching row groups, and feeds the batch engine directly"""
+    base = str(tmp_path / 'sessions')
+    patients = write_log(base, 1500)
+    assert compact(base, row_group_rows=100) == [archive_path(base, i) for i in (1, 2, 3)]
+    # The newest segment may still be written to
+    assert not os.path.exists(archive_path(base, 4))
+
+    reader = ArchiveReader(archive_path(base, 2))
+    assert reader.rows('decisions') == 500 and reader.rows('turns') == 1000
+    assert reader.source == {'segment': 'sessions.000002.jsonl', 'bytes': os.path.getsize(segment_path(base, 2)),
+                             'malformed_offsets': [os.path.getsize(segment_path(base, 2)) - len('not json\n')]}
+    columns = reader.read('turns', ['session_id', 'parser'], where=[('timestamp', '>=', START + 900 * 60)])
+    assert list(columns) == ['session_id', 'parser'] and len(columns['session_id']) == 200
+    assert set(columns['parser']) <= {'llm', 'llm_empty', 'basic'}
+    # Only the row groups whose timestamp range reaches the filter are decoded
+    assert len(list(reader.scan('decisions', ['turn'], where=[('timestamp', '>=', START + 900 * 60)]))) == 1
+
+    archives = [archive_path(base, i) for i in (1, 2, 3)]
+    table = PatientTable.from_archive(archives)
+    expected = PatientTable.from_patients([p for p, _ in patients[:1500]], now=[at for _, at in patients[:1500]])
+    for name in PatientTable.column_names():
+        assert np.array_equal(getattr(table, name), getattr(expected, name)), name
+
+    # Re-running the batch engine on the archived inputs reproduces every logged decision
+    result = determine_eligibility_batch(table)
+    logged = {name: np.concatenate([ArchiveReader(path).read('decisions', [name])[name] for path in archives])
+              for name in ('status_code', 'referral_code', 'complication_mask', 'treatment_code')}
+    assert np.array_equal(result.status, logged['status_code'])
+    assert np.array_equal(result.referral_code, logged['referral_code'])
+    assert np.array_equal(result.complication_mask, logged['complication_mask'])
+    assert np.array_equal(result.treatment_code, logged['treatment_code'])
+
+
+def test_analytics_and_review_queue_read_archives(tmp_path):
+    """Test: Metrics and the review index are the same whether segments are read as JSONL or archives"""
+    base = str(tmp_path / 'sessions')
+    write_log(base, 300)
+    from_jsonl = LogAnalytics(base, window_seconds=3600)
+    from_jsonl.process()
+    index = ReviewIndex(str(tmp_path / 'jsonl.db'), base)
+    index.refresh()
+    top = index.top(5)
+    expected_record = index.load_record(top[0])
+
+    # A checkpoint taken halfway through a segment resumes from the archive at the same record
+    first = segment_path(base, 1)
+    with open(first) as f:
+        lines = f.readlines()
+    with open(first, 'w') as f:
+        f.writelines(lines[:len(lines) // 2])
+    resumed = LogAnalytics(base, str(tmp_path / 'checkpoint.json'), window_seconds=3600)
+    resumed.process()
+    with open(first, 'w') as f:
+        f.writelines(lines)
+
+    compact(base, delete=True)
+    assert list(log_segments(base)) == ['sessions.000004.jsonl']
+    from_archive = LogAnalytics(base, window_seconds=3600)
+    assert from_archive.process() == from_jsonl.records
+    assert from_archive.report() == from_jsonl.report()
+    resumed = LogAnalytics(base, str(tmp_path / 'checkpoint.json'), window_seconds=3600)
+    resumed.process()
+    assert resumed.report() == from_jsonl.report()
+
+    archived_index = ReviewIndex(str(tmp_path / 'archive.db'), base)
+    assert archived_index.refresh() == index.count()
+    assert [case.session_id for case in archived_index.top(5)] == [case.session_id for case in top]
+    assert archived_index.load_record(top[0]) == expected_record
+    # Nothing is read twice
+    assert archived_index.refresh() == 0 and from_archive.process() == 0
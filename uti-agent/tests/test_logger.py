@@ -0,0 +1,113 @@
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.session_manager import SessionManager
+from utils.logger import BatchedJSONLWriter, EvaluationLogger, segment_path
+from utils.log_analytics import LogAnalytics
+
+
+def read_records(base, index=1):
+    with open(segment_path(base, index)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_loggers_share_one_writer_and_rotate(tmp_path):
+    """Test: Loggers for the same file write each record once, rotating into numbered segments"""
+    base = str(tmp_path / 'sessions')
+    first = EvaluationLogger(base, batch_size=4, max_segment_bytes=400)
+    second = EvaluationLogger(base)
+    assert first.writer is second.writer
+
+    for i in range(20):
+        (first if i % 2 else second).log_conversation({'turn': i})
+    first.flush()
+
+    writer = first.writer
+    records = [r for index in range(1, writer._segment_index + 1) for r in read_records(base, index)]
+    assert [r['data']['turn'] for r in records] == list(range(20))
+    assert {r['session_type'] for r in records} == {'conversation'}
+    assert writer._segment_index > 1
+    writer.close()
+
+    # A new process starts a fresh segment after the existing ones
+    reopened = BatchedJSONLWriter(base)
+    assert reopened.segment_path == segment_path(base, writer._segment_index + 1)
+    reopened.close()
+
+
+def test_overflow_policies(tmp_path):
+    """Test: A full buffer drops the newest or the oldest record according to the policy"""
+    for policy, expected in [('drop_newest', [0, 1]), ('drop_oldest', [3, 4])]:
+        # A long flush interval keeps everything queued until flush()
+        writer = BatchedJSONLWriter(str(tmp_path / policy), max_queue=2, flush_interval=10, overflow=policy)
+        for i in range(5):
+            writer.write({'i': i})
+        writer.flush()
+        assert [r['i'] for r in read_records(str(tmp_path / policy))] == expected
+        assert (writer.written, writer.dropped) == (2, 3)
+        writer.close()
+
+
+def test_sessions_log_turns_and_decisions(tmp_path):
+    """Test: Every turn and the final decision are logged once, with the guideline version"""
+    base = str(tmp_path / 'sessions')
+
+    async def consult():
+        sessions = SessionManager(enable_llm=False, evaluation_logger=EvaluationLogger(base))
+        session_id = sessions.create_session().session_id
+        for message in ["burning when I pee since yesterday", "I am 25, female", "no allergies"]:
+            await sessions.handle_message(session_id, message)
+        sessions.close()
+        return session_id, sessions.stats()
+
+    session_id, stats = asyncio.run(consult())
+    records = read_records(base)
+    turns = [r['data'] for r in records if r['session_type'] == 'conversation']
+    decisions = [r['data'] for r in records if r['session_type'] == 'clinical_decision']
+    assert [t['turn'] for t in turns] == [1, 2, 3]
+    assert turns[-1]['state'] == 'complete' and turns[-1]['latency_seconds'] > 0
+    assert len(decisions) == 1
+    assert decisions[0]['session_id'] == session_id
+    assert decisions[0]['status'] == 'eligible' and decisions[0]['guideline_version'] == '2022.12'
+    assert stats['log_records'] == {'written': 4, 'dropped': 0}
+
+
+def test_analytics_resume_from_checkpoint(tmp_path):
+    """Test: Metrics match a full recount, and a second run only reads records appended since the first"""
+    base, checkpoint = str(tmp_path / 'sessions'), str(tmp_path / 'analytics.json')
+    logger = EvaluationLogger(base)
+    start = 1_700_000_000.0
+
+    def consultation(session, at, referred):
+        for turn, parser in enumerate(['basic', 'llm', 'llm_empty'], 1):
+            logger.writer.write({'timestamp': at, 'session_type': 'conversation',
+                                 'data': {'session_id': session, 'turn': turn, 'parser': parser, 'latency_seconds': 0.5}})
+        logger.writer.write({'timestamp': at, 'session_type': 'clinical_decision', 'data': {
+            'session_id': session, 'turn': 3, 'status': 'requires_referral' if referred else 'eligible'}})
+
+    consultation('a', start, referred=True)
+    consultation('b', start + 10, referred=False)
+    logger.flush()
+    first = LogAnalytics(base, checkpoint, window_seconds=60)
+    assert first.process() == 8
+
+    consultation('c', start + 3600, referred=False)
+    logger.writer.write({'timestamp': start + 3600, 'session_type': 'conversation', 'data': {'turn': 1, 'parser': 'llm'}})
+    logger.flush()
+    with open(segment_path(base, logger.writer._segment_index), 'ab') as f:
+        f.write(b'{"timestamp": 1, "session_ty')
+    resumed = LogAnalytics(base, checkpoint, window_seconds=60)
+    assert resumed.process() == 5
+    assert resumed.process() == 0
+
+    total = resumed.totals().metrics()
+    assert total['sessions_started'] == 4 and total['decisions'] == 3
+    assert total['referral_rate'] == round(1 / 3, 4)
+    assert total['completion_rate'] == 0.75
+    assert total['llm_parse_failure_rate'] == round(3 / 7, 4)
+    assert total['fallback_rate'] == 0.3
+    assert total['avg_session_turns'] == 3
+    assert len(resumed.windows) == 2
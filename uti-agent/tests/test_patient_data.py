@@ -0,0 +1,53 @@
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData, UTIHistory
+
+
+def test_flags_behave_like_bool_fields():
+    """Test: Packed findings keep the keyword constructor and bool attribute API"""
+    symptoms = SymptomData(dysuria=True, fever=1, onset="hours")
+    assert symptoms.dysuria is True and symptoms.fever is True and symptoms.urgency is False
+    
+    symptoms.urgency = True
+    symptoms.dysuria = None
+    assert (symptoms.dysuria, symptoms.urgency) == (False, True)
+    assert symptoms == SymptomData(urgency=True, fever=True, onset="hours")
+    assert "urgency" in repr(symptoms) and "dysuria" not in repr(symptoms)
+    assert not hasattr(symptoms, '__dict__')
+    
+    history = HistoryData(allergies=['penicillin'], immunocompromised=True)
+    history.allergies_collected = True
+    assert history.to_dict()['allergies_collected'] is True
+    assert history.recent_antibiotics is False
+
+
+def test_patient_data_bytes_round_trip():
+    """Test: to_bytes/from_bytes reproduce every field, including None and unicode values"""
+    patient = PatientData(
+        symptoms=SymptomData(dysuria=True, hematuria=True, onset="1-2 days", severity=None),
+        demographics=DemographicData(age=34, sex='female', weight=61.5, pregnancy_status=False),
+        history=HistoryData(
+            allergies=['sulfonamides', 'pénicilline'],
+            current_medications=[],
+            previous_utis=[
+                UTIHistory(date=datetime(2024, 1, 2, 3, 4, 5, 678901), treatment='nitrofurantoin', resolved=True,
+                           treatment_completion_date=datetime(2024, 1, 7)),
+                UTIHistory(date=datetime(1969, 12, 31), treatment='', resolved=False)
+            ],
+            renal_stones=True,
+            allergies_collected=True
+        ),
+        session_id='abc'
+    )
+    
+    restored = PatientData.from_bytes(patient.to_bytes())
+    assert restored == patient
+    assert restored.to_dict() == patient.to_dict()
+    assert PatientData.from_bytes(PatientData().to_bytes()) == PatientData()
+    
+    with pytest.raises(ValueError):
+        PatientData.from_bytes(b'\x00' + patient.to_bytes()[1:])
@@ -0,0 +1,64 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logger import EvaluationLogger
+from utils.review_queue import ReviewIndex, flag_names
+
+
+def log_decision(logger, session_id, at, status='eligible', medication='Nitrofurantoin macrocrystals',
+                 referral_reason=None, age=30, allergies=()):
+    logger.writer.write({'timestamp': at, 'session_type': 'clinical_decision', 'data': {
+        'session_id': session_id, 'turn': 3, 'status': status, 'medication': medication,
+        'referral_reason': referral_reason, 'guideline_version': '2022.12',
+        'patient_data': {'symptoms': {'dysuria': True}, 'demographics': {'age': age, 'sex': 'female'},
+                         'history': {'allergies': list(allergies), 'previous_utis': []}}
+    }})
+
+
+def test_queue_puts_flagged_cases_first_and_samples_every_stratum(tmp_path):
+    """Test: Top-K is ordered by priority, the sample covers each outcome, and refreshes are incremental"""
+    base = str(tmp_path / 'sessions')
+    logger = EvaluationLogger(base)
+    day = 86400.0
+    for i in range(200):
+        log_decision(logger, f"routine-{i}", day + i)
+        logger.writer.write({'timestamp': day + i, 'session_type': 'conversation', 'data': {'turn': 1}})
+    for i in range(20):
+        log_decision(logger, f"referral-{i}", day + i, status='requires_referral', medication=None,
+                     referral_reason="Requires clinical evaluation due to: male_patient")
+    log_decision(logger, 'no-plan', day + 5, medication=None, allergies=['nitrofurantoin', 'sulfonamides', 'fosfomycin'])
+    log_decision(logger, 'elderly-multi', day + 6, status='requires_referral', medication=None, age=80,
+                 referral_reason="Requires clinical evaluation due to: systemic_symptoms, immunocompromised")
+    log_decision(logger, 'last-week', 0.0)
+    logger.flush()
+
+    index = ReviewIndex(str(tmp_path / 'review.db'), base)
+    assert index.refresh() == 223
+    assert index.refresh() == 0
+
+    top = index.top(2, since=day)
+    assert [case.session_id for case in top] == ['no-plan', 'elderly-multi']
+    assert flag_names(top[0].flags) == ['eligible_without_plan', 'allergy_adjusted']
+
+    queue = index.review_queue(0.05, since=day)
+    assert len(queue) == 12
+    flagged = [case for case in queue if case.selection == 'flagged']
+    sampled = [case for case in queue if case.selection == 'sampled']
+    assert len(flagged) == 6 and flagged[0].session_id == 'no-plan'
+    assert {case.status for case in sampled} == {'eligible', 'requires_referral'}
+    assert not {case.session_id for case in flagged} & {case.session_id for case in sampled}
+    assert 'last-week' not in {case.session_id for case in queue}
+    # The sample is stable between runs
+    assert [case.session_id for case in index.review_queue(0.05, since=day)] == [case.session_id for case in queue]
+
+    assert index.load_record(top[1])['data']['patient_data']['demographics']['age'] == 80
+    index.mark_reviewed('no-plan')
+    assert index.top(1, since=day)[0].session_id == 'elderly-multi'
+
+    log_decision(logger, 'late', day + 500)
+    logger.flush()
+    assert index.refresh() == 1
+    index.close()
+
+    assert logger.generate_review_queue(0.05, since=day)[0]['flags'] == ['eligible_without_plan', 'allergy_adjusted']
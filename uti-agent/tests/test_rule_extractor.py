@@ -0,0 +1,111 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.conversation import ConversationManager
+from core.extraction_schema import schema_for
+from core.input_parser import InputParser
+from core.rule_extractor import RuleExtractor, MATCHED, ABSENT, PARTIAL, UNKNOWN
+from utils.fake_llm import fake_gemini_client
+from utils.tracing import Tracer
+
+
+def test_confidence_follows_what_the_message_explains():
+    """Test: Fully explained answers are confident in every field; anything unexplained or conflicting is left to the LLM"""
+    rules = RuleExtractor()
+
+    answer = rules.extract("I'm a 34 year old woman")
+    assert answer.values['age'] == 34 and answer.values['sex'] == 'female'
+    assert answer.confidence['age'] == MATCHED and answer.confidence['dysuria'] == ABSENT
+    assert min(rules.extract("34F").confidence.values()) == ABSENT
+
+    allergy = rules.extract("I'm allergic to sulfa")
+    assert allergy.values['allergies'] == ['sulfonamides'] and allergy.values['allergies_mentioned']
+    assert rules.extract("no allergies").values['allergies'] == []
+    assert rules.extract("started 3 days ago").values['onset'] == 'days'
+
+    # Symptoms are not matched at all, so "burning" keeps every unmatched field unknown
+    mixed = rules.extract("22F, burning since this morning")
+    assert mixed.unexplained == ['burning']
+    assert mixed.confidence['onset'] == MATCHED and mixed.confidence['dysuria'] == UNKNOWN
+    # A bare number next to other content may be someone else's age
+    assert rules.extract("My husband is 40").confidence['age'] < MATCHED
+    assert rules.extract("male or female? female").confidence['sex'] == UNKNOWN
+    assert rules.extract("allergic to latex").confidence['allergies'] == UNKNOWN
+    assert rules.extract("I'm 30 and female, maybe pregnant").confidence['pregnancy_status'] < MATCHED
+    # Filler alone matches nothing, so it explains no field
+    for reply in ("yes", "no", "ok"):
+        assert max(rules.extract(reply).confidence.values()) == UNKNOWN
+
+
+def test_negated_allergens_are_not_recorded():
+    """Test: An allergen under a negation is never recorded, and one that is only negated is left to the LLM"""
+    rules = RuleExtractor()
+    negated = rules.extract("I'm not allergic to nitrofurantoin")
+    assert negated.values['allergies'] == [] and negated.confidence['allergies'] == UNKNOWN
+    mixed = rules.extract("Allergic to penicillin but not sulfa")
+    assert mixed.values['allergies'] == ['penicillin'] and mixed.confidence['allergies'] == MATCHED
+
+    parser = InputParser(fake_gemini_client(), RuleExtractor())
+    history = parser.extract_medical_history("I'm not allergic to nitrofurantoin")
+    assert 'nitrofurantoin' not in history.allergies and parser.last_parser == 'llm'
+    assert 'allergies' in parser.last_route['llm']
+    history = parser.extract_medical_history("Allergic to penicillin but not sulfa")
+    assert history.allergies == ['penicillin'] and parser.last_parser == 'rules'
+
+
+def test_medication_and_allergy_cues_together_go_to_the_llm():
+    """Test: When taking and allergy cues share a clause, neither drug list is trusted to the rules"""
+    rules = RuleExtractor()
+    mixed = rules.extract("I take nitrofurantoin and am allergic to sulfa")
+    assert mixed.confidence['allergies'] == UNKNOWN and mixed.confidence['current_medications'] == UNKNOWN
+    assert 'take' in mixed.unexplained
+    # "any medications" after "allergic to" is not a medication cue
+    assert rules.extract("not allergic to any medications").confidence['allergies'] == MATCHED
+
+    parser = InputParser(fake_gemini_client(), RuleExtractor())
+    parser.extract_medical_history("I take nitrofurantoin and am allergic to sulfa")
+    assert {'allergies', 'current_medications'} <= set(parser.last_route['llm'])
+
+
+def test_bare_numbers_only_answer_the_age_question():
+    """Test: A bare number is an age only when age was asked, and never replaces an age already given"""
+    rules = RuleExtractor()
+    assert rules.extract("about 2").confidence['age'] == PARTIAL
+    assert rules.extract("about 25", expected=['age', 'sex']).confidence['age'] == MATCHED
+    assert rules.extract("I'm 25").confidence['age'] == MATCHED
+
+    manager = ConversationManager(llm_client=fake_gemini_client())
+    manager.process_input("I am a 30 year old woman and it burns when I pee")
+    assert manager.patient_data.demographics.age == 30
+    # "about 2" answers how long it has been going on, not the age
+    manager.process_input("about 2")
+    assert manager.patient_data.demographics.age == 30
+
+
+def test_cascade_only_escalates_uncertain_fields():
+    """Test: Formulaic answers skip the LLM; mixed messages send it a schema of just the unresolved fields"""
+    client = fake_gemini_client()
+    parser = InputParser(client, RuleExtractor())
+
+    demographics = parser.extract_demographics("28, female")
+    assert (demographics.age, demographics.sex) == (28, 'female')
+    assert parser.last_parser == 'rules' and client.client.calls == 0
+
+    schemas = []
+    extract = client.extract_structured_data
+    client.extract_structured_data = lambda prompt, text, schema: schemas.append(schema) or extract(prompt, text, schema)
+    patient = parser.extract_patient_data("22F, burning since this morning")
+    assert parser.last_parser == 'llm' and client.client.calls == 1
+    assert patient.symptoms.dysuria and patient.symptoms.onset == 'hours' and patient.demographics.age == 22
+    assert {'age', 'sex', 'onset'} <= set(parser.last_route['rules'])
+    assert schemas == [schema_for(parser.last_route['llm'])] and 'age' not in schemas[0]['properties']
+
+    # A whole consultation: only the symptom description needs the LLM
+    tracer = Tracer()
+    manager = ConversationManager(llm_client=fake_gemini_client(), tracer=tracer)
+    manager.process_input("I have burning when I pee and need to go a lot since yesterday")
+    manager.process_input("I am 25, female")
+    manager.process_input("no allergies")
+    assert manager.is_complete()
+    assert [span['backend'] for span in tracer.spans if span['stage'] == 'parse'] == ['fake', 'rules', 'rules']
@@ -0,0 +1,162 @@
+import sys
+import os
+import asyncio
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from core.session_manager import SessionManager, ServerBusyError, SessionNotFoundError
+from server import AgentServer
+
+
+def test_sessions_are_isolated_and_keyed():
+    """Test: Each session gets its own manager with session_id populated"""
+    async def run():
+        sessions = SessionManager(enable_llm=False)
+        a = sessions.create_session().session_id
+        b = sessions.create_session().session_id
+        await sessions.handle_message(a, "burning when I pee since yesterday")
+        return sessions, a, b
+    
+    sessions, a, b = asyncio.run(run())
+    assert a != b
+    assert sessions.get_session(a).patient_data.session_id == a
+    assert sessions.get_session(a).state.value == "demographic_collection"
+    assert sessions.get_session(b).state.value == "greeting"
+
+
+def test_backpressure_and_session_limit():
+    """Test: Turns beyond max_pending and sessions beyond max_sessions are rejected"""
+    async def run():
+        sessions = SessionManager(max_sessions=1, max_pending=0, enable_llm=False)
+        session_id = sessions.create_session().session_id
+        with pytest.raises(ServerBusyError):
+            sessions.create_session()
+        with pytest.raises(ServerBusyError):
+            await sessions.handle_message(session_id, "burning")
+        with pytest.raises(SessionNotFoundError):
+            await sessions.handle_message("missing", "burning")
+    
+    asyncio.run(run())
+
+
+def test_idle_and_over_budget_sessions_go_dormant_and_rehydrate():
+    """Test: Evicted sessions keep only their state and patient data, and resume on the next message"""
+    now = [0.0]
+    sessions = SessionManager(enable_llm=False, max_hot_sessions=2, idle_seconds=60)
+    sessions.registry.clock = lambda: now[0]
+    
+    async def run():
+        ids = [sessions.create_session().session_id for _ in range(3)]
+        # Creating a third session pushed the least recently used one out of memory
+        assert sessions.stats()['hot_sessions'] == 2 and sessions.stats()['evictions']['capacity'] == 1
+        
+        await sessions.handle_message(ids[0], "burning when I pee since yesterday")
+        await sessions.handle_message(ids[0], "I am 25, female")
+        now[0] = 120.0
+        sessions.evict_idle()
+        stats = sessions.stats()
+        assert stats['hot_sessions'] == 0 and stats['dormant_sessions'] == 3
+        assert stats['evictions']['idle'] == 2
+        
+        result = await sessions.handle_message(ids[0], "no allergies")
+        return result, sessions.stats()
+    
+    result, stats = asyncio.run(run())
+    assert result.complete and "Nitrofurantoin" in result.response
+    assert stats['rehydrations'] == 2
+    assert stats['sessions'] == 3 and stats['hot_sessions'] == 1
+    assert 0 < stats['bytes_per_dormant_session'] < stats['bytes_per_hot_session']
+
+
+def test_abandoned_sessions_free_the_session_limit():
+    """Test: Sessions idle past eviction stop counting against max_sessions, and dormant ones expire"""
+    now = [0.0]
+    sessions = SessionManager(max_sessions=2, enable_llm=False, idle_seconds=60, dormant_seconds=600)
+    sessions.registry.clock = lambda: now[0]
+    abandoned = [sessions.create_session().session_id for _ in range(2)]
+    with pytest.raises(ServerBusyError):
+        sessions.create_session()
+
+    now[0] = 120.0
+    fresh = [sessions.create_session().session_id for _ in range(2)]
+    assert sessions.stats()['hot_sessions'] == 2 and sessions.stats()['dormant_sessions'] == 2
+
+    now[0] = 900.0
+    sessions.evict_idle()
+    stats = sessions.stats()
+    assert stats['expired_sessions'] == 2 and stats['dormant_sessions'] == 2
+    with pytest.raises(SessionNotFoundError):
+        sessions.get_session(abandoned[0])
+    assert sessions.get_session(fresh[0]).state.value == "greeting"
+
+
+def test_http_round_trip():
+    """Test: A consultation can be driven end to end over HTTP"""
+    async def request(port, method, path, body=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        payload = b'' if body is None else json.dumps(body).encode()
+        writer.write(f"{method} {path} HTTP/1.1\r\nConnection: close\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        raw = await reader.read()
+        writer.close()
+        head, _, data = raw.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(data)
+    
+    async def run():
+        server = AgentServer(SessionManager(enable_llm=False))
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            status, created = await request(port, 'POST', '/sessions')
+            duplicate, _ = await request(port, 'POST', '/sessions', {'session_id': created['session_id']})
+            path = f"/sessions/{created['session_id']}/messages"
+            await request(port, 'POST', path, {'message': 'burning when I pee since yesterday'})
+            await request(port, 'POST', path, {'message': 'I am 25, female'})
+            _, final = await request(port, 'POST', path, {'message': 'no allergies'})
+            missing, _ = await request(port, 'GET', '/sessions/unknown')
+            rejected, _ = await request(port, 'POST', '/admin/guidelines', {'path': '/nonexistent.json'})
+            _, guidelines = await request(port, 'GET', '/admin/guidelines')
+        return status, duplicate, final, missing, rejected, guidelines
+    
+    status, duplicate, final, missing, rejected, guidelines = asyncio.run(run())
+    assert status == 201
+    assert duplicate == 409
+    assert final['complete'] is True
+    assert "Nitrofurantoin" in final['response']
+    assert missing == 404
+    assert rejected == 422
+    assert guidelines['version'] == '2022.12'
+
+
+def test_streamed_turn_ends_with_summary():
+    """Test: Streaming yields deltas that add up to the reply, then a summary with TTFT"""
+    async def run():
+        sessions = SessionManager(enable_llm=False)
+        session_id = sessions.create_session().session_id
+        return [event async for event in sessions.handle_message_stream(session_id, "burning since yesterday")]
+    
+    events = asyncio.run(run())
+    summary = events[-1]
+    assert summary['done'] is True
+    assert "".join(e['delta'] for e in events[:-1]) == summary['response']
+    assert summary['ttft_ms'] is not None
+
+
+def test_stream_disconnect_releases_pending_slot():
+    """Test: A client that drops mid-stream does not leave its turn counted as pending"""
+    class DroppedWriter:
+        def write(self, data):
+            pass
+
+        async def drain(self):
+            raise ConnectionResetError("client went away")
+
+    async def run():
+        sessions = SessionManager(enable_llm=False)
+        session_id = sessions.create_session().session_id
+        server = AgentServer(sessions)
+        with pytest.raises(ConnectionResetError):
+            await server.stream_message(DroppedWriter(), session_id, {'message': 'burning since yesterday'}, False)
+        return sessions.stats()['pending']
+
+    assert asyncio.run(run()) == 0
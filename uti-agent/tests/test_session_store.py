@@ -0,0 +1,64 @@
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.session_manager import SessionManager
+from core.session_store import SQLiteSessionStore, SessionRecord
+from models.patient_data import PatientData, SymptomData
+
+
+def test_store_applies_deltas_and_coalesces(tmp_path):
+    """Test: Deltas merge over stored sub-records, queued writes are readable, and batches coalesce"""
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'), flush_interval=10)
+    patient = PatientData(session_id='s1')
+    first = patient.snapshot()
+    store.save(SessionRecord.from_snapshot('greeting', first, 0))
+    
+    patient.symptoms = SymptomData(dysuria=True)
+    second = patient.snapshot(first)
+    delta = SessionRecord.from_snapshot('symptom_collection', second, 1, first)
+    assert delta.demographics is None and delta.history is None
+    store.save(delta)
+    
+    # Still queued: load must see it anyway
+    assert store.load('s1').snapshot().restore().symptoms.dysuria is True
+    store.flush()
+    assert store.batches_written == 1 and store.records_written == 1
+    
+    loaded = store.load('s1')
+    assert (loaded.state, loaded.turn) == ('symptom_collection', 1)
+    assert loaded.snapshot().restore() == patient
+    
+    store.delete('s1')
+    assert store.load('s1') is None
+    store.close()
+    assert SQLiteSessionStore(str(tmp_path / 'sessions.db')).load('s1') is None
+
+
+def test_session_resumes_in_new_process(tmp_path):
+    """Test: A consultation started by one server continues on another after a restart"""
+    path = str(tmp_path / 'sessions.db')
+    
+    async def first_server():
+        sessions = SessionManager(enable_llm=False, store=SQLiteSessionStore(path))
+        session_id = sessions.create_session().session_id
+        await sessions.handle_message(session_id, "burning when I pee since yesterday")
+        await sessions.handle_message(session_id, "I am 25, female")
+        sessions.close()
+        return session_id
+    
+    async def second_server(session_id):
+        sessions = SessionManager(enable_llm=False, store=SQLiteSessionStore(path))
+        result = await sessions.handle_message(session_id, "no allergies")
+        stats = sessions.stats()
+        sessions.end_session(session_id)
+        sessions.close()
+        return result, stats
+    
+    session_id = asyncio.run(first_server())
+    result, stats = asyncio.run(second_server(session_id))
+    assert result.complete
+    assert "Nitrofurantoin" in result.response
+    assert stats['resumed_sessions'] == 1
+    assert SQLiteSessionStore(path).load(session_id) is None
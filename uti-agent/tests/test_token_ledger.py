@@ -0,0 +1,69 @@
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.session_manager import SessionManager
+from utils.fake_llm import fake_gemini_client
+from utils.llm_client import EXTRACTION_PROMPT_VERSION
+from utils.logger import EvaluationLogger, log_segments
+from utils.log_archive import compact
+from utils.token_ledger import TokenLedger, usage_report
+
+
+def consult(manager, messages):
+    async def run():
+        session_id = manager.create_session().session_id
+        for message in messages:
+            await manager.handle_message(session_id, message)
+        return manager.get_session(session_id)
+    return asyncio.run(run())
+
+
+def test_session_budget_falls_back_to_basic_parsers():
+    """Test: Usage is attributed per session and state, and an exhausted budget switches the session to the basic parsers"""
+    client = fake_gemini_client()
+    ledger = TokenLedger(session_budget=400)
+    manager = SessionManager(llm_client=client, token_ledger=ledger)
+    
+    conversation = consult(manager, ["I have burning when I pee since yesterday", "I am 25, female", "no allergies"])
+    # The fused extraction of the first turn uses up the budget; the rest of the consultation runs without the LLM
+    assert conversation.is_complete()
+    assert conversation.over_budget == 'session'
+    assert conversation.backend == 'basic' and conversation.input_parser.last_parser == 'basic'
+    assert client.client.calls == 1
+    usage = ledger.session_usage(conversation.session_id)
+    assert usage.calls == 1 and usage.total_tokens >= 400
+    assert list(ledger.by_prompt) == [('greeting', 'extract:symptoms, demographics and medical history', EXTRACTION_PROMPT_VERSION)]
+    
+    # Other sessions keep their own budget; a process budget stops them all
+    other = consult(manager, ["It stings when I urinate, since this morning"])
+    assert other.over_budget is None and other.llm_client is client
+    ledger.process_budget = ledger.total.total_tokens
+    assert ledger.exceeded(other.session_id) == 'process'
+    
+    manager.end_session(conversation.session_id)
+    assert ledger.session_usage(conversation.session_id).calls == 0
+    assert manager.stats()['tokens']['calls'] == client.client.calls == 2
+
+
+def test_report_ranks_prompts_from_jsonl_and_archives(tmp_path):
+    """Test: Logged usage is read back from both live segments and archives and grouped by prompt"""
+    base = str(tmp_path / 'sessions')
+    logger = EvaluationLogger(base, max_segment_bytes=2000, batch_size=8)
+    ledger = TokenLedger(evaluation_logger=logger)
+    for i in range(40):
+        ledger.record('extract:demographic information', '1', 'gemini-2.5-flash', 300, 40, context=(f"s{i}", 'demographic_collection'))
+        ledger.record('respond:treatment', '1', 'gemini-2.5-flash', 100, 400, context=(f"s{i}", 'clinical_assessment'))
+    logger.flush()
+    assert len(log_segments(base)) > 2
+    compact(base, delete=True)
+
+    report = usage_report(base)
+    assert set(report) == {'extract:demographic information (v1)', 'respond:treatment (v1)'}
+    assert report['respond:treatment (v1)'].calls == 40
+    assert report['respond:treatment (v1)'].output_tokens == 16000
+    # Output tokens cost more, so the shorter prompt with the longer answer ranks first
+    ranked = sorted(report, key=lambda key: report[key].cost(), reverse=True)
+    assert ranked[0] == 'respond:treatment (v1)'
+    assert sum(usage.calls for usage in usage_report(base, by='session_id').values()) == 80
@@ -0,0 +1,67 @@
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from core.conversation import ConversationManager
+from utils.tracing import Tracer, Histogram, NULL_SPAN
+
+
+def test_spans_feed_histograms_and_exports(tmp_path):
+    """Test: Spans land in per (stage, state, backend) histograms, exported as Prometheus text and JSON"""
+    tracer = Tracer(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.5):
+        tracer.record('parse', seconds, session_id='s1', state='greeting', backend='basic')
+    with tracer.span('generate', session_id='s1', state='greeting', backend='basic') as span:
+        span.tag(state='symptom_collection')
+    
+    text = tracer.prometheus_text()
+    assert 'uti_agent_stage_seconds_bucket{stage="parse",state="greeting",backend="basic",le="0.01"} 1' in text
+    assert 'uti_agent_stage_seconds_bucket{stage="parse",state="greeting",backend="basic",le="+Inf"} 3' in text
+    assert 'uti_agent_stage_seconds_count{stage="generate",state="symptom_collection",backend="basic"} 1' in text
+    # Session ids are only on individual spans, never labels
+    assert 's1' not in text and tracer.spans[0]['session_id'] == 's1'
+    
+    histogram = Histogram((1.0, 2.0))
+    for value in (0.5, 1.5, 1.5, 1.5):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 1.0 + 1.0 * (2 - 1) / 3
+    
+    tracer.dump(str(tmp_path / 'trace.json'))
+    dumped = json.loads((tmp_path / 'trace.json').read_text())
+    assert [h['count'] for h in dumped['histograms']] == [1, 3]
+
+
+def test_disabled_tracer_records_nothing():
+    """Test: Without a tracer, a consultation runs through the shared no-op span"""
+    manager = ConversationManager(enable_llm=False)
+    assert manager._span('parse') is NULL_SPAN
+    manager.process_input("I have burning when I pee since yesterday")
+    assert manager.tracer.histograms == {} and len(manager.tracer.spans) == 0
+    
+    tracer = Tracer()
+    manager = ConversationManager(enable_llm=False, tracer=tracer)
+    manager.process_input("I have burning when I pee since yesterday")
+    assert {span['backend'] for span in tracer.spans} == {'basic'}
+
+
+def test_abandoned_stream_still_finishes_its_span():
+    """Test: A reply stream closed mid-generation records its generate span as aborted"""
+    tracer = Tracer()
+    manager = ConversationManager(enable_llm=False, tracer=tracer)
+    
+    async def first_chunk():
+        stream = manager.process_input_stream_async("I have burning when I pee since yesterday")
+        await stream.__anext__()
+        await stream.aclose()
+    
+    asyncio.run(first_chunk())
+    generate = [span for span in tracer.spans if span['stage'] == 'generate']
+    assert len(generate) == 1 and generate[0]['status'] == 'aborted'
+    
+    with pytest.raises(RuntimeError):
+        with tracer.span('render'):
+            raise RuntimeError("terminal closed")
+    assert tracer.spans[-1]['status'] == 'error'
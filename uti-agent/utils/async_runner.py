@@ -0,0 +1,52 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+
+class BackgroundLoop:
+    """Event loop running on a daemon thread, used to drive async code from sync callers.
+
+    Keeping one long-lived loop (instead of asyncio.run per call) lets async
+    clients reuse their connections and lets background tasks keep running
+    between sync calls.
+    """
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="uti-agent-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("run_sync() cannot be called from the background loop; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+_background_loop = BackgroundLoop()
+
+
+def run_sync(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Run a coroutine to completion on the shared background loop"""
+    return _background_loop.run(coro)
+
+
+def iterate_sync(stream: AsyncIterator[Any]) -> Iterator[Any]:
+    """Consume an async iterator from sync code, one item at a time, on the background loop"""
+    async def next_item():
+        return await stream.__anext__()
+
+    while True:
+        try:
+            yield run_sync(next_item())
+        except StopAsyncIteration:
+            return
@@ -0,0 +1,323 @@
+"""
+Append-only, hash-chained audit log of clinical decisions.
+
+Every entry is one line of an AuditLog segment (<base>.000001.wal, ...):
+
+    <seq> <prev hash> <hash> <compact JSON payload>
+
+where hash = sha256(prev hash + b"<seq> " + payload) and the first entry
+chains from 32 zero bytes. Changing, removing or reordering any entry breaks
+the chain from that point on, and sequence numbers expose gaps.
+
+append() only queues the entry. A writer thread hashes, writes and fsyncs
+whatever has queued since its last commit as one batch (group commit), so
+under load many decisions share each fsync. Callers that must not act on a
+decision before it is durable wait with sync() or await sync_async(). A
+write that still fails after `write_attempts` tries stops the log: later
+appends and async waits raise AuditLogError, and sync() returns False.
+
+Verify a log (or one segment) with:
+
+    python -m utils.audit_log verify logs/audit
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+GENESIS_HASH = bytes(32)
+# How long sync_async waits for a commit before giving up
+DEFAULT_SYNC_TIMEOUT = 5.0
+_SEGMENT_PATTERN = re.compile(r'\.(\d{6})\.wal$')
+
+
+def segment_path(base_path: str, index: int) -> str:
+    return f"{base_path}.{index:06d}.wal"
+
+
+def segment_paths(base_path: str) -> List[str]:
+    """Existing segments for base_path, oldest first"""
+    paths = [p for p in glob.glob(glob.escape(base_path) + '.*.wal') if _SEGMENT_PATTERN.search(p)]
+    return sorted(paths, key=lambda p: int(_SEGMENT_PATTERN.search(p).group(1)))
+
+
+def chain_hash(prev: bytes, seq: int, payload: bytes) -> bytes:
+    return hashlib.sha256(prev + b'%d ' % seq + payload).digest()
+
+
+class AuditLogError(RuntimeError):
+    pass
+
+
+class AuditLog:
+    def __init__(self, base_path: str, max_segment_bytes: int = 64 * 1024 * 1024, fsync: bool = True,
+                 write_attempts: int = 5):
+        self.base_path = base_path
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        self.write_attempts = write_attempts
+        self.commits = 0
+        self.logger = logging.getLogger('uti_agent.audit')
+
+        os.makedirs(os.path.dirname(os.path.abspath(base_path)), exist_ok=True)
+        segments = segment_paths(base_path)
+        self._segment_index = int(_SEGMENT_PATTERN.search(segments[-1]).group(1)) if segments else 1
+        self._seq, self._last_hash = self._recover(segments[-1]) if segments else (0, GENESIS_HASH)
+        self._file = open(self.segment_path, 'ab')
+        self._segment_bytes = self._file.tell()
+
+        self._pending: List[Dict[str, Any]] = []
+        self._appended = self._seq
+        self._durable = self._seq
+        self._waiters: List[Tuple[int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._closed = False
+        # The write error that stopped the writer, if any
+        self._failure: Optional[OSError] = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="uti-agent-audit-log", daemon=True)
+        self._thread.start()
+
+    @property
+    def segment_path(self) -> str:
+        return segment_path(self.base_path, self._segment_index)
+
+    @property
+    def durable_seq(self) -> int:
+        return self._durable
+
+    @property
+    def failed(self) -> bool:
+        return self._failure is not None
+
+    def _recover(self, path: str) -> Tuple[int, bytes]:
+        """Chain position at the end of the last segment; a torn final line was never acknowledged and is cut off"""
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                self.logger.warning(f"Truncating {len(data) - end} bytes of incomplete audit entry in {path}")
+                f.truncate(end)
+        if end == 0:
+            return 0, GENESIS_HASH
+        start = data.rfind(b'\n', 0, end - 1) + 1
+        seq, _, digest, _ = data[start:end].split(b' ', 3)
+        return int(seq), bytes.fromhex(digest.decode())
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Queue an entry and return its sequence number; it is durable once durable_seq reaches it"""
+        with self._cond:
+            if self._failure is not None:
+                raise AuditLogError(f"Audit log stopped after a write failure: {self._failure}")
+            if self._closed:
+                raise RuntimeError("Audit log is closed")
+            self._pending.append(entry)
+            self._appended += 1
+            self._cond.notify()
+            return self._appended
+
+    def sync(self, seq: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """Block until entry `seq` (default: everything appended so far) is on disk"""
+        with self._cond:
+            target = self._appended if seq is None else seq
+            return self._cond.wait_for(lambda: self._durable >= target or self._failure is not None
+                                       or not self._thread.is_alive(), timeout) and self._durable >= target
+
+    async def sync_async(self, seq: Optional[int] = None, timeout: Optional[float] = DEFAULT_SYNC_TIMEOUT):
+        """sync() for event-loop callers; waits without holding a thread.
+
+        Raises AuditLogError if the entry is not durable within `timeout` seconds,
+        or if the writer has stopped.
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            target = self._appended if seq is None else seq
+            if self._durable >= target:
+                return
+            if self._failure is not None or not self._thread.is_alive():
+                raise AuditLogError(f"Audit log writer stopped before entry {target} was durable: {self._failure}")
+            future = loop.create_future()
+            waiter = (target, loop, future)
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            raise AuditLogError(f"Audit entry {target} not durable after {timeout}s") from None
+
+    def _run(self):
+        attempts = 0
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+            try:
+                self._commit(batch)
+                attempts = 0
+            except OSError as e:
+                attempts += 1
+                # Leave the entries unacknowledged; waiters see a failure rather than a false commit
+                self.logger.error(f"Audit log write failed ({attempts}/{self.write_attempts}), "
+                                  f"{len(batch)} entries not durable: {e}")
+                with self._cond:
+                    self._pending[:0] = batch
+                    if attempts >= self.write_attempts:
+                        # The chain cannot skip entries, so nothing after them can be committed either
+                        self._failure = e
+                        waiters, self._waiters = self._waiters, []
+                        self._cond.notify_all()
+                if self._failure is not None:
+                    for _, loop, future in waiters:
+                        loop.call_soon_threadsafe(_fail, future, AuditLogError(f"Audit log write failed: {e}"))
+                    return
+                time.sleep(0.1)
+
+    def _commit(self, batch: List[Dict[str, Any]]):
+        seq, prev = self._seq, self._last_hash
+        lines = []
+        for entry in batch:
+            seq += 1
+            payload = json.dumps(entry, separators=(',', ':'), sort_keys=True, default=str).encode('utf-8')
+            digest = chain_hash(prev, seq, payload)
+            lines.append(b'%d %s %s %s\n' % (seq, prev.hex().encode(), digest.hex().encode(), payload))
+            prev = digest
+        data = b''.join(lines)
+
+        if self._segment_bytes and self._segment_bytes + len(data) > self.max_segment_bytes:
+            self._file.close()
+            self._segment_index += 1
+            self._file = open(self.segment_path, 'ab')
+            self._segment_bytes = 0
+        start = self._file.tell()
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            self._file.truncate(start)
+            raise
+        self._segment_bytes += len(data)
+        self._seq, self._last_hash = seq, prev
+        self.commits += 1
+
+        with self._cond:
+            self._durable = seq
+            self._cond.notify_all()
+            ready = [w for w in self._waiters if w[0] <= seq]
+            self._waiters = [w for w in self._waiters if w[0] > seq]
+        for _, loop, future in ready:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._file.close()
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _fail(future: asyncio.Future, error: Exception):
+    if not future.done():
+        future.set_exception(error)
+
+
+@dataclass
+class VerifyResult:
+    entries: int = 0
+    first_seq: Optional[int] = None
+    last_seq: int = 0
+    last_hash: bytes = GENESIS_HASH
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def verify_segment(path: str, result: Optional[VerifyResult] = None) -> VerifyResult:
+    """Check one segment's chain; pass the result of the previous segment to continue across segments"""
+    continuing = result is not None
+    result = result or VerifyResult()
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data and not data.endswith(b'\n'):
+        result.errors.append(f"{path}: incomplete final entry")
+        data = data[:data.rfind(b'\n') + 1]
+
+    expected_seq, prev = result.last_seq, result.last_hash
+    for line_no, line in enumerate(data.splitlines(), 1):
+        try:
+            seq_text, prev_hex, hash_hex, payload = line.split(b' ', 3)
+            seq, claimed_prev, claimed = int(seq_text), bytes.fromhex(prev_hex.decode()), bytes.fromhex(hash_hex.decode())
+        except ValueError:
+            result.errors.append(f"{path}:{line_no}: malformed entry")
+            continue
+
+        if result.first_seq is None:
+            result.first_seq = seq
+            if not continuing:
+                # A lone segment may start anywhere in the chain; trust its first link
+                expected_seq, prev = seq - 1, claimed_prev
+        if seq != expected_seq + 1:
+            result.errors.append(f"{path}:{line_no}: sequence {seq} follows {expected_seq}")
+        if claimed_prev != prev:
+            result.errors.append(f"{path}:{line_no}: entry {seq} does not link to the previous entry")
+        if chain_hash(claimed_prev, seq, payload) != claimed:
+            result.errors.append(f"{path}:{line_no}: entry {seq} hash mismatch")
+        expected_seq, prev = seq, claimed
+        result.entries += 1
+
+    result.last_seq, result.last_hash = expected_seq, prev
+    return result
+
+
+def verify(base_path: str) -> VerifyResult:
+    """Check every segment of a log as one chain starting from the genesis hash"""
+    result = VerifyResult()
+    for path in segment_paths(base_path):
+        verify_segment(path, result)
+    if result.first_seq not in (None, 1):
+        result.errors.append(f"{base_path}: chain starts at sequence {result.first_seq}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit log tools")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    verify_parser = subcommands.add_parser('verify', help="Check hash chain and sequence numbers")
+    verify_parser.add_argument('path', help="Log base path, or a single .wal segment")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = verify_segment(args.path) if args.path.endswith('.wal') else verify(args.path)
+    elapsed = time.perf_counter() - started
+    for error in result.errors:
+        print(error)
+    status = "OK" if result.ok else f"FAILED ({len(result.errors)} problems)"
+    print(f"{status}: {result.entries} entries, sequence {result.first_seq}-{result.last_seq}, {elapsed:.2f}s")
+    sys.exit(0 if result.ok else 1)
+
+
+if __name__ == "__main__":
+    main()
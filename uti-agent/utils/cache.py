@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, Callable
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    llm_seconds: float = 0.0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def estimated_seconds_saved(self) -> float:
+        """Hits multiplied by the mean latency of the LLM calls made on misses"""
+        return self.hits * (self.llm_seconds / self.misses) if self.misses else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        stats.update(
+            hits=self.hits,
+            hit_rate=round(self.hit_rate, 4),
+            llm_calls_avoided=self.hits,
+            estimated_seconds_saved=round(self.estimated_seconds_saved, 3)
+        )
+        return stats
+
+
+class LRUCache:
+    """In-process cache bounded by entry count, with per-entry TTL"""
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk cache shared across processes, bounded by row count, with per-entry TTL.
+
+    Least recently used rows are evicted in batches once the table grows past
+    max_entries, so the size check does not run a DELETE on every insert.
+    """
+    def __init__(self, path: str, max_entries: int = 100_000, ttl_seconds: float = 7 * 24 * 3600,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_access ON extraction_cache(last_access)")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        now = self.clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                self._size -= 1
+                return None
+            self._conn.execute("UPDATE extraction_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = self.clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl_seconds, now)
+            )
+            # Replacing an existing key over-counts; the recount below corrects it
+            self._size += 1
+            # Evict down to 90% of capacity so the next few inserts skip this path
+            if self._size > self.max_entries:
+                self._conn.execute("DELETE FROM extraction_cache WHERE expires_at <= ?", (now,))
+                self._size = self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+                excess = self._size - int(self.max_entries * 0.9)
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM extraction_cache WHERE key IN "
+                        "(SELECT key FROM extraction_cache ORDER BY last_access LIMIT ?)", (excess,)
+                    )
+                    self.evictions += excess
+                    self._size -= excess
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class ExtractionCache:
+    """Two-tier cache for structured extraction results.
+
+    Lookups try the in-process LRU first, then the optional SQLite tier; disk
+    hits are promoted into memory. Values are stored as JSON so callers always
+    receive a fresh, independently mutable dict.
+    """
+    def __init__(self, memory: Optional[LRUCache] = None, disk: Optional[SQLiteCache] = None):
+        # An empty LRUCache is falsy, so test for None explicitly
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk
+        self.stats = CacheStats()
+
+    @classmethod
+    def from_env(cls) -> 'ExtractionCache':
+        """Memory-only unless UTI_AGENT_EXTRACTION_CACHE points at a SQLite file"""
+        path = os.getenv('UTI_AGENT_EXTRACTION_CACHE')
+        return cls(disk=SQLiteCache(path) if path else None)
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        text = re.sub(r'\s+', ' ', text.lower()).strip()
+        return text.strip(' .,!?;:')
+
+    @classmethod
+    def make_key(cls, user_input: str, expected_format: str, model: str, prompt_version: str, prompt: str = "") -> str:
+        parts = [prompt_version, model, prompt, expected_format, cls.normalize_text(user_input)]
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats.memory_hits += 1
+            return json.loads(value)
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.stats.disk_hits += 1
+                self.memory.set(key, value)
+                return json.loads(value)
+
+        self.stats.misses += 1
+        return None
+
+    def record_llm_call(self, seconds: float):
+        """Record the latency of the LLM call made after a miss"""
+        self.stats.llm_seconds += seconds
+
+    def set(self, key: str, data: Dict[str, Any]):
+        value = json.dumps(data)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+        self.stats.evictions = self.memory.evictions + (self.disk.evictions if self.disk else 0)
@@ -0,0 +1,264 @@
+"""
+Offline stand-in for the Gemini API, for tests, load tests and benchmarks.
+
+FakeGenaiClient implements the part of google.genai.Client that GeminiClient
+calls (models.generate_content and generate_content_stream, and the same
+under .aio), so prompt building, caching and response parsing all run
+unchanged. Each call answers with, in order of preference:
+- a recorded response for the exact (system instruction, prompt) pair
+- for extraction prompts, JSON with the keys the response schema (or the
+  prose format in the prompt) asks for, filled in by the keyword parsers
+  from the patient's message
+- a templated reply for conversational prompts
+
+Responses carry usage metadata under the genai field names, estimated at
+four characters per token.
+
+Latency and injected failures are drawn from a generator seeded by the
+prompt and how many times it has been sent, so a replay is reproducible
+however its calls interleave.
+
+    client = fake_gemini_client(latency=LatencyModel(p50=0.4, p99=1.5), error_rate=0.01)
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from core.input_parser import InputParser
+from utils.cache import ExtractionCache
+from utils.llm_client import GeminiClient, estimate_tokens
+
+# Standard normal quantile of the 99th percentile
+_Z99 = 2.3263
+_PATIENT_INPUT = re.compile(r'Patient input: "(.*)"', re.DOTALL)
+_FORMAT_KEY = re.compile(r'"(\w+)":')
+
+RULE_REPLIES = {
+    'followup': "Thank you for letting me know. To make sure I give you the right advice, "
+                "could you tell me a little more about that?",
+    'treatment': "Based on what you've told me, you may be suitable for treatment from your pharmacist. "
+                 "Take the full course as directed, drink plenty of fluids, and contact a doctor if your "
+                 "symptoms get worse or do not improve within 48 hours.",
+    'referral': "Thank you for answering my questions. Based on your answers, it's best for a doctor to "
+                "assess you in person so you get the right care. Please book an appointment with your GP, "
+                "or call 111 if your symptoms get worse.",
+    'general': "Thank you. I've noted that."
+}
+
+
+class FakeLLMError(RuntimeError):
+    """An injected API failure"""
+
+
+@dataclass
+class LatencyModel:
+    """Log-normal latency with the given median and 99th percentile, in seconds"""
+    p50: float = 0.0
+    p99: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.p50 <= 0:
+            return 0.0
+        if self.p99 <= self.p50:
+            return self.p50
+        sigma = math.log(self.p99 / self.p50) / _Z99
+        return self.p50 * math.exp(rng.gauss(0.0, sigma))
+
+
+@dataclass
+class FakeUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+    thoughts_token_count: int = 0
+    cached_content_token_count: Optional[int] = None
+
+    @property
+    def total_token_count(self) -> int:
+        return self.prompt_token_count + self.candidates_token_count + self.thoughts_token_count
+
+
+@dataclass
+class FakeResponse:
+    text: str
+    usage_metadata: Optional[FakeUsage] = None
+
+
+def load_recordings(path: str) -> Dict[Tuple[str, str], str]:
+    """Recorded responses from a JSONL file of {"system_instruction", "contents", "text"} objects"""
+    recordings = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings[(entry.get('system_instruction') or '', entry['contents'])] = entry['text']
+    return recordings
+
+
+def rule_extraction(fields: List[str], user_input: str) -> Dict[str, Any]:
+    """The requested fields, as the keyword parsers read the message"""
+    patient = InputParser().extract_patient_data(user_input)
+    symptoms, demographics, history = patient.symptoms, patient.demographics, patient.history
+    text = user_input.lower()
+    values = {
+        # Every packed flag, symptoms and complications alike
+        **{name: getattr(symptoms, name) for name in symptoms.FLAG_BITS},
+        **{name: getattr(history, name) for name in history.FLAG_BITS},
+        'onset': symptoms.onset or None, 'severity': symptoms.severity,
+        'age': demographics.age or None, 'sex': demographics.sex or None,
+        'weight': demographics.weight, 'pregnancy_status': demographics.pregnancy_status,
+        'allergies': history.allergies, 'allergies_mentioned': 'allerg' in text,
+        'current_medications': history.current_medications, 'previous_utis': []
+    }
+    return {key: values.get(key) for key in fields}
+
+
+def rule_reply(system_instruction: str) -> str:
+    instruction = system_instruction.lower()
+    for kind in ('follow-up', 'treatment', 'referral'):
+        if kind in instruction:
+            return RULE_REPLIES[kind.replace('-', '')]
+    return RULE_REPLIES['general']
+
+
+class FakeGenaiClient:
+    """Deterministic replacement for google.genai.Client.
+
+    `latency` is the time to the whole response, or to the first chunk when
+    streaming; later chunks of `chunk_chars` characters follow every
+    `chunk_interval` seconds. A call fails with FakeLLMError with
+    probability `error_rate`, before anything is returned.
+    """
+    backend = 'fake'
+
+    def __init__(self, recordings: Optional[Dict[Tuple[str, str], str]] = None,
+                 latency: Optional[LatencyModel] = None, chunk_interval: float = 0.0,
+                 chunk_chars: int = 40, error_rate: float = 0.0, seed: int = 0):
+        self.recordings = recordings or {}
+        self.latency = latency or LatencyModel()
+        self.chunk_interval = chunk_interval
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self.errors = 0
+        self.recorded_hits = 0
+        self._sent: Counter = Counter()
+        self._lock = threading.Lock()
+        self.models = _Models(self)
+        self.aio = _AsyncClient(self)
+
+    def _plan(self, contents: str, config) -> Tuple[List[str], float]:
+        """The response chunks (none for an injected failure) and the delay before the first one"""
+        system_instruction = getattr(config, 'system_instruction', None) or ''
+        with self._lock:
+            occurrence = self._sent[(system_instruction, contents)]
+            self._sent[(system_instruction, contents)] += 1
+            self.calls += 1
+        rng = random.Random(f"{self.seed}\x1f{occurrence}\x1f{system_instruction}\x1f{contents}")
+        delay = self.latency.sample(rng)
+        if rng.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return [], delay
+        text = self.recordings.get((system_instruction, contents))
+        if text is not None:
+            with self._lock:
+                self.recorded_hits += 1
+        else:
+            match = _PATIENT_INPUT.search(contents)
+            schema = getattr(config, 'response_schema', None)
+            if match:
+                fields = list(schema['properties']) if schema else _FORMAT_KEY.findall(system_instruction)
+                text = json.dumps(rule_extraction(fields, match.group(1)))
+            else:
+                text = rule_reply(system_instruction)
+        size = max(1, self.chunk_chars)
+        return [text[i:i + size] for i in range(0, len(text), size)] or [''], delay
+
+    def _total_delay(self, chunks: List[str], delay: float) -> float:
+        return delay + self.chunk_interval * max(0, len(chunks) - 1)
+
+    def _responses(self, chunks: List[str], contents: str, config) -> List[FakeResponse]:
+        """One response per chunk, each with the usage so far, as the streaming API reports it"""
+        system_instruction = getattr(config, 'system_instruction', None) or ''
+        prompt_tokens = estimate_tokens(system_instruction + contents)
+        schema = getattr(config, 'response_schema', None)
+        if schema:
+            prompt_tokens += estimate_tokens(json.dumps(schema))
+        responses, text = [], ''
+        for chunk in chunks:
+            text += chunk
+            responses.append(FakeResponse(chunk, FakeUsage(prompt_tokens, estimate_tokens(text))))
+        return responses
+
+    def _response(self, chunks: List[str], contents: str, config) -> FakeResponse:
+        return FakeResponse(''.join(chunks), self._responses(chunks, contents, config)[-1].usage_metadata)
+
+
+def _failed() -> FakeLLMError:
+    return FakeLLMError("Injected fake LLM failure")
+
+
+class _Models:
+    def __init__(self, fake: FakeGenaiClient):
+        self._fake = fake
+
+    def generate_content(self, model: str, contents: str, config=None) -> FakeResponse:
+        chunks, delay = self._fake._plan(contents, config)
+        time.sleep(self._fake._total_delay(chunks, delay))
+        if not chunks:
+            raise _failed()
+        return self._fake._response(chunks, contents, config)
+
+    def generate_content_stream(self, model: str, contents: str, config=None) -> Iterator[FakeResponse]:
+        chunks, delay = self._fake._plan(contents, config)
+        time.sleep(delay)
+        if not chunks:
+            raise _failed()
+        for i, response in enumerate(self._fake._responses(chunks, contents, config)):
+            if i:
+                time.sleep(self._fake.chunk_interval)
+            yield response
+
+
+class _AsyncModels:
+    def __init__(self, fake: FakeGenaiClient):
+        self._fake = fake
+
+    async def generate_content(self, model: str, contents: str, config=None) -> FakeResponse:
+        chunks, delay = self._fake._plan(contents, config)
+        await asyncio.sleep(self._fake._total_delay(chunks, delay))
+        if not chunks:
+            raise _failed()
+        return self._fake._response(chunks, contents, config)
+
+    async def generate_content_stream(self, model: str, contents: str, config=None) -> AsyncIterator[FakeResponse]:
+        chunks, delay = self._fake._plan(contents, config)
+        await asyncio.sleep(delay)
+        if not chunks:
+            raise _failed()
+        return self._stream(self._fake._responses(chunks, contents, config))
+
+    async def _stream(self, responses: List[FakeResponse]) -> AsyncIterator[FakeResponse]:
+        for i, response in enumerate(responses):
+            if i:
+                await asyncio.sleep(self._fake.chunk_interval)
+            yield response
+
+
+class _AsyncClient:
+    def __init__(self, fake: FakeGenaiClient):
+        self.models = _AsyncModels(fake)
+
+
+def fake_gemini_client(recordings_path: Optional[str] = None, cache: Optional[ExtractionCache] = None,
+                       **options) -> GeminiClient:
+    """A GeminiClient backed by FakeGenaiClient(**options), with its own in-memory extraction cache"""
+    recordings = load_recordings(recordings_path) if recordings_path else None
+    return GeminiClient(client=FakeGenaiClient(recordings, **options), cache=cache if cache is not None else ExtractionCache())
@@ -1,59 +1,151 @@
 import os
 import json
-from typing import Dict, Any, Optional
+import math
+import time
+from typing import Dict, Any, Optional, Iterator, AsyncIterator, Tuple, Union
 from google import genai
 from google.genai import types
+from utils.cache import ExtractionCache
+from utils.token_ledger import TokenLedger, call_context
+
+# Bump whenever the extraction system prompt changes so cached results are not reused
+EXTRACTION_PROMPT_VERSION = "2"
+# Bump whenever the conversational system prompts change, so token reports compare like with like
+RESPONSE_PROMPT_VERSION = "1"
+
+# Sent with every schema-constrained extraction; the fields and their meaning come from the response schema
+EXTRACTION_INSTRUCTION = ("You are a medical information extraction system. Fill in the response schema from the patient's message. "
+                          "Only include information that is explicitly mentioned or clearly implied; leave everything else "
+                          "null, false or empty.")
+
+DANGEROUS_PHRASES = [
+    "guaranteed cure",
+    "definitely have",
+    "certain diagnosis",
+    "no need to see doctor",
+    "skip medical care"
+]
+
+
+def is_response_safe(response: str) -> bool:
+    """Basic safety validation for generated responses"""
+    response_lower = response.lower()
+    return not any(phrase in response_lower for phrase in DANGEROUS_PHRASES)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token"""
+    return math.ceil(len(text) / 4)
 
 
 class GeminiClient:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[ExtractionCache] = None, client=None,
+                 ledger: Optional[TokenLedger] = None):
+        """`client` replaces the genai.Client, e.g. with utils.fake_llm.FakeGenaiClient, and needs no API key"""
         self.api_key = api_key or os.getenv('GOOGLE_API_KEY') or os.getenv('GEMINI_API_KEY')
-        if not self.api_key:
+        if client is None and not self.api_key:
             raise ValueError("API key is required. Set GOOGLE_API_KEY environment variable or pass api_key parameter.")
-        
-        self.client = genai.Client(api_key=self.api_key)
+
+        self.client = client if client is not None else genai.Client(api_key=self.api_key)
+        # Tags latency spans, so fake and real backends are never mixed in one histogram
+        self.backend = 'gemini' if client is None else getattr(client, 'backend', type(client).__name__)
         self.model = 'gemini-2.5-flash'
-    
-    def generate_structured_response(self, prompt: str, system_instruction: str = "", max_tokens: int = 1000, temperature: float = 0.3) -> str:
-        """Generate a response with specific formatting requirements"""
-        try:
-            config = types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                max_output_tokens=max_tokens,
-                temperature=temperature
-            )
-            
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=config
-            )
-            
-            return response.text.strip() if response.text else ""
-        
-        except Exception as e:
-            print(f"Error generating response: {e}")
-            return ""
-    
-    def extract_structured_data(self, prompt: str, user_input: str, expected_format: str) -> Dict[str, Any]:
-        """Extract structured data from user input using LLM"""
+        self.cache = cache if cache is not None else ExtractionCache.from_env()
+        # Token usage of every call; unlimited unless SessionManager installs one with budgets
+        self.ledger = ledger if ledger is not None else TokenLedger()
+        # Validating a config copies its schema (~0.4 ms), so each schema's config is built once
+        self._schema_keys: Dict[int, Tuple[Dict[str, Any], str]] = {}
+        self._extraction_configs: Dict[str, types.GenerateContentConfig] = {}
+        self._aio = None
+
+    @property
+    def aio(self) -> 'AsyncGeminiClient':
+        """Async view of this client, sharing its connection and configuration"""
+        if self._aio is None:
+            self._aio = AsyncGeminiClient(sync_client=self)
+        return self._aio
+
+    def _build_config(self, system_instruction: str, max_tokens: int, temperature: float) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            max_output_tokens=max_tokens,
+            temperature=temperature
+        )
+
+    def _schema_key(self, schema: Dict[str, Any]) -> str:
+        # The entry keeps the schema alive, so its id cannot be reused by another dict
+        entry = self._schema_keys.get(id(schema))
+        if entry is None or entry[0] is not schema:
+            if len(self._schema_keys) >= 64:
+                self._schema_keys.clear()
+            entry = self._schema_keys[id(schema)] = (schema, json.dumps(schema, sort_keys=True))
+        return entry[1]
+
+    def _extraction_config(self, schema: Dict[str, Any]) -> types.GenerateContentConfig:
+        key = self._schema_key(schema)
+        config = self._extraction_configs.get(key)
+        if config is None:
+            if len(self._extraction_configs) >= 64:
+                self._extraction_configs.clear()
+            config = self._extraction_configs[key] = self._build_extraction_config(schema)
+        return config
+
+    def _build_extraction_config(self, schema: Dict[str, Any]) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=EXTRACTION_INSTRUCTION,
+            max_output_tokens=1000,
+            temperature=0.1,
+            response_mime_type='application/json',
+            response_schema=schema,
+            # Filling in a schema needs no reasoning; thinking would only add latency and output tokens
+            thinking_config=types.ThinkingConfig(thinking_budget=0)
+        )
+
+    @staticmethod
+    def _extraction_contents(user_input: str) -> str:
+        return f'Patient input: "{user_input}"'
+
+    def _build_extraction_prompts(self, user_input: str, expected_format: str) -> tuple[str, str]:
+        """Prompts for a prose `expected_format`; schemas go through _extraction_config instead"""
         system_prompt = f"""You are a medical information extraction system. Extract relevant information from patient input and return it in the specified JSON format.
 
 {expected_format}
 
 Only include fields that are explicitly mentioned or clearly implied by the user. Use null for missing information."""
-        
+
         full_prompt = f"""Patient input: "{user_input}"
 
 Extract the relevant information and return as JSON:"""
-        
+        return system_prompt, full_prompt
+
+    def _record_usage(self, response, purpose: str, prompt_version: str, context):
+        """Report a response's usage metadata to the ledger; thinking tokens are billed as output"""
+        usage = getattr(response, 'usage_metadata', None) if response is not None else None
+        if usage is None:
+            return
+        output_tokens = (usage.candidates_token_count or 0) + (getattr(usage, 'thoughts_token_count', None) or 0)
+        self.ledger.record(purpose, prompt_version, self.model, usage.prompt_token_count or 0, output_tokens,
+                           getattr(usage, 'cached_content_token_count', None) or 0, context)
+
+    def _cache_key(self, prompt: str, user_input: str, expected_format: Union[str, Dict[str, Any]]) -> str:
+        if not isinstance(expected_format, str):
+            expected_format = self._schema_key(expected_format)
+        return ExtractionCache.make_key(user_input, expected_format, self.model, EXTRACTION_PROMPT_VERSION, prompt)
+
+    def _store_extraction(self, key: str, extracted: Dict[str, Any], started: float):
+        self.cache.record_llm_call(time.perf_counter() - started)
+        # Empty results mean the call or the parse failed; retry those next time
+        if extracted:
+            self.cache.set(key, extracted)
+
+    def _parse_extraction_response(self, response: str) -> Dict[str, Any]:
         try:
-            response = self.generate_structured_response(
-                full_prompt, 
-                system_instruction=system_prompt,
-                temperature=0.1
-            )
-            
+            # Schema-constrained responses are exactly one JSON object
+            if response.startswith('{'):
+                try:
+                    return json.loads(response)
+                except json.JSONDecodeError:
+                    pass
             # Try to parse JSON response
             if response:
                 # Clean response to extract JSON
@@ -62,48 +154,264 @@ Extract the relevant information and return as JSON:"""
                 if start != -1 and end > start:
                     json_str = response[start:end]
                     return json.loads(json_str)
-            
+
             return {}
-        
+
         except json.JSONDecodeError:
             print(f"Failed to parse JSON response: {response}")
             return {}
-        except Exception as e:
-            print(f"Error extracting structured data: {e}")
-            return {}
-    
-    def generate_conversational_response(self, context: str, user_input: str, response_type: str = "general") -> str:
-        """Generate natural, empathetic responses for conversation"""
+
+    @staticmethod
+    def _extraction_purpose(prompt: str) -> str:
+        """'Extract demographic information:' -> 'extract:demographic information'"""
+        task = prompt.rstrip(': ')
+        if task.lower().startswith('extract '):
+            task = task[len('extract '):]
+        return f"extract:{task}"
+
+    def _build_conversational_prompts(self, context: str, user_input: str, response_type: str) -> tuple[str, str]:
         system_prompts = {
             "followup": "You are a caring medical assistant asking follow-up questions. Be empathetic, clear, and professional.",
             "treatment": "You are a medical assistant explaining treatment recommendations. Be clear, reassuring, and include all necessary safety information.",
             "referral": "You are a medical assistant explaining referral recommendations. Be supportive and not alarming while explaining why professional care is needed.",
             "general": "You are a helpful medical assistant. Be empathetic, professional, and clear."
         }
-        
+
         system_instruction = system_prompts.get(response_type, system_prompts["general"])
-        
+
         prompt = f"""Context: {context}
 
 Patient said: "{user_input}"
 
 Respond appropriately:"""
-        
+        return system_instruction, prompt
+
+    def generate_structured_response(self, prompt: str, system_instruction: str = "", max_tokens: int = 1000, temperature: float = 0.3,
+                                     purpose: str = "structured", prompt_version: str = "") -> str:
+        """Generate a response with specific formatting requirements"""
+        return self._generate(prompt, self._build_config(system_instruction, max_tokens, temperature), purpose, prompt_version)
+
+    def _generate(self, contents: str, config: types.GenerateContentConfig, purpose: str, prompt_version: str) -> str:
+        context = call_context()
+        try:
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=contents,
+                config=config
+            )
+            self._record_usage(response, purpose, prompt_version, context)
+
+            return response.text.strip() if response.text else ""
+
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            return ""
+
+    def generate_structured_response_stream(self, prompt: str, system_instruction: str = "", max_tokens: int = 1000, temperature: float = 0.3,
+                                            purpose: str = "structured", prompt_version: str = "") -> Iterator[str]:
+        """Yield response text chunks as the model produces them"""
+        context = call_context()
+        # Usage metadata is cumulative; the last chunk carrying it covers the whole response
+        last = None
+        try:
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model,
+                contents=prompt,
+                config=self._build_config(system_instruction, max_tokens, temperature)
+            ):
+                if getattr(chunk, 'usage_metadata', None) is not None:
+                    last = chunk
+                if chunk.text:
+                    yield chunk.text
+
+        except Exception as e:
+            print(f"Error generating response: {e}")
+        finally:
+            self._record_usage(last, purpose, prompt_version, context)
+
+    def extract_structured_data(self, prompt: str, user_input: str, expected_format: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Extract structured data from user input using LLM.
+
+        `expected_format` is a response schema (see core.extraction_schema), or
+        a prose description of the JSON to return.
+        """
+        key = self._cache_key(prompt, user_input, expected_format)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            started = time.perf_counter()
+            if isinstance(expected_format, str):
+                system_prompt, full_prompt = self._build_extraction_prompts(user_input, expected_format)
+                response = self.generate_structured_response(
+                    full_prompt,
+                    system_instruction=system_prompt,
+                    temperature=0.1,
+                    purpose=self._extraction_purpose(prompt),
+                    prompt_version=EXTRACTION_PROMPT_VERSION
+                )
+            else:
+                response = self._generate(
+                    self._extraction_contents(user_input),
+                    self._extraction_config(expected_format),
+                    self._extraction_purpose(prompt),
+                    EXTRACTION_PROMPT_VERSION
+                )
+            extracted = self._parse_extraction_response(response)
+            self._store_extraction(key, extracted, started)
+            return extracted
+
+        except Exception as e:
+            print(f"Error extracting structured data: {e}")
+            return {}
+
+    def generate_conversational_response(self, context: str, user_input: str, response_type: str = "general") -> str:
+        """Generate natural, empathetic responses for conversation"""
+        system_instruction, prompt = self._build_conversational_prompts(context, user_input, response_type)
+
         return self.generate_structured_response(
             prompt,
             system_instruction=system_instruction,
-            temperature=0.7
+            temperature=0.7,
+            purpose=f"respond:{response_type}",
+            prompt_version=RESPONSE_PROMPT_VERSION
+        )
+
+    def generate_conversational_response_stream(self, context: str, user_input: str, response_type: str = "general") -> Iterator[str]:
+        system_instruction, prompt = self._build_conversational_prompts(context, user_input, response_type)
+
+        return self.generate_structured_response_stream(
+            prompt,
+            system_instruction=system_instruction,
+            temperature=0.7,
+            purpose=f"respond:{response_type}",
+            prompt_version=RESPONSE_PROMPT_VERSION
         )
-    
+
     def validate_response_safety(self, response: str) -> bool:
         """Basic safety validation for generated responses"""
-        dangerous_phrases = [
-            "guaranteed cure",
-            "definitely have",
-            "certain diagnosis",
-            "no need to see doctor",
-            "skip medical care"
-        ]
-        
-        response_lower = response.lower()
-        return not any(phrase in response_lower for phrase in dangerous_phrases)
\ No newline at end of file
+        return is_response_safe(response)
+
+
+class AsyncGeminiClient:
+    """Non-blocking counterpart of GeminiClient for use inside an event loop.
+
+    Prompt construction and response parsing are shared with the sync client;
+    only the network call differs, so both clients produce identical results.
+    """
+    def __init__(self, api_key: Optional[str] = None, sync_client: Optional[GeminiClient] = None):
+        self.sync_client = sync_client or GeminiClient(api_key=api_key)
+        if self.sync_client._aio is None:
+            self.sync_client._aio = self
+        self.client = self.sync_client.client.aio
+
+    @property
+    def model(self) -> str:
+        return self.sync_client.model
+
+    async def generate_structured_response(self, prompt: str, system_instruction: str = "", max_tokens: int = 1000, temperature: float = 0.3,
+                                           purpose: str = "structured", prompt_version: str = "") -> str:
+        """Generate a response with specific formatting requirements"""
+        return await self._generate(
+            prompt, self.sync_client._build_config(system_instruction, max_tokens, temperature), purpose, prompt_version
+        )
+
+    async def _generate(self, contents: str, config: types.GenerateContentConfig, purpose: str, prompt_version: str) -> str:
+        context = call_context()
+        try:
+            response = await self.client.models.generate_content(
+                model=self.model,
+                contents=contents,
+                config=config
+            )
+            self.sync_client._record_usage(response, purpose, prompt_version, context)
+
+            return response.text.strip() if response.text else ""
+
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            return ""
+
+    async def generate_structured_response_stream(self, prompt: str, system_instruction: str = "", max_tokens: int = 1000, temperature: float = 0.3,
+                                                  purpose: str = "structured", prompt_version: str = "") -> AsyncIterator[str]:
+        """Yield response text chunks as the model produces them"""
+        # Captured before the first chunk: when driven by iterate_sync, later steps run in a fresh context
+        context = call_context()
+        last = None
+        try:
+            stream = await self.client.models.generate_content_stream(
+                model=self.model,
+                contents=prompt,
+                config=self.sync_client._build_config(system_instruction, max_tokens, temperature)
+            )
+            async for chunk in stream:
+                if getattr(chunk, 'usage_metadata', None) is not None:
+                    last = chunk
+                if chunk.text:
+                    yield chunk.text
+
+        except Exception as e:
+            print(f"Error generating response: {e}")
+        finally:
+            self.sync_client._record_usage(last, purpose, prompt_version, context)
+
+    async def extract_structured_data(self, prompt: str, user_input: str, expected_format: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Extract structured data from user input using LLM"""
+        sync_client = self.sync_client
+        key = sync_client._cache_key(prompt, user_input, expected_format)
+        cached = sync_client.cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            started = time.perf_counter()
+            if isinstance(expected_format, str):
+                system_prompt, full_prompt = sync_client._build_extraction_prompts(user_input, expected_format)
+                response = await self.generate_structured_response(
+                    full_prompt,
+                    system_instruction=system_prompt,
+                    temperature=0.1,
+                    purpose=sync_client._extraction_purpose(prompt),
+                    prompt_version=EXTRACTION_PROMPT_VERSION
+                )
+            else:
+                response = await self._generate(
+                    sync_client._extraction_contents(user_input),
+                    sync_client._extraction_config(expected_format),
+                    sync_client._extraction_purpose(prompt),
+                    EXTRACTION_PROMPT_VERSION
+                )
+            extracted = sync_client._parse_extraction_response(response)
+            sync_client._store_extraction(key, extracted, started)
+            return extracted
+
+        except Exception as e:
+            print(f"Error extracting structured data: {e}")
+            return {}
+
+    async def generate_conversational_response(self, context: str, user_input: str, response_type: str = "general") -> str:
+        """Generate natural, empathetic responses for conversation"""
+        system_instruction, prompt = self.sync_client._build_conversational_prompts(context, user_input, response_type)
+
+        return await self.generate_structured_response(
+            prompt,
+            system_instruction=system_instruction,
+            temperature=0.7,
+            purpose=f"respond:{response_type}",
+            prompt_version=RESPONSE_PROMPT_VERSION
+        )
+
+    def generate_conversational_response_stream(self, context: str, user_input: str, response_type: str = "general") -> AsyncIterator[str]:
+        system_instruction, prompt = self.sync_client._build_conversational_prompts(context, user_input, response_type)
+
+        return self.generate_structured_response_stream(
+            prompt,
+            system_instruction=system_instruction,
+            temperature=0.7,
+            purpose=f"respond:{response_type}",
+            prompt_version=RESPONSE_PROMPT_VERSION
+        )
+
+    def validate_response_safety(self, response: str) -> bool:
+        return self.sync_client.validate_response_safety(response)
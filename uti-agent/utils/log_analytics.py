@@ -0,0 +1,274 @@
+"""
+Incremental session metrics from the evaluation log (see docs/03-agent-eval-CI.md).
+
+Reads the JSONL segments written by EvaluationLogger and folds each record
+into fixed-size counters per time window: referral rate, LLM parse failure
+and basic-parser fallback rates, the share of turns the deterministic
+extractor answered without the LLM, completion rate, session length and turn
+latency. The byte offset reached in every segment is checkpointed together
+with the counters, so a later run only reads what was appended since.
+Segments compacted by utils.log_archive are read from the archive instead,
+decoding only the columns the counters need.
+
+    python -m utils.log_analytics uti_agent_sessions [--checkpoint PATH] [--window 3600] [--follow 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Dict, Optional
+import numpy as np
+from utils.logger import iter_complete_lines, log_segments
+from utils.log_archive import ArchiveReader, archived_segments
+
+CHECKPOINT_VERSION = 1
+# (session type, archive table, columns WindowStats.add_columns reads)
+ARCHIVE_COLUMNS = [
+    ('conversation', 'turns', ('timestamp', 'turn', 'parser', 'latency_seconds')),
+    ('clinical_decision', 'decisions', ('timestamp', 'turn', 'status')),
+    (None, 'other', ('timestamp',))
+]
+
+
+def _rate(numerator: int, denominator: int) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+
+@dataclass
+class WindowStats:
+    start: float
+    turns: int = 0
+    llm_turns: int = 0
+    llm_empty_turns: int = 0
+    basic_turns: int = 0
+    rules_turns: int = 0
+    latency_seconds: float = 0.0
+    sessions_started: int = 0
+    decisions: int = 0
+    referrals: int = 0
+    decision_turns: int = 0
+
+    def add(self, session_type: str, data: Dict[str, Any]):
+        if session_type == 'conversation':
+            self.turns += 1
+            parser = data.get('parser')
+            if parser == 'llm':
+                self.llm_turns += 1
+            elif parser == 'llm_empty':
+                self.llm_empty_turns += 1
+            elif parser == 'basic':
+                self.basic_turns += 1
+            elif parser == 'rules':
+                self.rules_turns += 1
+            self.latency_seconds += data.get('latency_seconds') or 0.0
+            if data.get('turn') == 1:
+                self.sessions_started += 1
+        elif session_type == 'clinical_decision':
+            # Each session reaches exactly one decision, on the turn that completes it
+            self.decisions += 1
+            self.decision_turns += data.get('turn') or 0
+            if data.get('status') == 'requires_referral':
+                self.referrals += 1
+
+    def add_columns(self, session_type: Optional[str], columns: Dict[str, np.ndarray]):
+        """add() for many records of one type at once, from archive columns"""
+        if session_type == 'conversation':
+            parser = columns['parser']
+            self.turns += len(parser)
+            self.llm_turns += int(np.count_nonzero(parser == 'llm'))
+            self.llm_empty_turns += int(np.count_nonzero(parser == 'llm_empty'))
+            self.basic_turns += int(np.count_nonzero(parser == 'basic'))
+            self.rules_turns += int(np.count_nonzero(parser == 'rules'))
+            self.latency_seconds += float(np.nansum(columns['latency_seconds'], dtype=np.float64))
+            self.sessions_started += int(np.count_nonzero(columns['turn'] == 1))
+        elif session_type == 'clinical_decision':
+            self.decisions += len(columns['status'])
+            self.decision_turns += int(columns['turn'].sum())
+            self.referrals += int(np.count_nonzero(columns['status'] == 'requires_referral'))
+
+    def merge(self, other: 'WindowStats'):
+        for f in fields(self):
+            if f.name != 'start':
+                setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def metrics(self) -> Dict[str, Any]:
+        llm = self.llm_turns + self.llm_empty_turns
+        return {
+            'turns': self.turns,
+            'sessions_started': self.sessions_started,
+            'decisions': self.decisions,
+            'referral_rate': _rate(self.referrals, self.decisions),
+            'llm_parse_failure_rate': _rate(self.llm_empty_turns, llm),
+            'fallback_rate': _rate(self.basic_turns, llm + self.basic_turns),
+            # Turns that would have been an LLM call without the cascade
+            'llm_avoided_rate': _rate(self.rules_turns, llm + self.rules_turns),
+            'completion_rate': _rate(self.decisions, self.sessions_started),
+            'avg_session_turns': round(self.decision_turns / self.decisions, 2) if self.decisions else None,
+            'avg_turn_latency_seconds': round(self.latency_seconds / self.turns, 4) if self.turns else None
+        }
+
+
+class LogAnalytics:
+    """Aggregates over the segments of one evaluation log, resumable from a checkpoint file.
+
+    Only the newest `max_windows` windows are kept; older ones are folded
+    into `evicted`, so totals stay exact while memory stays bounded.
+    """
+    def __init__(self, base_path: str, checkpoint_path: Optional[str] = None,
+                 window_seconds: int = 3600, max_windows: int = 168):
+        self.base_path = base_path
+        self.checkpoint_path = checkpoint_path
+        self.window_seconds = window_seconds
+        self.max_windows = max_windows
+        self.offsets: Dict[str, int] = {}
+        self.windows: 'OrderedDict[float, WindowStats]' = OrderedDict()
+        self.evicted = WindowStats(start=0)
+        self.records = 0
+        self.malformed = 0
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        with open(self.checkpoint_path) as f:
+            state = json.load(f)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {state.get('version')}")
+        if state['window_seconds'] != self.window_seconds:
+            raise ValueError(f"Checkpoint uses {state['window_seconds']}s windows, not {self.window_seconds}s")
+        self.offsets = state['offsets']
+        self.windows = OrderedDict((w['start'], WindowStats(**w)) for w in state['windows'])
+        self.evicted = WindowStats(**state['evicted'])
+        self.records, self.malformed = state['records'], state['malformed']
+
+    def save_checkpoint(self):
+        # Written to a temporary file and renamed, so a crash never leaves a half-written checkpoint
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'window_seconds': self.window_seconds,
+            'offsets': self.offsets,
+            'windows': [asdict(w) for w in self.windows.values()],
+            'evicted': asdict(self.evicted),
+            'records': self.records,
+            'malformed': self.malformed
+        }
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, self.checkpoint_path)
+
+    def process(self) -> int:
+        """Read everything appended since the last run; returns the number of new records"""
+        before = self.records
+        segments = log_segments(self.base_path)
+        archives = archived_segments(self.base_path)
+        names = sorted(set(segments) | set(archives))
+        for name in names:
+            offset = self.offsets.get(name, 0)
+            if name in archives:
+                self.offsets[name] = self._process_archive(archives[name], offset)
+            else:
+                self.offsets[name] = self._process_segment(segments[name], offset)
+        # Forget segments that have been deleted
+        self.offsets = {name: offset for name, offset in self.offsets.items() if name in names}
+        if self.checkpoint_path:
+            self.save_checkpoint()
+        return self.records - before
+
+    def _process_segment(self, path: str, offset: int) -> int:
+        for start, line in iter_complete_lines(path, offset):
+            self._add_line(line)
+            offset = start + len(line) + 1
+        return offset
+
+    def _process_archive(self, path: str, offset: int) -> int:
+        # Offsets still count bytes of the original segment, so a segment archived halfway
+        # through being read resumes at the same record
+        reader = ArchiveReader(path)
+        end = reader.source['bytes']
+        if offset >= end:
+            return offset
+        for session_type, table, columns in ARCHIVE_COLUMNS:
+            for part in reader.scan(table, columns, where=[('source_offset', '>=', offset)]):
+                self._add_columns(session_type, part)
+        self.malformed += sum(1 for start in reader.source['malformed_offsets'] if start >= offset)
+        return end
+
+    def _add_columns(self, session_type: Optional[str], columns: Dict[str, np.ndarray]):
+        timestamps = columns['timestamp']
+        starts = timestamps - timestamps % self.window_seconds
+        for start in np.unique(starts):
+            rows = starts == start
+            window = self.windows.get(float(start))
+            if window is None:
+                window = self._open_window(float(start))
+            window.add_columns(session_type, {name: values[rows] for name, values in columns.items()})
+            self.records += int(np.count_nonzero(rows))
+
+    def _add_line(self, line: bytes):
+        try:
+            record = json.loads(line)
+            timestamp, session_type, data = record['timestamp'], record['session_type'], record['data']
+        except (ValueError, KeyError, TypeError):
+            self.malformed += 1
+            return
+        start = timestamp - timestamp % self.window_seconds
+        window = self.windows.get(start)
+        if window is None:
+            window = self._open_window(start)
+        window.add(session_type, data)
+        self.records += 1
+
+    def _open_window(self, start: float) -> WindowStats:
+        window = self.windows[start] = WindowStats(start=start)
+        if len(self.windows) > 1 and start < next(reversed(self.windows)):
+            # Records are almost always in time order; re-sort on the rare late one
+            self.windows = OrderedDict(sorted(self.windows.items()))
+        while len(self.windows) > self.max_windows:
+            _, oldest = self.windows.popitem(last=False)
+            self.evicted.merge(oldest)
+        return window
+
+    def totals(self) -> WindowStats:
+        total = WindowStats(start=0)
+        total.merge(self.evicted)
+        for window in self.windows.values():
+            total.merge(window)
+        return total
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'records': self.records,
+            'malformed': self.malformed,
+            'total': self.totals().metrics(),
+            'windows': [
+                {'start': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(start)), **window.metrics()}
+                for start, window in self.windows.items()
+            ]
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental metrics over the evaluation log")
+    parser.add_argument('log', help="Log base path, as passed to EvaluationLogger / --evaluation-log")
+    parser.add_argument('--checkpoint', help="Where to keep offsets and counters (default: <log>.analytics.json)")
+    parser.add_argument('--window', type=int, default=3600, help="Window length in seconds")
+    parser.add_argument('--follow', type=float, metavar='SECONDS', help="Keep tailing the log, polling this often")
+    args = parser.parse_args()
+
+    analytics = LogAnalytics(args.log, args.checkpoint or f"{args.log}.analytics.json", args.window)
+    while True:
+        started = time.perf_counter()
+        new = analytics.process()
+        elapsed = time.perf_counter() - started
+        print(json.dumps(analytics.report(), indent=2))
+        print(f"{new} new records in {elapsed:.2f}s", file=sys.stderr)
+        if args.follow is None:
+            return
+        time.sleep(args.follow)
+
+
+if __name__ == "__main__":
+    main()
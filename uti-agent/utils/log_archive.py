@@ -0,0 +1,355 @@
+"""
+Columnar archive of closed evaluation log segments.
+
+Compaction turns <base>.NNNNNN.jsonl into <base>.NNNNNN.col: the segment's
+records split into three tables (turns, decisions, other), stored column by
+column in row groups. Each column chunk is zlib-compressed and carries
+min/max statistics in the footer, so readers decode only the columns they
+ask for, in the row groups whose statistics can match the filter.
+
+Decisions are stored as typed columns: the PatientTable inputs (symptom and
+history flags, age, sex, allergy and recurrence columns, evaluated as of
+the decision time), the batch engine's decision codes, and the logged text.
+Every row keeps `source_offset`, its byte offset in the original segment,
+so readers that checkpoint JSONL offsets can switch to the archive.
+
+File layout:
+
+    MAGIC | column chunks ... | footer JSON | u32 footer length | MAGIC
+
+    python -m utils.log_archive compact uti_agent_sessions [--delete]
+    python -m utils.log_archive info uti_agent_sessions.000001.col
+"""
+import argparse
+import json
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from models.patient_data import PatientData
+from core.batch_engine import PatientTable, encode_decision
+from utils.logger import iter_complete_lines, segment_indexes, segment_path
+
+MAGIC = b'UTICOL1\n'
+ARCHIVE_FORMAT_VERSION = 1
+ROW_GROUP_ROWS = 65536
+_U32 = struct.Struct('<I')
+
+TURN_SCHEMA = {
+    'timestamp': 'float64', 'source_offset': 'int64', 'session_id': 'str', 'turn': 'int16',
+    'state': 'category', 'parser': 'category', 'ttft_seconds': 'float32', 'latency_seconds': 'float32',
+    'user_input': 'str', 'response': 'str'
+}
+_TABLE_DTYPES = {np.dtype(np.bool_): 'bool', np.dtype(np.int8): 'int8', np.dtype(np.int16): 'int16'}
+DECISION_SCHEMA = {
+    'timestamp': 'float64', 'source_offset': 'int64', 'session_id': 'str', 'turn': 'int16',
+    'guideline_version': 'category', 'status': 'category', 'medication': 'category', 'referral_reason': 'category',
+    'status_code': 'int8', 'referral_code': 'int8', 'complication_mask': 'int8', 'treatment_code': 'int8',
+    # Filled in from PatientTable.from_patients, so the dtypes match what the batch engine expects
+    **{name: None for name in PatientTable.column_names()},
+    'patient_data': 'str'
+}
+OTHER_SCHEMA = {'timestamp': 'float64', 'source_offset': 'int64', 'session_type': 'category', 'record': 'str'}
+
+
+def archive_path(base_path: str, index: int) -> str:
+    return f"{base_path}.{index:06d}.col"
+
+
+def archived_segments(base_path: str) -> Dict[str, str]:
+    """JSONL segment file name -> archive path, for every archived segment, oldest first"""
+    indexes = sorted(set(segment_indexes(base_path)))
+    return {
+        os.path.basename(segment_path(base_path, i)): archive_path(base_path, i)
+        for i in indexes if os.path.exists(archive_path(base_path, i))
+    }
+
+
+def _numeric_stats(values: np.ndarray) -> Tuple[Any, Any]:
+    if values.dtype.kind == 'f':
+        finite = values[~np.isnan(values)]
+        return (float(finite.min()), float(finite.max())) if len(finite) else (None, None)
+    return values.min().item(), values.max().item()
+
+
+def _encode_chunk(dtype: str, values) -> Tuple[bytes, Dict[str, Any]]:
+    """Compressed bytes and footer metadata for one column of one row group"""
+    if dtype == 'str':
+        data = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(data) + 1, dtype=np.uint32)
+        np.cumsum([len(value) for value in data], out=offsets[1:])
+        return zlib.compress(offsets.tobytes() + b''.join(data)), {}
+    if dtype == 'category':
+        dictionary = list(dict.fromkeys(values))
+        lookup = {value: code for code, value in enumerate(dictionary)}
+        codes = np.fromiter((lookup[value] for value in values), dtype=np.int32, count=len(values))
+        return zlib.compress(codes.tobytes()), {'dictionary': dictionary}
+    array = np.asarray(values, dtype=dtype)
+    low, high = _numeric_stats(array)
+    return zlib.compress(array.tobytes()), {'min': low, 'max': high}
+
+
+def _decode_chunk(dtype: str, data: bytes, rows: int, meta: Dict[str, Any]) -> np.ndarray:
+    raw = zlib.decompress(data)
+    if dtype == 'str':
+        offsets = np.frombuffer(raw, dtype=np.uint32, count=rows + 1)
+        blob = raw[offsets.nbytes:]
+        values = np.empty(rows, dtype=object)
+        for i in range(rows):
+            values[i] = blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+        return values
+    if dtype == 'category':
+        codes = np.frombuffer(raw, dtype=np.int32, count=rows)
+        dictionary = np.empty(len(meta['dictionary']), dtype=object)
+        dictionary[:] = meta['dictionary']
+        return dictionary[codes]
+    return np.frombuffer(raw, dtype=dtype, count=rows)
+
+
+def write_archive(path: str, tables: Dict[str, Tuple[Dict[str, str], Dict[str, Sequence]]],
+                  metadata: Dict[str, Any], row_group_rows: int = ROW_GROUP_ROWS):
+    """Write {table: (schema, columns)} to path; columns hold one equal-length sequence per schema entry"""
+    footer = {'version': ARCHIVE_FORMAT_VERSION, **metadata, 'tables': {}}
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC)
+        for table, (schema, columns) in tables.items():
+            rows = len(next(iter(columns.values()))) if columns else 0
+            groups = []
+            for start in range(0, rows, row_group_rows):
+                chunks = {}
+                for name, dtype in schema.items():
+                    data, meta = _encode_chunk(dtype, columns[name][start:start + row_group_rows])
+                    chunks[name] = {'offset': f.tell(), 'length': len(data), **meta}
+                    f.write(data)
+                groups.append({'rows': min(row_group_rows, rows - start), 'chunks': chunks})
+            footer['tables'][table] = {'schema': schema, 'rows': rows, 'row_groups': groups}
+        encoded = json.dumps(footer).encode('utf-8')
+        f.write(encoded)
+        f.write(_U32.pack(len(encoded)))
+        f.write(MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+_OPERATORS = {
+    '==': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal
+}
+
+
+def _may_match(meta: Dict[str, Any], op: str, value) -> bool:
+    """Whether a row group with these chunk statistics can hold a matching row"""
+    if 'dictionary' in meta:
+        return op != '==' or value in meta['dictionary']
+    low, high = meta.get('min'), meta.get('max')
+    if 'min' not in meta:
+        # Text columns have no statistics; only a scan can tell
+        return True
+    if low is None:
+        # All NaN, which compares unequal to everything
+        return op == '!='
+    if op == '==':
+        return low <= value <= high
+    if op == '<':
+        return low < value
+    if op == '<=':
+        return low <= value
+    if op == '>':
+        return high > value
+    if op == '>=':
+        return high >= value
+    return not (low == high == value)
+
+
+class ArchiveReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a log archive")
+            f.seek(-(len(MAGIC) + _U32.size), os.SEEK_END)
+            length, = _U32.unpack(f.read(_U32.size))
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is truncated")
+            f.seek(-(len(MAGIC) + _U32.size + length), os.SEEK_END)
+            self.footer = json.loads(f.read(length))
+        if self.footer['version'] != ARCHIVE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported archive format version {self.footer['version']}")
+
+    @property
+    def source(self) -> Dict[str, Any]:
+        return self.footer['source']
+
+    def rows(self, table: str) -> int:
+        return self.footer['tables'][table]['rows']
+
+    def scan(self, table: str, columns: Optional[Iterable[str]] = None,
+             where: Sequence[Tuple[str, str, Any]] = ()) -> Iterator[Dict[str, np.ndarray]]:
+        """Yield the requested columns one row group at a time, keeping only rows that satisfy every
+        (column, operator, value) condition; row groups whose statistics rule out a match are never read"""
+        info = self.footer['tables'][table]
+        schema = info['schema']
+        names = list(schema) if columns is None else list(columns)
+        needed = list(dict.fromkeys(names + [column for column, _, _ in where]))
+        for name in needed:
+            if name not in schema:
+                raise KeyError(f"No column {name!r} in table {table!r}")
+        with open(self.path, 'rb') as f:
+            for group in info['row_groups']:
+                chunks = group['chunks']
+                if not all(_may_match(chunks[column], op, value) for column, op, value in where):
+                    continue
+                values = {}
+                for name in needed:
+                    f.seek(chunks[name]['offset'])
+                    values[name] = _decode_chunk(schema[name], f.read(chunks[name]['length']), group['rows'], chunks[name])
+                if where:
+                    keep = np.ones(group['rows'], dtype=bool)
+                    for column, op, value in where:
+                        keep &= _OPERATORS[op](values[column], value)
+                    values = {name: column[keep] for name, column in values.items()}
+                yield {name: values[name] for name in names}
+
+    def read(self, table: str, columns: Optional[Iterable[str]] = None,
+             where: Sequence[Tuple[str, str, Any]] = ()) -> Dict[str, np.ndarray]:
+        """scan() concatenated into one array per column"""
+        schema = self.footer['tables'][table]['schema']
+        names = list(schema) if columns is None else list(columns)
+        parts = list(self.scan(table, names, where))
+        return {
+            name: np.concatenate([part[name] for part in parts]) if parts else _empty(schema[name])
+            for name in names
+        }
+
+
+def _empty(dtype: str) -> np.ndarray:
+    return np.empty(0, dtype=object if dtype in ('str', 'category') else dtype)
+
+
+DECISION_FIELDS = ('session_id', 'turn', 'guideline_version', 'status', 'medication', 'referral_reason')
+
+
+def decision_records(reader: ArchiveReader, where: Sequence[Tuple[str, str, Any]] = ()) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(source offset, record) for archived decisions, in the shape EvaluationLogger wrote them"""
+    columns = ('timestamp', 'source_offset', *DECISION_FIELDS, 'patient_data')
+    for part in reader.scan('decisions', columns, where):
+        for row in zip(*(part[name] for name in columns)):
+            values = dict(zip(columns, row))
+            data = {name: values[name] for name in DECISION_FIELDS}
+            data['turn'] = int(data['turn'])
+            data['patient_data'] = json.loads(values['patient_data'])
+            yield int(values['source_offset']), {
+                'timestamp': float(values['timestamp']), 'session_type': 'clinical_decision', 'data': data
+            }
+
+
+def compact_segment(source: str, destination: str, row_group_rows: int = ROW_GROUP_ROWS) -> Dict[str, int]:
+    """Archive one JSONL segment; returns the number of rows per table"""
+    turns = {name: [] for name in TURN_SCHEMA}
+    decisions = {name: [] for name in DECISION_SCHEMA if name not in PatientTable.column_names()}
+    other = {name: [] for name in OTHER_SCHEMA}
+    patients, decided_at = [], []
+    malformed = []
+    end = 0
+
+    for offset, line in iter_complete_lines(source):
+        end = offset + len(line) + 1
+        try:
+            record = json.loads(line)
+            timestamp, session_type, data = record['timestamp'], record['session_type'], record['data']
+        except (ValueError, KeyError, TypeError):
+            malformed.append(offset)
+            continue
+        if session_type == 'conversation':
+            values = {
+                'timestamp': timestamp, 'source_offset': offset, 'session_id': data.get('session_id') or '',
+                'turn': data.get('turn') or 0, 'state': data.get('state'), 'parser': data.get('parser'),
+                'ttft_seconds': _float(data.get('ttft_seconds')), 'latency_seconds': _float(data.get('latency_seconds')),
+                'user_input': data.get('user_input') or '', 'response': data.get('response') or ''
+            }
+            target = turns
+        elif session_type == 'clinical_decision':
+            status, medication, reason = data.get('status'), data.get('medication'), data.get('referral_reason')
+            codes = encode_decision(status, reason, medication)
+            patient = data.get('patient_data') or {}
+            values = {
+                'timestamp': timestamp, 'source_offset': offset, 'session_id': data.get('session_id') or '',
+                'turn': data.get('turn') or 0, 'guideline_version': data.get('guideline_version'),
+                'status': status, 'medication': medication, 'referral_reason': reason,
+                **dict(zip(('status_code', 'referral_code', 'complication_mask', 'treatment_code'), codes)),
+                'patient_data': json.dumps(patient)
+            }
+            patients.append(PatientData.from_dict(patient))
+            decided_at.append(datetime.fromtimestamp(timestamp))
+            target = decisions
+        else:
+            values = {'timestamp': timestamp, 'source_offset': offset, 'session_type': session_type,
+                      'record': line.decode('utf-8')}
+            target = other
+        for name, value in values.items():
+            target[name].append(value)
+
+    # Recurrence columns are evaluated as of each decision, so re-running them reproduces the original inputs
+    table = PatientTable.from_patients(patients, now=decided_at)
+    schema = dict(DECISION_SCHEMA)
+    for name in PatientTable.column_names():
+        decisions[name] = getattr(table, name)
+        schema[name] = _TABLE_DTYPES[decisions[name].dtype]
+
+    write_archive(destination, {
+        'turns': (TURN_SCHEMA, turns),
+        'decisions': (schema, decisions),
+        'other': (OTHER_SCHEMA, other)
+    }, {'source': {'segment': os.path.basename(source), 'bytes': end, 'malformed_offsets': malformed}}, row_group_rows)
+    return {'turns': len(turns['timestamp']), 'decisions': len(decided_at), 'other': len(other['timestamp'])}
+
+
+def _float(value) -> float:
+    return float('nan') if value is None else float(value)
+
+
+def closed_segments(base_path: str) -> List[int]:
+    """Indexes of segments no writer appends to any more: every one but the newest"""
+    indexes = sorted(set(segment_indexes(base_path)))
+    return indexes[:-1]
+
+
+def compact(base_path: str, delete: bool = False, row_group_rows: int = ROW_GROUP_ROWS) -> List[str]:
+    """Archive every closed segment that has no archive yet; returns the archives written"""
+    written = []
+    for index in closed_segments(base_path):
+        source, destination = segment_path(base_path, index), archive_path(base_path, index)
+        if os.path.exists(source) and not os.path.exists(destination):
+            compact_segment(source, destination, row_group_rows)
+            written.append(destination)
+        if delete and os.path.exists(source) and os.path.exists(destination):
+            os.remove(source)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar archives of the evaluation log")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    compact_parser = subcommands.add_parser('compact', help="Archive closed log segments")
+    compact_parser.add_argument('log', help="Log base path, as passed to EvaluationLogger / --evaluation-log")
+    compact_parser.add_argument('--delete', action='store_true', help="Remove each JSONL segment once archived")
+    info_parser = subcommands.add_parser('info', help="Show an archive's tables and row groups")
+    info_parser.add_argument('archive')
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        for path in compact(args.log, args.delete):
+            print(f"{path}: {os.path.getsize(path)} bytes")
+        return
+
+    reader = ArchiveReader(args.archive)
+    print(f"source {reader.source}")
+    for table, info in reader.footer['tables'].items():
+        print(f"{table}: {info['rows']} rows in {len(info['row_groups'])} row groups, {len(info['schema'])} columns")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,250 @@
+import atexit
 import json
-import logging
-from datetime import datetime
-from typing import Dict, Any
+import mmap
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+# Segments are read in chunks of about this size, so memory stays flat on large segments
+CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class BatchedJSONLWriter:
+    """Appends records to rotating JSONL segments from a background thread.
+
+    write() only appends the record to a bounded in-memory queue; JSON encoding
+    and file I/O happen on the writer thread, one batch at a time. Segments are
+    named <base>.000001.jsonl, <base>.000002.jsonl, ... and each process starts
+    a new one, so a finished segment is never appended to again.
+
+    When the queue is full, `overflow` decides what happens: 'drop_newest'
+    discards the incoming record, 'drop_oldest' discards the oldest queued
+    one, and 'block' waits up to `block_timeout` seconds for room before
+    dropping. Dropped records are counted in `dropped`.
+    """
+    def __init__(self, base_path: str, max_queue: int = 10_000, batch_size: int = 256,
+                 flush_interval: float = 0.2, max_segment_bytes: int = 64 * 1024 * 1024,
+                 overflow: str = 'drop_newest', block_timeout: float = 0.05):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self.base_path = base_path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.written = 0
+        self.dropped = 0
+
+        self._queue: deque = deque()
+        self._wakeup = threading.Event()
+        self._room = threading.Condition()
+        self._flushed = threading.Condition()
+        self._enqueued = 0
+        self._processed = 0
+        self._closed = False
+
+        directory = os.path.dirname(os.path.abspath(base_path))
+        os.makedirs(directory, exist_ok=True)
+        self._segment_index = max(segment_indexes(base_path), default=0)
+        self._file = None
+        self._segment_bytes = 0
+        self._open_next_segment()
+
+        self._thread = threading.Thread(target=self._run, name="uti-agent-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def segment_path(self) -> str:
+        return segment_path(self.base_path, self._segment_index)
+
+    def write(self, record: Dict[str, Any]) -> bool:
+        """Queue a record; returns False if it was dropped. The record must not be mutated afterwards"""
+        if self._closed:
+            self.dropped += 1
+            return False
+        if len(self._queue) >= self.max_queue and not self._make_room():
+            self.dropped += 1
+            return False
+        self._queue.append(record)
+        self._enqueued += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _make_room(self) -> bool:
+        if self.overflow == 'drop_oldest':
+            try:
+                self._queue.popleft()
+            except IndexError:
+                return True
+            self.dropped += 1
+            self._processed += 1
+            return True
+        if self.overflow == 'block':
+            self._wakeup.set()
+            with self._room:
+                return self._room.wait_for(lambda: len(self._queue) < self.max_queue, self.block_timeout)
+        return False
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+            if self._closed and not self._queue:
+                return
+
+    def _drain(self):
+        while self._queue:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+            except IndexError:
+                pass
+            with self._room:
+                self._room.notify_all()
+            self._write_batch(batch)
+        with self._flushed:
+            self._flushed.notify_all()
+
+    def _write_batch(self, batch):
+        data = "".join(json.dumps(record, default=str) + "\n" for record in batch).encode('utf-8')
+        if self._segment_bytes and self._segment_bytes + len(data) > self.max_segment_bytes:
+            self._open_next_segment()
+        self._file.write(data)
+        self._file.flush()
+        self._segment_bytes += len(data)
+        self.written += len(batch)
+        self._processed += len(batch)
+
+    def _open_next_segment(self):
+        if self._file is not None:
+            self._file.close()
+        self._segment_index += 1
+        self._file = open(self.segment_path, 'ab')
+        self._segment_bytes = 0
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything queued so far is written"""
+        target = self._enqueued
+        self._wakeup.set()
+        with self._flushed:
+            self._flushed.wait_for(lambda: self._processed >= target or not self._thread.is_alive(), timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self._file.close()
+        atexit.unregister(self.close)
+        _forget_writer(self)
+
+
+def segment_path(base_path: str, index: int) -> str:
+    return f"{base_path}.{index:06d}.jsonl"
+
+
+def segment_indexes(base_path: str):
+    """Indexes of the existing segments for base_path, in no particular order"""
+    directory = os.path.dirname(os.path.abspath(base_path))
+    # Archived segments (utils.log_archive) keep their number, so it is never reused
+    pattern = re.compile(re.escape(os.path.basename(base_path)) + r'\.(\d{6})\.(?:jsonl|col)$')
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            yield int(match.group(1))
+
+
+def log_segments(base_path: str) -> Dict[str, str]:
+    """JSONL segment file name -> path, oldest first"""
+    paths = [segment_path(base_path, i) for i in sorted(set(segment_indexes(base_path)))]
+    return {os.path.basename(path): path for path in paths if os.path.exists(path)}
+
+
+def iter_complete_lines(path: str, offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """(byte offset, line) for each complete line from offset on; a partly written last line is left for next time"""
+    size = os.path.getsize(path)
+    if size <= offset:
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+        while offset < size:
+            limit = min(offset + CHUNK_BYTES, size)
+            end = data.rfind(b'\n', offset, limit) + 1
+            if end == 0:
+                # A single line longer than a chunk
+                end = data.find(b'\n', limit, size) + 1
+                if end == 0:
+                    return
+            for line in data[offset:end - 1].split(b'\n'):
+                yield offset, line
+                offset += len(line) + 1
+
+
+_writers: Dict[str, BatchedJSONLWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(base_path: str, **options) -> BatchedJSONLWriter:
+    """The process-wide writer for base_path, created on first use"""
+    key = os.path.abspath(base_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = BatchedJSONLWriter(base_path, **options)
+        return writer
+
+
+def _forget_writer(writer: BatchedJSONLWriter):
+    with _writers_lock:
+        key = os.path.abspath(writer.base_path)
+        if _writers.get(key) is writer:
+            del _writers[key]
 
 
 class EvaluationLogger:
-    def __init__(self, log_file: str = "uti_agent_sessions.log"):
+    """Conversation, decision and outcome records, written as JSONL segments off the request path"""
+    def __init__(self, log_file: str = "uti_agent_sessions", **writer_options):
+        # Instances for the same file share one writer, so every record is written exactly once
         self.log_file = log_file
-        self.logger = logging.getLogger('uti_agent')
-        self.logger.setLevel(logging.INFO)
-        
-        # Create file handler
-        handler = logging.FileHandler(log_file)
-        formatter = logging.Formatter('%(asctime)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-    
-    def log_conversation(self, session_data: Dict[str, Any]):
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'session_type': 'conversation',
-            'data': session_data
-        }
-        self.logger.info(json.dumps(log_entry))
-    
-    def log_clinical_decision(self, decision_rationale: Dict[str, Any]):
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'session_type': 'clinical_decision',
-            'data': decision_rationale
-        }
-        self.logger.info(json.dumps(log_entry))
-    
-    def log_treatment_outcome(self, outcome_data: Dict[str, Any]):
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'session_type': 'treatment_outcome',
-            'data': outcome_data
-        }
-        self.logger.info(json.dumps(log_entry))
-    
-    def generate_review_queue(self) -> list:
-        # Placeholder for generating cases that need review
-        return []
\ No newline at end of file
+        self.writer = get_writer(log_file, **writer_options)
+
+    def _log(self, session_type: str, data: Dict[str, Any]) -> bool:
+        return self.writer.write({'timestamp': time.time(), 'session_type': session_type, 'data': data})
+
+    def log_conversation(self, session_data: Dict[str, Any]) -> bool:
+        return self._log('conversation', session_data)
+
+    def log_clinical_decision(self, decision_rationale: Dict[str, Any]) -> bool:
+        return self._log('clinical_decision', decision_rationale)
+
+    def log_treatment_outcome(self, outcome_data: Dict[str, Any]) -> bool:
+        return self._log('treatment_outcome', outcome_data)
+
+    def log_llm_usage(self, usage: Dict[str, Any]) -> bool:
+        return self._log('llm_usage', usage)
+
+    def flush(self):
+        self.writer.flush()
+
+    def generate_review_queue(self, fraction: float = 0.05, since: Optional[float] = None,
+                              until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Cases for clinical review: flagged complex cases first, then a stratified sample (see utils.review_queue)"""
+        from utils.review_queue import ReviewIndex
+        self.flush()
+        index = ReviewIndex(f"{self.log_file}.review.db", self.log_file)
+        try:
+            index.refresh()
+            return [case.to_dict() for case in index.review_queue(fraction, since, until)]
+        finally:
+            index.close()
+
@@ -0,0 +1,285 @@
+"""
+Clinical review queue over the decisions in the evaluation log.
+
+ReviewIndex keeps a SQLite index with one row per logged decision. Each row
+holds the session id, time, status, referral reason, review flags and a
+priority, plus the segment and byte offset of the full record. The index is
+updated incrementally, from the offset each segment was last read to, so
+building a queue never rereads or holds the whole log. Segments compacted
+by utils.log_archive are read from their archive.
+
+A queue for a period is:
+- the highest-priority flagged cases, read in priority order from an index
+- topped up with a stratified random sample, so each decision type
+  (status and outcome) is represented
+
+The sample is deterministic: each case has a fixed hash-derived sample key,
+so the same period always yields the same cases.
+
+    python -m utils.review_queue uti_agent_sessions [--days 7] [--fraction 0.05]
+"""
+import argparse
+import hashlib
+import json
+import math
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List, Optional
+from utils.logger import iter_complete_lines, log_segments
+from utils.log_archive import ArchiveReader, archived_segments, decision_records
+
+DECISION_MARKER = b'"session_type": "clinical_decision"'
+
+
+def _systemic(patient):
+    symptoms = patient.get('symptoms', {})
+    return any(symptoms.get(name) for name in ('fever', 'rigors', 'flank_pain', 'back_pain', 'nausea', 'vomiting'))
+
+
+def _age(patient):
+    return patient.get('demographics', {}).get('age') or 0
+
+
+# (flag, priority weight, test on the decision record and its patient data), most urgent first.
+# Weights are a starting point for the clinical reviewers to tune.
+REVIEW_FLAGS = [
+    ('eligible_without_plan', 8, lambda d, p: d.get('status') == 'eligible' and not d.get('medication')),
+    ('incomplete_data', 4, lambda d, p: d.get('status') == 'incomplete_data'),
+    ('multiple_complications', 4, lambda d, p: ', ' in (d.get('referral_reason') or '').partition('due to:')[2]),
+    ('systemic_symptoms', 3, lambda d, p: _systemic(p)),
+    ('pregnancy', 3, lambda d, p: bool(p.get('demographics', {}).get('pregnancy_status'))),
+    ('immunocompromised', 2, lambda d, p: bool(p.get('history', {}).get('immunocompromised'))),
+    ('age_extreme', 2, lambda d, p: 0 < _age(p) < 12 or _age(p) >= 65),
+    ('allergy_adjusted', 2, lambda d, p: d.get('status') == 'eligible' and bool(p.get('history', {}).get('allergies'))),
+    ('prior_utis', 1, lambda d, p: bool(p.get('history', {}).get('previous_utis'))),
+    ('referral', 1, lambda d, p: d.get('status') == 'requires_referral'),
+]
+FLAG_BITS = {name: 1 << i for i, (name, _, _) in enumerate(REVIEW_FLAGS)}
+MAX_PRIORITY = sum(weight for _, weight, _ in REVIEW_FLAGS)
+
+
+def review_flags(decision: Dict[str, Any]) -> int:
+    patient = decision.get('patient_data') or {}
+    flags = 0
+    for name, _, test in REVIEW_FLAGS:
+        if test(decision, patient):
+            flags |= FLAG_BITS[name]
+    return flags
+
+
+def flag_priority(flags: int) -> int:
+    return sum(weight for name, weight, _ in REVIEW_FLAGS if flags & FLAG_BITS[name])
+
+
+def flag_names(flags: int) -> List[str]:
+    return [name for name, _, _ in REVIEW_FLAGS if flags & FLAG_BITS[name]]
+
+
+def sample_key(session_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(session_id.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+@dataclass
+class ReviewCase:
+    session_id: str
+    decided_at: float
+    status: str
+    referral_reason: Optional[str]
+    medication: Optional[str]
+    guideline_version: Optional[str]
+    flags: int
+    priority: int
+    segment: str
+    offset: int
+    # 'flagged' or 'sampled'
+    selection: str = 'flagged'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'flags': flag_names(self.flags)}
+
+
+CASE_COLUMNS = "session_id, decided_at, status, referral_reason, medication, guideline_version, flags, priority, segment, offset"
+
+
+class ReviewIndex:
+    def __init__(self, path: str, log_path: str):
+        self.path = path
+        self.log_path = log_path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS cases ("
+            "session_id TEXT PRIMARY KEY, decided_at REAL NOT NULL, status TEXT NOT NULL, referral_reason TEXT, "
+            "medication TEXT, guideline_version TEXT, flags INTEGER NOT NULL, priority INTEGER NOT NULL, "
+            "stratum TEXT NOT NULL, sample_key INTEGER NOT NULL, segment TEXT NOT NULL, offset INTEGER NOT NULL, "
+            "reviewed_at REAL);"
+            # The trailing columns let the window filters run on the index alone
+            "CREATE INDEX IF NOT EXISTS cases_by_time ON cases (decided_at, reviewed_at, stratum);"
+            "CREATE INDEX IF NOT EXISTS cases_by_priority ON cases (priority, decided_at, reviewed_at);"
+            "CREATE INDEX IF NOT EXISTS cases_by_stratum ON cases (stratum, sample_key, decided_at, reviewed_at);"
+            "CREATE INDEX IF NOT EXISTS cases_by_status ON cases (status, decided_at);"
+            "CREATE INDEX IF NOT EXISTS cases_by_reason ON cases (referral_reason, decided_at);"
+            "CREATE TABLE IF NOT EXISTS offsets (segment TEXT PRIMARY KEY, offset INTEGER NOT NULL);"
+        )
+
+    def close(self):
+        self._conn.close()
+
+    def refresh(self) -> int:
+        """Index decisions appended to the log since the last refresh; returns how many were added"""
+        offsets = dict(self._conn.execute("SELECT segment, offset FROM offsets"))
+        segments = log_segments(self.log_path)
+        archives = archived_segments(self.log_path)
+        added = 0
+        for name in sorted(set(segments) | set(archives)):
+            offset = offsets.get(name, 0)
+            rows = []
+            if name in archives:
+                reader = ArchiveReader(archives[name])
+                for start, record in decision_records(reader, where=[('source_offset', '>=', offset)]):
+                    rows.append(self._case_row(record, name, start))
+                offset = max(offset, reader.source['bytes'])
+            else:
+                for start, line in iter_complete_lines(segments[name], offset):
+                    offset = start + len(line) + 1
+                    # Most lines are conversation turns; skip them without parsing
+                    if DECISION_MARKER in line:
+                        row = self._row(line, name, start)
+                        if row is not None:
+                            rows.append(row)
+            if offset == offsets.get(name, 0):
+                continue
+            # Rows and the new offset commit together, so a crash never indexes a record twice or skips one
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO cases ({CASE_COLUMNS}, stratum, sample_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute("INSERT OR REPLACE INTO offsets (segment, offset) VALUES (?, ?)", (name, offset))
+            self._conn.execute("COMMIT")
+            added += len(rows)
+        return added
+
+    @staticmethod
+    def _row(line: bytes, segment: str, offset: int):
+        try:
+            return ReviewIndex._case_row(json.loads(line), segment, offset)
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def _case_row(record: Dict[str, Any], segment: str, offset: int):
+        decision = record['data']
+        session_id = decision['session_id']
+        flags = review_flags(decision)
+        status = decision.get('status') or 'unknown'
+        # Strata separate outcomes: each drug, and each kind of referral
+        outcome = decision.get('medication') or (decision.get('referral_reason') or '').partition(':')[0]
+        return (session_id, record['timestamp'], status, decision.get('referral_reason'), decision.get('medication'),
+                decision.get('guideline_version'), flags, flag_priority(flags), segment, offset,
+                f"{status}|{outcome}", sample_key(session_id))
+
+    def _window(self, since: Optional[float], until: Optional[float], include_reviewed: bool):
+        clauses, params = ["decided_at >= ?", "decided_at < ?"], [since or 0.0, until or math.inf]
+        if not include_reviewed:
+            clauses.append("reviewed_at IS NULL")
+        return " AND ".join(clauses), params
+
+    def count(self, since: Optional[float] = None, until: Optional[float] = None, include_reviewed: bool = False) -> int:
+        where, params = self._window(since, until, include_reviewed)
+        return self._conn.execute(f"SELECT COUNT(*) FROM cases WHERE {where}", params).fetchone()[0]
+
+    def top(self, k: int, since: Optional[float] = None, until: Optional[float] = None,
+            status: Optional[str] = None, include_reviewed: bool = False) -> List[ReviewCase]:
+        """The k highest-priority flagged cases, most urgent first (latest first among equals)"""
+        where, params = self._window(since, until, include_reviewed)
+        if status is not None:
+            where += " AND status = ?"
+            params.append(status)
+        # Priorities are small integers, so walking the (priority, decided_at) index level by level
+        # yields cases already in heap order and reads about k rows however long the log is
+        cases = []
+        for priority in range(MAX_PRIORITY, 0, -1):
+            if len(cases) >= k:
+                break
+            rows = self._conn.execute(
+                f"SELECT {CASE_COLUMNS} FROM cases INDEXED BY cases_by_priority WHERE priority = ? AND {where} "
+                "ORDER BY decided_at DESC LIMIT ?",
+                [priority, *params, k - len(cases)]
+            )
+            cases.extend(ReviewCase(*row) for row in rows)
+        return cases
+
+    def sample(self, fraction: float, since: Optional[float] = None, until: Optional[float] = None,
+               exclude: Iterable[str] = (), include_reviewed: bool = False) -> List[ReviewCase]:
+        """About `fraction` of the period's cases, drawn from every stratum in proportion (at least one each)"""
+        where, params = self._window(since, until, include_reviewed)
+        excluded = set(exclude)
+        strata = self._conn.execute(f"SELECT stratum, COUNT(*) FROM cases WHERE {where} GROUP BY stratum", params).fetchall()
+        cases = []
+        for stratum, size in strata:
+            wanted = max(1, round(size * fraction))
+            # Walks the (stratum, sample_key) index and stops as soon as enough cases match
+            rows = self._conn.execute(
+                f"SELECT {CASE_COLUMNS} FROM cases WHERE stratum = ? AND {where} ORDER BY sample_key", [stratum, *params]
+            )
+            picked = 0
+            for row in rows:
+                if picked == wanted:
+                    break
+                if row[0] not in excluded:
+                    cases.append(ReviewCase(*row, selection='sampled'))
+                    picked += 1
+        return cases
+
+    def review_queue(self, fraction: float = 0.05, since: Optional[float] = None, until: Optional[float] = None,
+                     flagged_share: float = 0.5) -> List[ReviewCase]:
+        """Flagged cases first, up to `flagged_share` of the quota, then a stratified sample of the rest"""
+        total = self.count(since, until)
+        quota = math.ceil(total * fraction)
+        flagged = self.top(math.ceil(quota * flagged_share), since, until)
+        remaining = quota - len(flagged)
+        if remaining <= 0:
+            return flagged
+        return flagged + self.sample(remaining / total, since, until, exclude=[c.session_id for c in flagged])
+
+    def mark_reviewed(self, session_id: str, reviewed_at: Optional[float] = None):
+        self._conn.execute("UPDATE cases SET reviewed_at = ? WHERE session_id = ?", (reviewed_at or time.time(), session_id))
+
+    def load_record(self, case: ReviewCase) -> Dict[str, Any]:
+        """The full logged decision, read from its segment or the segment's archive"""
+        path = log_segments(self.log_path).get(case.segment)
+        if path is None:
+            reader = ArchiveReader(archived_segments(self.log_path)[case.segment])
+            _, record = next(decision_records(reader, where=[('source_offset', '==', case.offset)]))
+            return record
+        with open(path, 'rb') as f:
+            f.seek(case.offset)
+            return json.loads(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the clinical review queue from the evaluation log")
+    parser.add_argument('log', help="Log base path, as passed to EvaluationLogger / --evaluation-log")
+    parser.add_argument('--index', help="Index database (default: <log>.review.db)")
+    parser.add_argument('--days', type=float, default=7, help="Review decisions from the last N days")
+    parser.add_argument('--fraction', type=float, default=0.05, help="Share of cases to review")
+    args = parser.parse_args()
+
+    index = ReviewIndex(args.index or f"{args.log}.review.db", args.log)
+    started = time.perf_counter()
+    added = index.refresh()
+    until = time.time()
+    queue = index.review_queue(args.fraction, since=until - args.days * 86400, until=until)
+    elapsed = time.perf_counter() - started
+    for case in queue:
+        print(json.dumps(case.to_dict()))
+    print(f"{len(queue)} cases ({added} newly indexed) in {elapsed:.2f}s", file=sys.stderr)
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
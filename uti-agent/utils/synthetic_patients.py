@@ -0,0 +1,39 @@
+"""
+Seeded random patient records for tests and benchmarks.
+
+The population is skewed so that every branch of the eligibility logic is
+exercised: core symptoms are common, complications are rare, and UTI dates
+sit well inside or outside each recurrence window so results never hinge on
+the exact time the generator is run.
+"""
+import random
+from datetime import datetime, timedelta
+from models.patient_data import PatientData, SymptomData, DemographicData, HistoryData, UTIHistory
+
+SYMPTOM_FLAGS = ['dysuria', 'urgency', 'frequency', 'suprapubic_pain', 'hematuria',
+                 'fever', 'rigors', 'flank_pain', 'back_pain', 'nausea', 'vomiting']
+HISTORY_FLAGS = ['immunocompromised', 'abnormal_urinary_function', 'indwelling_catheter',
+                 'neurogenic_bladder', 'renal_stones', 'renal_dysfunction']
+# Offsets stay clear of the 4-week, 6-month and 12-month boundaries
+DAY_OFFSETS = [3, 20, 40, 100, 170, 200, 300, 360, 400]
+
+
+def random_patient(rng: random.Random, now: datetime) -> PatientData:
+    # Complications are rare so that plenty of rows reach the recurrence and drug checks
+    symptoms = SymptomData(**{name: rng.random() < (0.4 if name in SYMPTOM_FLAGS[:5] else 0.03) for name in SYMPTOM_FLAGS})
+    demographics = DemographicData(
+        age=rng.choice([0, 8, 11, 12, 30, 45, 70]) if rng.random() < 0.3 else 30,
+        sex=rng.choice(['female', 'Female', 'female', 'male', '']),
+        pregnancy_status=rng.choice([None, False, True]) if rng.random() < 0.2 else None
+    )
+    utis = []
+    for _ in range(rng.choice([0, 0, 1, 2, 3, 4])):
+        date = now - timedelta(days=rng.choice(DAY_OFFSETS), hours=12)
+        completion = date + timedelta(days=5) if rng.random() < 0.5 else None
+        utis.append(UTIHistory(date=date, treatment='x', resolved=True, treatment_completion_date=completion))
+    history = HistoryData(
+        allergies=rng.sample(['nitrofurantoin', 'Sulfonamides', 'trimethoprim', 'fosfomycin', 'penicillin'], rng.choice([0, 0, 1, 2, 3])),
+        previous_utis=utis,
+        **{name: rng.random() < 0.03 for name in HISTORY_FLAGS}
+    )
+    return PatientData(symptoms=symptoms, demographics=demographics, history=history)
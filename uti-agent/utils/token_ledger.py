@@ -0,0 +1,188 @@
+"""
+Token accounting and budgets for LLM calls.
+
+GeminiClient reports the usage metadata of every response to its
+TokenLedger. Each call is attributed to:
+- the session and conversation state it was made for, read from a context
+  variable that ConversationManager sets at the start of each turn
+- its purpose: the extraction prompt, or the response type
+- the prompt version
+
+The ledger keeps totals per session and per (state, purpose, version). It
+can also append one `llm_usage` record per call to the evaluation log.
+Sessions over `session_budget` tokens, or any session once the process has
+used `process_budget`, fall back to the basic parsers and templated
+responses.
+
+    python -m utils.token_ledger logs/sessions [--by purpose|state|session_id] [--top 20]
+"""
+import argparse
+import json
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, Optional, Tuple
+from utils.logger import EvaluationLogger, iter_complete_lines, log_segments
+
+# USD per million (prompt, output) tokens. Cached prompt tokens are billed as ordinary ones here,
+# so estimates err on the high side.
+MODEL_PRICES = {
+    'gemini-2.5-flash': (0.30, 2.50),
+}
+DEFAULT_PRICES = MODEL_PRICES['gemini-2.5-flash']
+
+# (session id, conversation state) the current LLM call is made for
+_call_context: ContextVar[Tuple[str, str]] = ContextVar('llm_call_context', default=('', ''))
+
+
+def set_call_context(session_id: str, state: str):
+    """Attribute LLM calls from here on, in this context and tasks started from it, to this session and state"""
+    _call_context.set((session_id, state))
+
+
+def call_context() -> Tuple[str, str]:
+    return _call_context.get()
+
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+    def add(self, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0, calls: int = 1):
+        self.calls += calls
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        self.cached_tokens += cached_tokens
+
+    def cost(self, prices: Tuple[float, float] = DEFAULT_PRICES) -> float:
+        return (self.prompt_tokens * prices[0] + self.output_tokens * prices[1]) / 1_000_000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'total_tokens': self.total_tokens}
+
+
+class TokenLedger:
+    def __init__(self, session_budget: Optional[int] = None, process_budget: Optional[int] = None,
+                 evaluation_logger: Optional[EvaluationLogger] = None):
+        self.session_budget = session_budget
+        self.process_budget = process_budget
+        self.evaluation_logger = evaluation_logger
+        self.total = TokenUsage()
+        self.by_session: Dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self.by_prompt: Dict[Tuple[str, str, str], TokenUsage] = defaultdict(TokenUsage)
+        self._lock = threading.Lock()
+
+    def record(self, purpose: str, prompt_version: str, model: str, prompt_tokens: int, output_tokens: int,
+               cached_tokens: int = 0, context: Optional[Tuple[str, str]] = None):
+        """Account for one call; `context` defaults to the caller's (session id, state)"""
+        session_id, state = context or call_context()
+        with self._lock:
+            self.total.add(prompt_tokens, output_tokens, cached_tokens)
+            if session_id:
+                self.by_session[session_id].add(prompt_tokens, output_tokens, cached_tokens)
+            self.by_prompt[(state, purpose, prompt_version)].add(prompt_tokens, output_tokens, cached_tokens)
+        if self.evaluation_logger is not None:
+            self.evaluation_logger.log_llm_usage({
+                'session_id': session_id, 'state': state, 'purpose': purpose, 'prompt_version': prompt_version,
+                'model': model, 'prompt_tokens': prompt_tokens, 'output_tokens': output_tokens,
+                'cached_tokens': cached_tokens
+            })
+
+    def exceeded(self, session_id: str) -> Optional[str]:
+        """'process' or 'session' once that budget is used up, else None"""
+        if self.process_budget is not None and self.total.total_tokens >= self.process_budget:
+            return 'process'
+        if self.session_budget is not None:
+            usage = self.by_session.get(session_id)
+            if usage is not None and usage.total_tokens >= self.session_budget:
+                return 'session'
+        return None
+
+    def session_usage(self, session_id: str) -> TokenUsage:
+        return self.by_session.get(session_id) or TokenUsage()
+
+    def forget(self, session_id: str):
+        """Drop an ended session's totals; the process and per-prompt totals keep its calls"""
+        with self._lock:
+            self.by_session.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            over = sum(1 for usage in self.by_session.values()
+                       if self.session_budget is not None and usage.total_tokens >= self.session_budget)
+            return {
+                **self.total.to_dict(),
+                'estimated_cost_usd': round(self.total.cost(), 4),
+                'session_budget': self.session_budget,
+                'process_budget': self.process_budget,
+                'sessions_over_budget': over
+            }
+
+
+USAGE_MARKER = b'"session_type": "llm_usage"'
+
+
+def usage_records(base_path: str) -> Iterator[Dict[str, Any]]:
+    """The llm_usage records of an evaluation log, from JSONL segments and archives"""
+    from utils.log_archive import ArchiveReader, archived_segments
+    archives = archived_segments(base_path)
+    for path in archives.values():
+        columns = ArchiveReader(path).read('other', ['record'], where=[('session_type', '==', 'llm_usage')])
+        for record in columns['record']:
+            yield json.loads(record)['data']
+    for name, path in log_segments(base_path).items():
+        if name in archives:
+            continue
+        for _, line in iter_complete_lines(path):
+            if USAGE_MARKER in line:
+                try:
+                    yield json.loads(line)['data']
+                except (ValueError, KeyError):
+                    continue
+
+
+def usage_report(base_path: str, by: str = 'purpose') -> Dict[str, TokenUsage]:
+    """Usage grouped by purpose (with prompt version), state or session"""
+    groups: Dict[str, TokenUsage] = defaultdict(TokenUsage)
+    for data in usage_records(base_path):
+        if by == 'purpose':
+            key = f"{data.get('purpose')} (v{data.get('prompt_version')})"
+        else:
+            key = data.get(by) or '-'
+        groups[key].add(data.get('prompt_tokens') or 0, data.get('output_tokens') or 0, data.get('cached_tokens') or 0)
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank the most expensive LLM prompts in the evaluation log")
+    parser.add_argument('log', help="Log base path, as passed to EvaluationLogger / --evaluation-log")
+    parser.add_argument('--by', choices=['purpose', 'state', 'session_id'], default='purpose')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--prices', type=float, nargs=2, default=list(DEFAULT_PRICES), metavar=('PROMPT', 'OUTPUT'),
+                        help="USD per million prompt and output tokens")
+    args = parser.parse_args()
+
+    groups = usage_report(args.log, args.by)
+    ranked = sorted(groups.items(), key=lambda item: item[1].cost(args.prices), reverse=True)
+    total = TokenUsage()
+    for usage in groups.values():
+        total.add(usage.prompt_tokens, usage.output_tokens, usage.cached_tokens, usage.calls)
+    width = max([len(args.by), 5] + [len(key) for key, _ in ranked[:args.top]])
+    print(f"{args.by:{width}s} {'calls':>8s} {'prompt':>10s} {'output':>10s} {'tok/call':>9s} {'USD':>9s} {'share':>6s}")
+    for key, usage in ranked[:args.top]:
+        share = usage.cost(args.prices) / total.cost(args.prices) if total.total_tokens else 0.0
+        print(f"{key:{width}s} {usage.calls:8d} {usage.prompt_tokens:10d} {usage.output_tokens:10d} "
+              f"{usage.total_tokens / usage.calls:9.0f} {usage.cost(args.prices):9.4f} {share:6.1%}")
+    print(f"{'total':{width}s} {total.calls:8d} {total.prompt_tokens:10d} {total.output_tokens:10d} "
+          f"{total.total_tokens / max(total.calls, 1):9.0f} {total.cost(args.prices):9.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Per-stage latency spans and histograms.
+
+ConversationManager opens a span around each stage of a turn: parse,
+transition, eligibility, audit_sync, generate, persist, log, and render in
+the CLI. Spans carry the session id, conversation state and backend. On
+finish, each span feeds a histogram keyed by (stage, state, backend).
+Session ids stay out of the keys so the label set stays small; they are
+kept only on the recent-span buffer. The histograms are exported in
+Prometheus text format (GET /metrics on the server) or dumped to a JSON
+file. A span left by an exception is tagged status='error', or
+status='aborted' when the turn was cancelled or its stream closed early.
+
+A disabled tracer hands out a shared no-op span, so instrumentation costs
+one attribute check and a method call per stage.
+
+    tracer = Tracer()
+    with tracer.span('parse', session_id=..., state='greeting', backend='gemini') as span:
+        ...
+        span.tag(backend='basic')
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds in seconds; a rule lookup takes microseconds, an LLM call seconds
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LABELS = ('stage', 'state', 'backend')
+STAGES = ('parse', 'transition', 'eligibility', 'audit_sync', 'generate', 'persist', 'log', 'render')
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf bucket; cumulated only on export
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[int]:
+        total, counts = 0, []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate by linear interpolation inside the bucket, as Prometheus' histogram_quantile does"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        below = 0
+        for i, count in enumerate(self.counts):
+            if below + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                low = self.buckets[i - 1] if i else 0.0
+                return low + (self.buckets[i] - low) * (rank - below) / count
+            below += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'buckets': list(self.buckets), 'counts': self.counts, 'count': self.count, 'sum': self.sum}
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'tags', 'started')
+
+    def __init__(self, tracer: 'Tracer', name: str, tags: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.started = time.perf_counter()
+
+    def tag(self, **tags):
+        """Add or change tags before the span finishes, e.g. the state a transition ended in"""
+        self.tags.update(tags)
+
+    def finish(self):
+        self.tracer.record(self.name, time.perf_counter() - self.started, **self.tags)
+
+    def __enter__(self) -> 'Span':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            # GeneratorExit and CancelledError mean the caller went away, not that the stage failed
+            self.tags['status'] = 'error' if issubclass(exc_type, Exception) else 'aborted'
+        self.finish()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def tag(self, **tags):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects spans into histograms; `keep_spans` recent spans are also kept individually (None keeps all)"""
+    def __init__(self, enabled: bool = True, buckets: Iterable[float] = DEFAULT_BUCKETS,
+                 keep_spans: Optional[int] = 1000):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self.spans: Deque[Dict[str, Any]] = deque(maxlen=keep_spans)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        """Enabled when UTI_AGENT_TRACING is set to anything but 0"""
+        return cls(enabled=os.getenv('UTI_AGENT_TRACING', '0') not in ('', '0'))
+
+    def span(self, name: str, **tags):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, tags)
+
+    def record(self, name: str, seconds: float, **tags):
+        """Record a stage duration measured elsewhere"""
+        if not self.enabled:
+            return
+        key = (name, str(tags.get('state') or ''), str(tags.get('backend') or ''))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            self.spans.append({'stage': name, 'seconds': seconds, 'at': time.time(), **tags})
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.spans.clear()
+
+    def stage_histogram(self, stage: str) -> Histogram:
+        """All states and backends of one stage merged"""
+        merged = Histogram(self.buckets)
+        with self._lock:
+            for (name, _, _), histogram in self.histograms.items():
+                if name == stage:
+                    merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                    merged.count += histogram.count
+                    merged.sum += histogram.sum
+        return merged
+
+    def prometheus_text(self, metric: str = 'uti_agent_stage_seconds') -> str:
+        lines = [
+            f"# HELP {metric} Time spent in each stage of a conversation turn.",
+            f"# TYPE {metric} histogram"
+        ]
+        with self._lock:
+            items = sorted(self.histograms.items())
+            for key, histogram in items:
+                labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(LABELS, key))
+                for bound, count in zip(self.buckets + (float('inf'),), histogram.cumulative()):
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram.sum!r}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'histograms': [dict(zip(LABELS, key), **histogram.to_dict()) for key, histogram in sorted(self.histograms.items())],
+                'spans': list(self.spans)
+            }
+
+    def dump(self, path: str):
+        """Write the histograms and recent spans as JSON; replaced atomically, so readers never see half a file"""
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, path)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+NULL_TRACER = Tracer(enabled=False)